@@ -0,0 +1,389 @@
+"""
+Ingestão de eventos de detectores -> ControladorSemaforo (sem janela e sem sprites)
+-----------------------------------------------------------------------------------
+Lê eventos de detectores (arquivo, pipe ou socket local), agrega em janelas deslizantes nas entradas
+do controlador (carros esperando por eixo, pedestres esperando e o ambiente) e avança o
+ControladorSemaforo frame a frame no tempo dos eventos. Em modo replay roda mais rápido que o tempo
+real (--velocidade 0 = o mais rápido possível).
+
+Formato dos eventos (uma linha JSON por evento, ou CSV com as mesmas colunas; t em segundos):
+   {"t": 12.5, "tipo": "chegada", "eixo": "v"}              veículo detectado chegando (eixo 'v' ou 'h')
+   {"t": 13.0, "tipo": "fila", "eixo": "h", "valor": 4}     contagem do detector de fila do eixo
+   {"t": 14.2, "tipo": "botao", "faixa": "h_n"}             botão de pedestre (h_n, h_s, v_r, v_l)
+   {"t": 20.0, "tipo": "clima", "valor": "Chuvoso"}         mudança de clima
+
+Rodar:
+   python ingestao_detectores.py sintetico --duracao 3600 --saida eventos.jsonl
+   python ingestao_detectores.py replay eventos.jsonl --hora-inicial 07:00:00 --decisoes decisoes.csv
+   cat eventos.jsonl | python ingestao_detectores.py replay -
+   python ingestao_detectores.py socket --porta 8766      (eventos enviados por outro processo)
+"""
+
+import os
+# sem janela: importa o simulador em modo headless
+os.environ.setdefault("SIMULADOR_HEADLESS", "1")
+# o SDL não instala handlers de SIGINT/SIGTERM (viravam um evento QUIT que ninguém lê): SIGTERM encerra o processo
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import random
+import sys
+import time
+from collections import deque
+
+from interface_grafica import (ControladorSemaforo, Semaforo, RelogioDia, FPS, NIVEIS_DE_FLUXO, CLIMAS,
+                               FLUXO_CARROS_MULTIPLOS, FLUXO_PEDESTRES_MULTIPLOS, hora_para_segundos, segundos_para_hora,
+                               TAXA_BASE_CARROS_EIXO, TAXA_BASE_PEDESTRES_FAIXA)  # taxas base do simulador: carros/s por eixo, pedestres/s por faixa
+
+FAIXAS_PEDESTRES = ('h_n', 'h_s', 'v_r', 'v_l')
+EIXOS = ('v', 'h')
+MAX_AVISOS_INVALIDOS = 5  # eventos inválidos detalhados no stderr; os demais só entram na contagem
+
+
+def _limiares(base, multiplos):
+    # pontos médios entre os multiplicadores Baixo/Médio/Alto usados no spawn do simulador
+    m = [multiplos[n] for n in NIVEIS_DE_FLUXO]
+    return [base * (m[0] + m[1]) / 2.0, base * (m[1] + m[2]) / 2.0]
+
+
+LIMIARES_CARROS = _limiares(TAXA_BASE_CARROS_EIXO, FLUXO_CARROS_MULTIPLOS)                       # veículos/s por eixo
+LIMIARES_PEDESTRES = _limiares(TAXA_BASE_PEDESTRES_FAIXA * len(FAIXAS_PEDESTRES), FLUXO_PEDESTRES_MULTIPLOS)  # botões/s no total
+
+
+def rotulo_de_taxa(taxa, limiares):
+    if taxa < limiares[0]:
+        return "Baixo"
+    if taxa < limiares[1]:
+        return "Médio"
+    return "Alto"
+
+
+# --- fontes de eventos ---
+class EventoInvalido(ValueError):
+    """Evento que não segue o formato (linha ilegível, campo faltando ou fora do domínio)."""
+
+
+def _normalizar(evento):
+    """Valida e converte os campos do evento; levanta EventoInvalido se não der para usá-lo."""
+    if not isinstance(evento, dict):
+        raise EventoInvalido(f"linha ilegível: {evento!r}")
+    try:
+        t = float(evento["t"])
+    except (KeyError, TypeError, ValueError):
+        raise EventoInvalido(f"'t' ausente ou não numérico: {evento!r}") from None
+    if not math.isfinite(t):
+        raise EventoInvalido(f"'t' não finito: {evento!r}")
+    evento["t"] = t
+    tipo = evento.get("tipo")
+    if tipo in ("chegada", "fila"):
+        if evento.get("eixo") not in EIXOS:
+            raise EventoInvalido(f"'eixo' deve ser 'v' ou 'h': {evento!r}")
+        if tipo == "fila":
+            try:
+                evento["valor"] = int(evento["valor"])
+            except (KeyError, TypeError, ValueError):
+                raise EventoInvalido(f"'valor' da fila ausente ou não inteiro: {evento!r}") from None
+            if evento["valor"] < 0:
+                raise EventoInvalido(f"'valor' da fila negativo: {evento!r}")
+    elif tipo == "botao":
+        if evento.get("faixa") not in FAIXAS_PEDESTRES:
+            raise EventoInvalido(f"'faixa' deve ser uma de {', '.join(FAIXAS_PEDESTRES)}: {evento!r}")
+    elif tipo == "clima":
+        if evento.get("valor") not in CLIMAS:
+            raise EventoInvalido(f"'valor' do clima deve ser um de {', '.join(CLIMAS)}: {evento!r}")
+    else:
+        raise EventoInvalido(f"'tipo' desconhecido: {evento!r}")
+    return evento
+
+
+def _ler_json(linha):
+    """Um evento de uma linha JSON; se a linha não for JSON, devolve o próprio texto (inválido em _normalizar)."""
+    try:
+        return json.loads(linha)
+    except ValueError:
+        return linha
+
+
+def ler_linhas(linhas):
+    """
+    Gerador de eventos a partir de linhas JSON ou CSV (cabeçalho t,tipo,eixo,faixa,valor), ainda sem
+    validação (ver _normalizar). O formato é decidido pela primeira linha: começando com '{', todas as
+    linhas são JSON; senão ela é o cabeçalho do CSV.
+    """
+    json_por_linha = None
+    leitor_csv = None
+    for linha in linhas:
+        linha = linha.strip()
+        if not linha or linha.startswith("#"):
+            continue
+        if json_por_linha is None:
+            json_por_linha = linha.startswith("{")
+            if not json_por_linha:
+                leitor_csv = next(csv.reader([linha]))
+                continue
+        if json_por_linha:
+            yield _ler_json(linha)
+        else:
+            valores = next(csv.reader([linha]))
+            yield {k: v for k, v in zip(leitor_csv, valores) if v != ""}
+
+
+def ler_arquivo(caminho):
+    """Eventos de um arquivo (ou '-' para stdin / pipe)."""
+    if caminho == "-":
+        yield from ler_linhas(sys.stdin)
+        return
+    with open(caminho, encoding="utf-8") as f:
+        yield from ler_linhas(f)
+
+
+async def ler_socket(host="127.0.0.1", porta=8766):
+    """Eventos JSON por linha recebidos de clientes TCP locais (gerador assíncrono)."""
+    fila = asyncio.Queue()
+
+    async def atender(leitor, escritor):
+        while linha := await leitor.readline():
+            linha = linha.decode("utf-8", errors="replace").strip()
+            if linha and not linha.startswith("#"):
+                await fila.put(_ler_json(linha))
+        escritor.close()
+
+    servidor = await asyncio.start_server(atender, host, porta)
+    print(f"Aguardando eventos em {host}:{porta}")
+    async with servidor:
+        while True:
+            yield await fila.get()
+
+
+# --- janelas e condução do controlador ---
+class JanelaDetectores:
+    """
+    Converte eventos em entradas do controlador:
+     - fluxo de carros/pedestres: taxa de chegadas numa janela deslizante de `janela_s` segundos
+     - carros esperando por eixo: última leitura do detector de fila; sem detector de fila no eixo,
+       estima pelas chegadas desde que o eixo saiu do verde
+     - pedestres esperando: botões pressionados ainda não atendidos (atendidos quando a via que
+       atravessam fica vermelha)
+    """
+    def __init__(self, janela_s=60.0, clima="Ensolarado"):
+        self.janela_s = janela_s
+        self.chegadas = {'v': deque(), 'h': deque()}
+        self.botoes = deque()
+        self.fila_detector = {'v': None, 'h': None}
+        self.chegadas_no_vermelho = {'v': 0, 'h': 0}
+        self.pedestres_esperando = {f: 0 for f in FAIXAS_PEDESTRES}
+        self.clima = clima
+
+    def registrar(self, evento, luz_vertical, luz_horizontal):
+        """Aplica um evento; retorna a faixa do pedido de travessia para botões, senão None."""
+        tipo, t = evento.get("tipo"), evento["t"]
+        if tipo == "chegada":
+            eixo = evento["eixo"]
+            self.chegadas[eixo].append(t)
+            luz = luz_vertical if eixo == 'v' else luz_horizontal
+            if luz.estado != 'verde':
+                self.chegadas_no_vermelho[eixo] += 1
+        elif tipo == "fila":
+            self.fila_detector[evento["eixo"]] = evento["valor"]
+        elif tipo == "botao":
+            faixa = evento["faixa"]
+            self.botoes.append(t)
+            self.pedestres_esperando[faixa] += 1
+            # o plano de fases do controlador decide quais movimentos param para a faixa
+            return faixa
+        elif tipo == "clima":
+            self.clima = evento["valor"]
+        return None
+
+    def descartar_antigos(self, agora):
+        limite = agora - self.janela_s
+        for d in (self.chegadas['v'], self.chegadas['h'], self.botoes):
+            while d and d[0] < limite:
+                d.popleft()
+
+    def atualizar_luzes(self, luz_vertical, luz_horizontal):
+        if luz_vertical.estado == 'verde':
+            self.chegadas_no_vermelho['v'] = 0
+        else:
+            self.pedestres_esperando['h_n'] = self.pedestres_esperando['h_s'] = 0
+        if luz_horizontal.estado == 'verde':
+            self.chegadas_no_vermelho['h'] = 0
+        else:
+            self.pedestres_esperando['v_r'] = self.pedestres_esperando['v_l'] = 0
+
+    def carros_esperando(self, eixo):
+        if self.fila_detector[eixo] is not None:
+            return self.fila_detector[eixo]
+        return self.chegadas_no_vermelho[eixo]
+
+    def ambiente(self, hora):
+        taxa_carros = (len(self.chegadas['v']) + len(self.chegadas['h'])) / 2.0 / self.janela_s
+        taxa_pedestres = len(self.botoes) / self.janela_s
+        return {"clima": self.clima, "fluxo_de_carros": rotulo_de_taxa(taxa_carros, LIMIARES_CARROS),
+                "fluxo_de_pedestres": rotulo_de_taxa(taxa_pedestres, LIMIARES_PEDESTRES), "hora": hora}
+
+
+class ReprodutorEventos:
+    """
+    Avança o ControladorSemaforo em frames de 1/FPS no tempo dos eventos (o controlador conta frames).
+    velocidade: 0 = o mais rápido possível; 1.0 = tempo real; 10 = 10x.
+    """
+    def __init__(self, hora_inicial="00:00:00", janela_s=60.0, velocidade=0.0, arquivo_decisoes=None):
+        self.luz_vertical = Semaforo(300, 150, 'vertical')
+        self.luz_horizontal = Semaforo(150, 300, 'horizontal')
+        self.controlador = ControladorSemaforo(self.luz_vertical, self.luz_horizontal)
+        self.controlador.imprimir_ativacoes = False
+        self.janela = JanelaDetectores(janela_s)
+        self.hora_inicial_s = hora_para_segundos(hora_inicial)
+        self.velocidade = velocidade
+        self.t = 0.0
+        self.frames = 0
+        self.eventos = 0
+        self.invalidos = 0
+        self.trocas = 0
+        self._inicio_real = None
+        self._estados = (self.luz_vertical.estado, self.luz_horizontal.estado)
+        self._decisoes_f = None
+        if arquivo_decisoes:
+            self._decisoes_f = open(arquivo_decisoes, "w", newline="", encoding="utf-8")
+            self._decisoes = csv.writer(self._decisoes_f)
+            self._decisoes.writerow(["t", "hora", "luz_vertical", "luz_horizontal", "esperando_vertical", "esperando_horizontal", "pedestres_esperando", "fluxo_de_carros", "fluxo_de_pedestres", "prioridade", "tempo_recomendado"])
+
+    def _frame(self):
+        janela = self.janela
+        janela.descartar_antigos(self.t)
+        ambiente = janela.ambiente(segundos_para_hora(self.hora_inicial_s + self.t))
+        cv, ch = janela.carros_esperando('v'), janela.carros_esperando('h')
+        pedestres = sum(janela.pedestres_esperando.values())
+        self.controlador.update(cv, ch, ambiente=ambiente, pedestres_esperando_total=pedestres)
+        janela.atualizar_luzes(self.luz_vertical, self.luz_horizontal)
+        self.frames += 1
+
+        estados = (self.luz_vertical.estado, self.luz_horizontal.estado)
+        if estados != self._estados:
+            self._estados = estados
+            self.trocas += 1
+            if self._decisoes_f is not None:
+                self._decisoes.writerow([f"{self.t:.3f}", ambiente["hora"], estados[0], estados[1], cv, ch, pedestres,
+                                         ambiente["fluxo_de_carros"], ambiente["fluxo_de_pedestres"],
+                                         f"{self.controlador.last_priority_score:.2f}", f"{getattr(self.controlador, 'last_tempo_recomendado', float('nan')):.2f}"])
+
+    def avancar_ate(self, t):
+        """Roda os frames até o tempo t (em segundos desde o início dos eventos)."""
+        passo = 1.0 / FPS
+        while self.t + passo <= t:
+            self.t += passo
+            self._frame()
+        if self.velocidade > 0:
+            if self._inicio_real is None:
+                self._inicio_real = time.perf_counter()
+            atraso = self.t / self.velocidade - (time.perf_counter() - self._inicio_real)
+            if atraso > 0:
+                time.sleep(atraso)
+
+    def processar(self, evento):
+        """Aplica um evento. Inválidos são pulados e contados (um evento ruim não derruba o pipeline)."""
+        try:
+            evento = _normalizar(evento)
+        except EventoInvalido as e:
+            self.invalidos += 1
+            if self.invalidos <= MAX_AVISOS_INVALIDOS:
+                print(f"Evento inválido ignorado: {e}", file=sys.stderr)
+            return
+        self.avancar_ate(evento["t"])
+        faixa = self.janela.registrar(evento, self.luz_vertical, self.luz_horizontal)
+        if faixa is not None:
+            self.controlador.requisicao_travessia_pedestre(faixa)
+        self.eventos += 1
+
+    def reproduzir(self, eventos):
+        inicio = time.perf_counter()
+        for evento in eventos:
+            self.processar(evento)
+        self.fechar()
+        decorrido = time.perf_counter() - inicio
+        print(f"{self.eventos} eventos, {self.t:.0f}s de dados em {decorrido:.2f}s ({self.t / max(decorrido, 1e-9):.0f}x tempo real) | trocas de luz={self.trocas} | "
+              f"inválidos ignorados={self.invalidos}")
+
+    async def reproduzir_async(self, eventos):
+        async for evento in eventos:
+            self.processar(evento)
+            if self._decisoes_f is not None:
+                self._decisoes_f.flush()
+
+    def fechar(self):
+        if self._decisoes_f is not None:
+            self._decisoes_f.close()
+            self._decisoes_f = None
+
+
+def gerar_eventos_sinteticos(duracao_s, hora_inicial="06:00:00", escala=1.0, semente=0):
+    """
+    Eventos de chegada e botão (processos de Poisson) com as taxas do simulador seguindo as agendas
+    do RelogioDia — útil para testar o pipeline sem dados de campo.
+    """
+    rng = random.Random(semente)
+    relogio = RelogioDia(hora_inicial, escala)
+    passo = 0.1
+    t = 0.0
+    clima = relogio.ambiente["clima"]
+    while t < duracao_s:
+        relogio.avancar(passo)
+        t += passo
+        a = relogio.ambiente
+        if a["clima"] != clima:
+            clima = a["clima"]
+            yield {"t": round(t, 3), "tipo": "clima", "valor": clima}
+        taxa_c = TAXA_BASE_CARROS_EIXO * FLUXO_CARROS_MULTIPLOS[a["fluxo_de_carros"]]
+        taxa_p = TAXA_BASE_PEDESTRES_FAIXA * FLUXO_PEDESTRES_MULTIPLOS[a["fluxo_de_pedestres"]]
+        for eixo in ('v', 'h'):
+            if rng.random() < taxa_c * passo:
+                yield {"t": round(t, 3), "tipo": "chegada", "eixo": eixo}
+        for faixa in FAIXAS_PEDESTRES:
+            if rng.random() < taxa_p * passo:
+                yield {"t": round(t, 3), "tipo": "botao", "faixa": faixa}
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Ingestão de eventos de detectores para o controlador fuzzy")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    for nome in ("replay", "socket"):
+        p = sub.add_parser(nome)
+        p.add_argument("--hora-inicial", default="00:00:00", help="hora correspondente a t=0")
+        p.add_argument("--janela", type=float, default=60.0, help="janela deslizante das taxas (s)")
+        p.add_argument("--decisoes", default=None, help="CSV com cada troca de estado das luzes")
+    sub.choices["replay"].add_argument("arquivo", help="arquivo de eventos (JSON por linha ou CSV); '-' = stdin")
+    sub.choices["replay"].add_argument("--velocidade", type=float, default=0.0, help="0 = o mais rápido possível, 1 = tempo real")
+    sub.choices["socket"].add_argument("--porta", type=int, default=8766)
+    sint = sub.add_parser("sintetico")
+    sint.add_argument("--duracao", type=float, default=3600.0)
+    sint.add_argument("--hora-inicial", default="06:00:00")
+    sint.add_argument("--escala-relogio", type=float, default=1.0)
+    sint.add_argument("--semente", type=int, default=0)
+    sint.add_argument("--saida", default="-")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _argumentos()
+    if args.comando == "sintetico":
+        saida = sys.stdout if args.saida == "-" else open(args.saida, "w", encoding="utf-8")
+        for evento in gerar_eventos_sinteticos(args.duracao, args.hora_inicial, args.escala_relogio, args.semente):
+            saida.write(json.dumps(evento, ensure_ascii=False) + "\n")
+        if saida is not sys.stdout:
+            saida.close()
+    elif args.comando == "replay":
+        ReprodutorEventos(args.hora_inicial, args.janela, args.velocidade, args.decisoes).reproduzir(ler_arquivo(args.arquivo))
+    else:
+        reprodutor = ReprodutorEventos(args.hora_inicial, args.janela, 0.0, args.decisoes)
+        try:
+            asyncio.run(reprodutor.reproduzir_async(ler_socket(porta=args.porta)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            reprodutor.fechar()
+            print(f"{reprodutor.eventos} eventos, {reprodutor.t:.0f}s de dados | trocas de luz={reprodutor.trocas} | inválidos ignorados={reprodutor.invalidos}")
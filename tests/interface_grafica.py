@@ -17,19 +17,44 @@ Instalação e execução (Windows)
 
 4. Rodar:
    python main.py
+
+   Modo dia (relógio avança e fluxos/clima seguem as agendas, sem reset):
+   python main.py --dia --hora-inicial 06:00:00
+   Sem janela, o mais rápido possível (ex.: um dia inteiro com 1 minuto do dia por segundo simulado):
+   python main.py --headless --dia --escala-relogio 60
+   Headless até as médias estabilizarem (IC 95% com ±5%), no máximo 2 h simuladas:
+   python main.py --headless --precisao 0.05 --duracao 7200
+   Teste de memória (soak) de 24 h simuladas, falhando se a memória crescer mais de 32 MB:
+   python main.py --teste-memoria --dia --duracao 86400
+   Fuzzy alimentado pelas taxas de chegada medidas (EWMA de 8 s) em vez dos rótulos Baixo/Médio/Alto:
+   python main.py --fluxo-medido ewma
+   Trocas escolhidas por rollouts (agora / em 5 s / em 10 s), no máximo 100 ms por decisão:
+   python main.py --preditivo --orcamento-preditivo-ms 100
+   Plano de 4 fases (conversões à esquerda protegidas e 1 s de vermelho total entre fases):
+   python main.py --plano 4fases
+   Pedidos de travessia servidos em lotes de 6 (ou após 30 s), com verde mínimo de 10 s:
+   python main.py --lote-travessia 6 --espera-maxima-travessia 30 --verde-minimo 10
+   Varredura retomável (climas x fluxos x 5 sementes, 10 min cada); outras máquinas ajudam com --trabalhador-varredura:
+   python main.py --varredura /mnt/compartilhado/varredura --sementes-varredura 5 --duracao 600
+   python main.py --varredura /mnt/compartilhado/varredura --trabalhador-varredura
 """
 
 import os
+import sys
 # oculta a mensagem de boas-vindas do pygame
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 
+# modo headless: sem janela (driver de vídeo "dummy"), simulação roda o mais rápido possível.
+# Quem importa o módulo decide pela variável SIMULADOR_HEADLESS; rodando como script, pelos argumentos
+# (grupo "modos sem janela" de _argumentos). O pygame só é inicializado depois disso (iniciar_pygame).
+MODO_HEADLESS = os.environ.get("SIMULADOR_HEADLESS") == "1"
+
 import warnings
 warnings.filterwarnings("ignore", message=r".*pkg_resources is deprecated.*", category=UserWarning)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 import pygame
 import random
-import sys
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
@@ -38,6 +63,22 @@ from pathlib import Path
 import time
 import textwrap
 import datetime
+import threading
+import queue
+import bisect
+import itertools
+import struct
+import zlib
+import pickle
+import mmap
+import math
+import json
+import hashlib
+import socket
+import gc
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple, deque
 #from reset_planilha import verificar_e_resetar_planilha
 
 # Chamar função para resetar planilha se desejado
@@ -45,17 +86,46 @@ import datetime
 
 # métricas (arquivo)
 ARQUIVOS_METRICAS = Path("metricas.csv")
+ARMAZEM_METRICAS = None  # diretório do armazém de rollups (None = desligado)
+EXPORTACAO_ESTADO = None  # arquivo mapeado em memória com o estado ao vivo (None = desligado)
+PREDITIVO = None  # opções do ControladorPreditivo (dict; None = modo preditivo desligado)
+FATIA_PREDITIVO_JANELA_MS = 8.0  # na janela, tempo máximo dos rollouts do preditivo em cada frame (< 16,7 ms)
+FLUXO_MEDIDO = None  # opções do MedidorChegadas (dict; None = fluxos pelos rótulos do ambiente)
+PLANO_FASES = None  # plano de fases do controlador (dict no formato de PLANOS; None = PLANO_DUAS_FASES)
+# opções do AgendadorTravessias (lote=1 e verde_minimo_s=0: cada pedestre corta o verde na hora)
+AGENDA_TRAVESSIAS = {"verde_minimo_s": 8.0, "espera_maxima_s": 20.0, "lote": 4}
 carros_saíram = 0
-total_gerado = 0
 
 # --- INICIALIZAÇÃO DO PYGAME ---
-pygame.init()
+# só as fontes aqui; vídeo e janela em iniciar_pygame(), quando já se sabe se o modo é headless
+pygame.font.init()
 
 # --- CONSTANTES ---
 LARGURA_TELA = 800
 ALTURA_TELA = 800
-tela = pygame.display.set_mode((LARGURA_TELA, ALTURA_TELA))
-pygame.display.set_caption("Simulador de Semáforo com Lógica Fuzzy")
+tela = None  # superfície da janela (ou do driver "dummy"), criada por iniciar_pygame()
+
+
+def iniciar_pygame(headless):
+    """
+    Inicializa o pygame e cria a tela. Headless: driver de vídeo "dummy" e sem os handlers de SIGINT/SIGTERM
+    do SDL (transformariam o SIGTERM num evento QUIT que nenhum loop sem janela lê: timeout, systemd e
+    docker stop não conseguiriam parar o processo). A variável SIMULADOR_HEADLESS fica definida para os
+    processos filhos (pools da varredura, ramos e codificação de quadros).
+    """
+    global MODO_HEADLESS, tela
+    MODO_HEADLESS = headless
+    if headless:
+        os.environ["SIMULADOR_HEADLESS"] = "1"
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+    pygame.init()
+    tela = pygame.display.set_mode((LARGURA_TELA, ALTURA_TELA))
+    pygame.display.set_caption("Simulador de Semáforo com Lógica Fuzzy")
+
+
+if __name__ != '__main__':
+    iniciar_pygame(MODO_HEADLESS)
 
 # Cores e Fonte
 COR_BRANCA = (255, 255, 255)
@@ -71,6 +141,12 @@ fonte = pygame.font.SysFont("Arial", 20)
 tempo = pygame.time.Clock()
 FPS = 60
 
+# prazo das decisões do controlador: se o tempo recomendado não sai dentro do orçamento,
+# o controlador usa o modo degradado ('ultimo_bom', 'tabela' ou 'fixo')
+ORCAMENTO_DECISAO_S = 0.010
+MODO_DEGRADADO = "ultimo_bom"
+TEMPO_FIXO_DEGRADADO = 12.0
+
 # Zonas de parada (ajustadas e separadas por direção)
 PARADA_EMBAIXO_MIN, PARADA_EMBAIXO_MAX = 340, 340   # vindo de cima 
 PARADA_CIMA_MIN, PARADA_CIMA_MAX = 440, 440   # vindo de baixo 
@@ -83,6 +159,16 @@ COMPRIMENTO_FILA = 160
 CW_THICKNESS = 22
 CW_GAP = 12
 
+# --- Evitar parada SOBRE as faixas: posições seguras de parada (fixas; usadas no update de cada carro) ---
+# faixa norte (quem vem de cima - 'pra_baixo'): aproxima o ponto de parada da faixa (antes: -4)
+PARADA_SEGURA_EMBAIXO = PARADA_EMBAIXO_MIN - CW_GAP - CW_THICKNESS + 2
+# faixa sul (quem vem de baixo - 'pra_cima')
+PARADA_SEGURA_CIMA = PARADA_CIMA_MIN + CW_GAP + CW_THICKNESS + 4
+# faixa oeste (quem vem da esquerda - 'direita'): alinhada com as faixas da direita/baixo (antes: -4)
+PARADA_SEGURA_DIREITA = PARADA_DIREITA_MIN - CW_GAP - CW_THICKNESS + 2
+# faixa leste (quem vem da direita - 'esquerda')
+PARADA_SEGURA_ESQUERDA = PARADA_ESQUERDA_MIN + CW_GAP + CW_THICKNESS + 4
+
 # limites das vias (usados por desenho e lógica para detectar faixas)
 ESTRADA_X0, ESTRADA_X1 = 350, 450
 ESTRADA_Y0, ESTRADA_Y1 = 350, 450
@@ -100,20 +186,21 @@ FLUXO_CARROS_MULTIPLOS = {"Baixo": 0.25, "Médio": 0.6, "Alto": 1.3}
 FLUXO_PEDESTRES_MULTIPLOS = {"Baixo": 0.25, "Médio": 0.6, "Alto": 1.3}
 
 
-def gerar_ambiente_aleatorio():
+def gerar_ambiente_aleatorio(rng=random):
     """Gera um dicionário com clima, fluxo de carros, fluxo de pedestres e horário aleatório.
     Se a hora cair em período de pico (06:30-08:00 ou 18:00-19:00) força fluxo_de_carros = 'Alto'.
+    rng: gerador usado (padrão: módulo random global; a Simulacao passa o seu fluxo 'ambiente').
     """
-    clima = random.choice(CLIMAS)
+    clima = rng.choice(CLIMAS)
 
     # horário aleatório do dia
-    seconds = random.randint(0, 24*3600 - 1)
+    seconds = rng.randint(0, 24*3600 - 1)
     hora_dt = (datetime.datetime.min + datetime.timedelta(seconds=seconds)).time()
     hora = hora_dt.strftime("%H:%M:%S")
 
     # escolha inicial com pesos para ter mais probabilidade de Médio
-    fluxo_carros = random.choices(NIVEIS_DE_FLUXO, weights=[1, 3, 2], k=1)[0]
-    fluxo_de_pedestres = random.choices(NIVEIS_DE_FLUXO, weights=[2, 3, 1], k=1)[0]
+    fluxo_carros = rng.choices(NIVEIS_DE_FLUXO, weights=[1, 3, 2], k=1)[0]
+    fluxo_de_pedestres = rng.choices(NIVEIS_DE_FLUXO, weights=[2, 3, 1], k=1)[0]
 
     # se estiver em horário de pico, força fluxo de carros Alto
     pico_manha_comeco = datetime.time(6, 30, 0)
@@ -125,6 +212,88 @@ def gerar_ambiente_aleatorio():
 
     return {"clima": clima, "fluxo_de_carros": fluxo_carros, "fluxo_de_pedestres": fluxo_de_pedestres, "hora": hora}
 
+# --- Simulação de um dia inteiro (relógio avançando) ---
+SEGUNDOS_DIA = 24 * 3600
+
+# agendas (hora de início, rótulo): cada rótulo vale até o próximo horário da lista
+AGENDA_FLUXO_CARROS = [("00:00:00", "Baixo"), ("06:00:00", "Médio"), ("07:00:00", "Alto"), ("10:00:00", "Médio"),
+                       ("18:00:00", "Alto"), ("20:00:00", "Médio"), ("22:00:00", "Baixo")]
+AGENDA_FLUXO_PEDESTRES = [("00:00:00", "Baixo"), ("07:00:00", "Médio"), ("12:00:00", "Alto"), ("14:00:00", "Médio"),
+                          ("18:00:00", "Alto"), ("20:00:00", "Baixo")]
+AGENDA_CLIMA = [("00:00:00", "Nublado"), ("06:00:00", "Ensolarado"), ("15:00:00", "Chuvoso"), ("17:00:00", "Nublado")]
+
+
+def hora_para_segundos(hora_str):
+    """Converte "HH:MM:SS" em segundos desde a meia-noite."""
+    h, m, s = (int(p) for p in hora_str.split(":"))
+    return h * 3600 + m * 60 + s
+
+
+def segundos_para_hora(segundos):
+    """Converte segundos (qualquer valor, é reduzido ao dia) em "HH:MM:SS"."""
+    s = int(segundos) % SEGUNDOS_DIA
+    return f"{s // 3600:02d}:{(s % 3600) // 60:02d}:{s % 60:02d}"
+
+
+class RelogioDia:
+    """
+    Relógio simulado para o modo "dia": avança `hora` conforme o tempo simulado
+    (escala=1.0 -> tempo real; escala=60 -> 1 minuto do dia por segundo simulado).
+    Fluxos e clima seguem as agendas; os rótulos só são recalculados quando o relógio
+    cruza uma fronteira de agenda, e o dicionário `ambiente` é atualizado no lugar
+    (sem recriar nem resetar a simulação).
+    """
+    def __init__(self, hora_inicial="00:00:00", escala=1.0,
+                 agenda_carros=AGENDA_FLUXO_CARROS, agenda_pedestres=AGENDA_FLUXO_PEDESTRES, agenda_clima=AGENDA_CLIMA):
+        self.escala = float(escala)
+        self.agendas = {
+            "fluxo_de_carros": sorted((hora_para_segundos(h), r) for h, r in agenda_carros),
+            "fluxo_de_pedestres": sorted((hora_para_segundos(h), r) for h, r in agenda_pedestres),
+            "clima": sorted((hora_para_segundos(h), r) for h, r in agenda_clima),
+        }
+        self.fronteiras = sorted({inicio for agenda in self.agendas.values() for inicio, _ in agenda})
+        # segundos absolutos (monotônicos, incluem os dias já completados)
+        self.segundos = float(hora_para_segundos(hora_inicial))
+        self.inicio = self.segundos
+        self._segundo_exibido = int(self.segundos)
+        self.ambiente = {"hora": segundos_para_hora(self.segundos)}
+        self._recalcular_rotulos()
+
+    @property
+    def segundos_decorridos(self):
+        return self.segundos - self.inicio
+
+    @staticmethod
+    def _rotulo_agendado(agenda, segundos_do_dia):
+        # antes do primeiro horário vale o último rótulo do dia anterior
+        rotulo = agenda[-1][1]
+        for inicio, r in agenda:
+            if inicio > segundos_do_dia:
+                break
+            rotulo = r
+        return rotulo
+
+    def _recalcular_rotulos(self):
+        dia, sod = divmod(int(self.segundos), SEGUNDOS_DIA)
+        for chave, agenda in self.agendas.items():
+            self.ambiente[chave] = self._rotulo_agendado(agenda, sod)
+        proxima = next((f for f in self.fronteiras if f > sod), self.fronteiras[0] + SEGUNDOS_DIA)
+        self._proxima_fronteira = dia * SEGUNDOS_DIA + proxima
+
+    def avancar(self, dt):
+        """Avança o relógio em dt segundos simulados. Retorna True se algum rótulo do ambiente mudou."""
+        self.segundos += dt * self.escala
+        segundo = int(self.segundos)
+        if segundo != self._segundo_exibido:
+            self._segundo_exibido = segundo
+            self.ambiente["hora"] = segundos_para_hora(segundo)
+
+        if self.segundos < self._proxima_fronteira:
+            return False
+        anterior = (self.ambiente["fluxo_de_carros"], self.ambiente["fluxo_de_pedestres"], self.ambiente["clima"])
+        self._recalcular_rotulos()
+        return anterior != (self.ambiente["fluxo_de_carros"], self.ambiente["fluxo_de_pedestres"], self.ambiente["clima"])
+
 # --- Controlador Fuzzy ---
 
 class FuzzyControlador:
@@ -202,6 +371,7 @@ class FuzzyControlador:
         regras.append(ctrl.Rule(self.fluxo_de_carros['Médio'] & self.horario['Outro'], self.tempo_semaforo['Médio']))
 
         # monta sistema
+        self.regras = regras
         self.sistema = ctrl.ControlSystem(regras)
         self.sim = ctrl.ControlSystemSimulation(self.sistema)
 
@@ -218,9 +388,127 @@ class FuzzyControlador:
             "9) SE Fluxo de Carros é Médio E Horário é Outro ENTÃO Tempo Médio."
         ]
 
+        # contadores de disparo (grau > 0) de cada regra nas avaliações completas da base
+        self.disparos_regras = np.zeros(len(regras), dtype=np.int64)
+        self.avaliacoes_regras = 0
+
+        # base compilada (regras redundantes/mortas removidas) usada na inferência do tempo
+        self.compiladas = RegrasCompiladas(self)
+
+        # subsistema de prioridade de troca (avaliado a cada frame pela tabela pré-calculada)
+        self._montar_prioridade()
+
+    # --- Prioridade de troca ---
+    # parâmetros das MFs (trimf) da prioridade: usados pelo skfuzzy e pela avaliação escalar das regras
+    MFS_PRIORIDADE = {
+        'carros_vermelho': {'Poucos': (0, 0, 4), 'Alguns': (2, 5, 8), 'Muitos': (6, 10, 10)},           # carros parados no vermelho
+        'tempo_verde': {'Curto': (0, 0, 10), 'Médio': (5, 15, 25), 'Longo': (20, 30, 30)},             # segundos de verde atual
+        'pedestres_esperando': {'Nenhum': (0, 0, 2), 'Alguns': (1, 3, 5), 'Muitos': (4, 6, 6)},
+        'prioridade': {'Baixa': (0, 0, 5), 'Média': (2, 5, 8), 'Alta': (5, 10, 10)},
+    }
+    # regras da prioridade: (antecedentes como lista de "OU" de "E" [(variável, termo), ...], consequente, descrição)
+    REGRAS_PRIORIDADE = [
+        ([[('tempo_verde', 'Curto')]], 'Baixa', "P1) SE (Tempo de Verde é Curto) ENTÃO (Prioridade é Baixa)."),
+        ([[('carros_vermelho', 'Poucos'), ('pedestres_esperando', 'Nenhum')]], 'Baixa',
+         "P2) SE (Carros no Vermelho são Poucos) E (Pedestres Esperando é Nenhum) ENTÃO (Prioridade é Baixa)."),
+        ([[('carros_vermelho', 'Alguns'), ('tempo_verde', 'Médio')]], 'Média',
+         "P3) SE (Carros no Vermelho são Alguns) E (Tempo de Verde é Médio) ENTÃO (Prioridade é Média)."),
+        ([[('carros_vermelho', 'Muitos'), ('tempo_verde', 'Médio')]], 'Alta',
+         "P4) SE (Carros no Vermelho são Muitos) E (Tempo de Verde é Médio) ENTÃO (Prioridade é Alta)."),
+        ([[('carros_vermelho', 'Alguns'), ('tempo_verde', 'Longo')], [('carros_vermelho', 'Muitos'), ('tempo_verde', 'Longo')]], 'Alta',
+         "P5) SE (Carros no Vermelho são Alguns OU Muitos) E (Tempo de Verde é Longo) ENTÃO (Prioridade é Alta)."),
+        ([[('carros_vermelho', 'Poucos'), ('tempo_verde', 'Longo')]], 'Média',
+         "P6) SE (Carros no Vermelho são Poucos) E (Tempo de Verde é Longo) ENTÃO (Prioridade é Média)."),
+        ([[('pedestres_esperando', 'Alguns'), ('tempo_verde', 'Médio')]], 'Média',
+         "P7) SE (Pedestres Esperando é Alguns) E (Tempo de Verde é Médio) ENTÃO (Prioridade é Média)."),
+        ([[('pedestres_esperando', 'Muitos'), ('tempo_verde', 'Médio')], [('pedestres_esperando', 'Muitos'), ('tempo_verde', 'Longo')]], 'Alta',
+         "P8) SE (Pedestres Esperando é Muitos) E (Tempo de Verde é Médio OU Longo) ENTÃO (Prioridade é Alta)."),
+    ]
+
+    # passo dos nós da tabela por entrada (carros e pedestres são contagens; tempo de verde é contínuo)
+    PASSOS_TABELA_PRIORIDADE = (1.0, 0.5, 1.0)
+
+    # sistema, tabela e regras escalares da prioridade já montados: dependem só das constantes da classe,
+    # então são montados uma vez por processo e compartilhados (somente leitura) por todas as instâncias
+    _prioridade_montada = None
+
+    def _montar_prioridade(self):
+        """
+        Monta o sistema skfuzzy da prioridade e o compila numa tabela (carros x tempo x pedestres)
+        calculada de uma só vez com entradas em vetor. Por frame, prioridade_de_computacao só
+        interpola a tabela. Com contagens inteiras, o erro em relação ao skfuzzy fica em ~0,02 e é zero nos nós.
+        """
+        if FuzzyControlador._prioridade_montada is None:
+            FuzzyControlador._prioridade_montada = self._compilar_prioridade()
+        (self.variaveis_prioridade, self.sistema_prioridade, self._limites_prioridade, self._tabela_prioridade,
+         self._ultimo_no_prioridade, self._termos_prioridade, self._regras_prioridade_escalar) = FuzzyControlador._prioridade_montada
+
+    def _compilar_prioridade(self):
+        mfs = self.MFS_PRIORIDADE
+        universos = {'carros_vermelho': np.arange(0, 11, 1), 'tempo_verde': np.arange(0, 31, 1),
+                     'pedestres_esperando': np.arange(0, 7, 1), 'prioridade': np.arange(0, 10.25, 0.5)}
+        variaveis = {nome: (ctrl.Consequent if nome == 'prioridade' else ctrl.Antecedent)(universos[nome], nome) for nome in mfs}
+        for nome, termos in mfs.items():
+            for termo, abc in termos.items():
+                variaveis[nome][termo] = fuzz.trimf(variaveis[nome].universe, list(abc))
+
+        regras = []
+        for clausulas, consequente, _ in self.REGRAS_PRIORIDADE:
+            antecedente = None
+            for clausula in clausulas:
+                conjuncao = None
+                for nome, termo in clausula:
+                    conjuncao = variaveis[nome][termo] if conjuncao is None else conjuncao & variaveis[nome][termo]
+                antecedente = conjuncao if antecedente is None else antecedente | conjuncao
+            regras.append(ctrl.Rule(antecedente, variaveis['prioridade'][consequente]))
+        sistema = ctrl.ControlSystem(regras)
+
+        # tabela nos nós: uma única compute() do skfuzzy com todas as combinações
+        entradas = ('carros_vermelho', 'tempo_verde', 'pedestres_esperando')
+        limites = [float(universos[nome][-1]) for nome in entradas]
+        eixos = [np.arange(0.0, limite + passo / 2, passo) for limite, passo in zip(limites, self.PASSOS_TABELA_PRIORIDADE)]
+        malha = np.meshgrid(*eixos, indexing='ij')
+        sim_local = ctrl.ControlSystemSimulation(sistema)
+        for nome, valores in zip(entradas, malha):
+            sim_local.input[nome] = valores.ravel()
+        sim_local.compute()
+        tabela = np.asarray(sim_local.output['prioridade'], dtype=np.float64).reshape(malha[0].shape)
+
+        # regras pré-resolvidas para as ativações: termos como (entrada, (a, b, c)); cláusulas como índices de termos
+        termos = [(nome, termo) for nome in entradas for termo in mfs[nome]]
+        termos_escalar = [(entradas.index(nome), mfs[nome][termo]) for nome, termo in termos]
+        regras_escalar = [
+            (descricao, [tuple(termos.index(literal) for literal in clausula) for clausula in clausulas])
+            for clausulas, _, descricao in self.REGRAS_PRIORIDADE]
+        # listas aninhadas: indexação escalar bem mais barata que em arrays numpy
+        return (variaveis, sistema, limites, tabela.tolist(), [len(eixo) - 2 for eixo in eixos], termos_escalar, regras_escalar)
+
+    def prioridade_skfuzzy(self, num_carros_vermelha, tempo_verde, num_pedestres_esperando=0):
+        """Prioridade pelo skfuzzy (referência da tabela; lento para chamar a cada frame)."""
+        sim_local = ctrl.ControlSystemSimulation(self.sistema_prioridade)
+        sim_local.input['carros_vermelho'] = float(num_carros_vermelha)
+        sim_local.input['tempo_verde'] = float(tempo_verde)
+        sim_local.input['pedestres_esperando'] = float(num_pedestres_esperando)
+        sim_local.compute()
+        return float(sim_local.output['prioridade'])
+
+    @staticmethod
+    def _trimf_escalar(x, abc):
+        a, b, c = abc
+        if x < a or x > c:
+            return 0.0
+        if x < b:
+            return (x - a) / (b - a)
+        if x > b:
+            return (c - x) / (c - b)
+        return 1.0
+
     # mapeamentos auxiliares de rótulos para valores numéricos usados na entrada fuzzy
     @staticmethod
     def mapear_rotulo_de_fluxo_para_valor(label):
+        # fluxo medido (MedidorChegadas) já chega como número na escala 0..10
+        if isinstance(label, (int, float)):
+            return min(max(float(label), 0.0), 10.0)
         return {'Baixo': 2.0, 'Médio': 5.0, 'Alto': 9.0}.get(label, 5.0)
 
     @staticmethod
@@ -242,15 +530,22 @@ class FuzzyControlador:
             return 1.0  # Normal
         return 0.0      # Outro
 
+    def valores_do_ambiente(self, rotulo_fluxo_carros, rotulo_fluxo_pedestres, hora_str, rotulo_clima):
+        """Rótulos do ambiente -> entradas numéricas (cf, pf, hr, cl)."""
+        return (self.mapear_rotulo_de_fluxo_para_valor(rotulo_fluxo_carros), self.mapear_rotulo_de_fluxo_para_valor(rotulo_fluxo_pedestres),
+                self.mapear_rotulo_hora_para_valor(hora_str), self.mapear_rotulo_climatico_para_valor(rotulo_clima))
+
     def calcular_tempo_a_partir_do_ambiente(self, rotulo_fluxo_carros, rotulo_fluxo_pedestres, hora_str, rotulo_clima):
         """
         Recebe labels do ambiente (strings) e retorna tempo_recomendado (float segundos).
+        Os fluxos também podem vir medidos, como números em 0..10 (ver MedidorChegadas).
         """
-        cf = self.mapear_rotulo_de_fluxo_para_valor(rotulo_fluxo_carros)
-        pf = self.mapear_rotulo_de_fluxo_para_valor(rotulo_fluxo_pedestres)
-        hr = self.mapear_rotulo_hora_para_valor(hora_str)
-        cl = self.mapear_rotulo_climatico_para_valor(rotulo_clima)
+        return self.calcular_tempo_a_partir_de_valores(*self.valores_do_ambiente(rotulo_fluxo_carros, rotulo_fluxo_pedestres, hora_str, rotulo_clima))
 
+    def calcular_tempo_a_partir_de_valores(self, cf, pf, hr, cl):
+        """
+        Mesma inferência de calcular_tempo_a_partir_do_ambiente, com as entradas já numéricas.
+        """
         try:
             # cria uma simulação local para evitar estado/resíduos entre chamadas
             sim_local = ctrl.ControlSystemSimulation(self.sistema)
@@ -275,28 +570,119 @@ class FuzzyControlador:
 
         return tempo
 
+    # tabela do tempo recomendado para fluxos contínuos: nós a cada PASSO_TABELA_FLUXO em carros x pedestres,
+    # uma fatia por (horário, clima). Depende só das MFs e das regras (iguais em toda instância): as nove
+    # fatias são montadas de uma vez por montar_tabela_fluxo() (ao ligar os fluxos medidos) e compartilhadas pela classe.
+    PASSO_TABELA_FLUXO = 0.1
+    _tabela_fluxo = {}
+
+    def _montar_fatia_fluxo(self, hr, cl):
+        eixo = np.arange(0.0, 10.0 + self.PASSO_TABELA_FLUXO / 2, self.PASSO_TABELA_FLUXO)
+        cf, pf = np.meshgrid(eixo, eixo, indexing='ij')
+        tempos = self.calcular_tempos_vetorizado(cf.ravel(), pf.ravel(), np.full(cf.size, hr), np.full(cf.size, cl))
+        # listas aninhadas [carros][pedestres]: indexação escalar barata
+        fatia = FuzzyControlador._tabela_fluxo[(hr, cl)] = tempos.reshape(cf.shape).tolist()
+        return fatia
+
+    def montar_tabela_fluxo(self):
+        """Monta as fatias que faltam (3 horários x 3 climas), fora do loop: cada uma custa ~0,1 s."""
+        for hr in (0.0, 1.0, 2.0):
+            for cl in (0.0, 1.0, 2.0):
+                if (hr, cl) not in FuzzyControlador._tabela_fluxo:
+                    self._montar_fatia_fluxo(hr, cl)
+
+    def tempo_por_fluxo(self, cf, pf, hr, cl):
+        """
+        Tempo recomendado para fluxos contínuos (0..10) pelo nó mais próximo da tabela: custo constante,
+        igual à inferência compilada com as entradas arredondadas a PASSO_TABELA_FLUXO. Sem interpolar
+        entre nós, porque a saída salta para TEMPO_FIXO_DEGRADADO onde nenhuma regra dispara.
+        Horário/clima fora de 0/1/2 caem na inferência vetorizada.
+        """
+        if hr not in (0.0, 1.0, 2.0) or cl not in (0.0, 1.0, 2.0):
+            return float(self.calcular_tempos_vetorizado(cf, pf, hr, cl)[0])
+        fatia = FuzzyControlador._tabela_fluxo.get((hr, cl))
+        if fatia is None:
+            fatia = self._montar_fatia_fluxo(hr, cl)
+        i = int(round(min(max(cf, 0.0), 10.0) / self.PASSO_TABELA_FLUXO))
+        j = int(round(min(max(pf, 0.0), 10.0) / self.PASSO_TABELA_FLUXO))
+        return fatia[i][j]
+
+    def tabela_tempos(self):
+        """
+        Pré-calcula o tempo recomendado para todas as combinações de rótulos (3x3x3x3).
+        Chave: (rotulo_fluxo_carros, rotulo_fluxo_pedestres, valor_horario, rotulo_clima).
+        """
+        tabela = {}
+        for rc in NIVEIS_DE_FLUXO:
+            for rp in NIVEIS_DE_FLUXO:
+                for hr in (0.0, 1.0, 2.0):
+                    for rcl in CLIMAS:
+                        tabela[(rc, rp, hr, rcl)] = self.calcular_tempo_a_partir_de_valores(
+                            self.mapear_rotulo_de_fluxo_para_valor(rc), self.mapear_rotulo_de_fluxo_para_valor(rp),
+                            hr, self.mapear_rotulo_climatico_para_valor(rcl))
+        return tabela
+
+    def impressao_digital(self):
+        """
+        SHA-256 dos parâmetros da lógica fuzzy: universos e MFs de cada termo, regras do tempo e
+        MFs/regras da prioridade de troca. Muda se qualquer parâmetro da base mudar.
+        """
+        h = hashlib.sha256()
+        for v in (self.fluxo_de_carros, self.fluxo_de_pedestres, self.horario, self.clima, self.tempo_semaforo):
+            h.update(v.label.encode("utf-8"))
+            h.update(np.ascontiguousarray(v.universe, dtype=np.float64).tobytes())
+            for termo, t in v.terms.items():
+                h.update(termo.encode("utf-8"))
+                h.update(np.ascontiguousarray(t.mf, dtype=np.float64).tobytes())
+        for regra in self.regras:
+            h.update(str(regra).encode("utf-8"))
+        prioridade = (self.MFS_PRIORIDADE, [(clausulas, consequente) for clausulas, consequente, _ in self.REGRAS_PRIORIDADE],
+                      self.PASSOS_TABELA_PRIORIDADE)
+        h.update(repr(prioridade).encode("utf-8"))
+        return h.hexdigest()
+
     def prioridade_de_computacao(self, num_carros_vermelha, tempo_verde, num_pedestres_esperando=0):
         """
         Método compatível usado pelo ControladorSemaforo.
-        Retorna: (prioridade_float [0..10], ativacoes_list).
-        Implementação heurística simples para manter compatibilidade com a lógica existente.
+        Retorna: (prioridade_float [0..10], ativacoes_list) com as ativações das regras de prioridade.
         """
-        # normaliza entradas (assume carros até 10, tempo até 30s, pedestres até 6)
-        c = max(0.0, min(10.0, float(num_carros_vermelha)))
-        t = max(0.0, min(30.0, float(tempo_verde)))
-        p = max(0.0, min(6.0, float(num_pedestres_esperando)))
-
-        # heurística: combina componentes (pesos ajustáveis)
-        w_c, w_t, w_p = 0.6, 0.2, 0.2
-        prioridade_norm = w_c * (c / 10.0) + w_t * (t / 30.0) + w_p * (p / 6.0)
-        prioridade = float(max(0.0, min(10.0, prioridade_norm * 10.0)))
-
-        ativacoes = [
-            ("componente_carro", float(w_c * (c / 10.0))),
-            ("componente_tempo", float(w_t * (t / 30.0))),
-            ("componente_pedestres", float(w_p * (p / 6.0))),
-        ]
-        return prioridade, ativacoes
+        return (self.prioridade_tabelada(num_carros_vermelha, tempo_verde, num_pedestres_esperando),
+                self.ativacoes_prioridade(num_carros_vermelha, tempo_verde, num_pedestres_esperando))
+
+    def _entradas_prioridade(self, num_carros_vermelha, tempo_verde, num_pedestres_esperando):
+        # limita aos universos (carros até 10, tempo até 30s, pedestres até 6)
+        return [min(max(float(x), 0.0), limite) for x, limite in
+                zip((num_carros_vermelha, tempo_verde, num_pedestres_esperando), self._limites_prioridade)]
+
+    def prioridade_tabelada(self, num_carros_vermelha, tempo_verde, num_pedestres_esperando=0):
+        """Prioridade pela tabela compilada: interpolação trilinear entre os 8 nós vizinhos (custo constante)."""
+        entradas = self._entradas_prioridade(num_carros_vermelha, tempo_verde, num_pedestres_esperando)
+        posicoes = [x / passo for x, passo in zip(entradas, self.PASSOS_TABELA_PRIORIDADE)]
+        (i, j, k) = [min(int(pos), ultimo) for pos, ultimo in zip(posicoes, self._ultimo_no_prioridade)]
+        fi, fj, fk = posicoes[0] - i, posicoes[1] - j, posicoes[2] - k
+        tab = self._tabela_prioridade
+        prioridade = 0.0
+        for plano, wi in ((tab[i], 1.0 - fi), (tab[i + 1], fi)):
+            if wi == 0.0:
+                continue
+            for linha, wj in ((plano[j], 1.0 - fj), (plano[j + 1], fj)):
+                if wj == 0.0:
+                    continue
+                prioridade += wi * wj * (linha[k] * (1.0 - fk) + linha[k + 1] * fk)
+        return prioridade
+
+    def ativacoes_prioridade(self, num_carros_vermelha, tempo_verde, num_pedestres_esperando=0):
+        """Lista de (descricao_regra, grau) das regras de prioridade: mínimo no E, máximo no OU."""
+        entradas = self._entradas_prioridade(num_carros_vermelha, tempo_verde, num_pedestres_esperando)
+        trimf = self._trimf_escalar
+        graus = [trimf(entradas[e], abc) for e, abc in self._termos_prioridade]
+        ativacoes = []
+        for descricao, clausulas in self._regras_prioridade_escalar:
+            grau = 0.0
+            for clausula in clausulas:
+                grau = max(grau, min([graus[t] for t in clausula]))
+            ativacoes.append((descricao, grau))
+        return ativacoes
 
     def avaliar_regras(self, rotulo_fluxo_carros, rotulo_fluxo_pedestres, hora_str, rotulo_clima):
         """
@@ -351,9 +737,254 @@ class FuzzyControlador:
         # 9
         graus.append( float(np.fmin(carros_medio, hora_outro)) )
 
+        self.contar_disparos(np.array(graus))
         ativacoes = list(zip(self.descricoes_regra, graus))
         return ativacoes
 
+    def contar_disparos(self, graus):
+        """Acumula nos contadores as regras com grau > 0 (graus: (9,) ou (n, 9))."""
+        graus = np.asarray(graus).reshape(-1, len(self.regras))
+        self.disparos_regras += (graus > 0).sum(axis=0)
+        self.avaliacoes_regras += len(graus)
+
+    def resumo_disparos(self):
+        if self.avaliacoes_regras == 0:
+            return "nenhuma avaliação"
+        return " ".join(f"{i + 1}:{100.0 * d / self.avaliacoes_regras:.0f}%" for i, d in enumerate(self.disparos_regras)) + f" (n={self.avaliacoes_regras})"
+
+    # --- avaliação vetorizada (vários pontos de entrada numa única passada numpy) ---
+    # consequente de cada regra, na mesma ordem de descricoes_regra
+    CONSEQUENTES_REGRA = ['Alto', 'Médio', 'Baixo', 'Médio', 'Alto', 'Alto', 'Baixo', 'Médio', 'Médio']
+
+    def graus_regras_vetorizado(self, cf, pf, hr, cl):
+        """
+        Graus de ativação das regras para vetores de entradas numéricas (mesmos valores usados
+        em calcular_tempo_a_partir_de_valores). Retorna array (n, 9) na ordem de descricoes_regra.
+        """
+        def pertinencias(var, valores):
+            # como o ControlSystemSimulation (clip_to_bounds): entradas fora do universo são saturadas
+            u = var.universe
+            x = np.clip(np.atleast_1d(np.asarray(valores, dtype=np.float64)), u.min(), u.max())
+            return {termo: np.interp(x, u, var[termo].mf) for termo in var.terms}
+
+        carros = pertinencias(self.fluxo_de_carros, cf)
+        ped = pertinencias(self.fluxo_de_pedestres, pf)
+        hora = pertinencias(self.horario, hr)
+        clima = pertinencias(self.clima, cl)
+
+        graus = np.stack([
+            np.fmin(carros['Alto'], hora['Pico']),
+            np.fmin(np.fmin(carros['Médio'], ped['Médio']), hora['Normal']),
+            np.fmax(carros['Baixo'], ped['Baixo']),
+            np.fmin(np.fmin(carros['Alto'], ped['Alto']), hora['Normal']),
+            np.fmin(np.fmin(carros['Alto'], ped['Alto']), hora['Pico']),
+            np.fmin(carros['Alto'], clima['Chuvoso']),
+            np.fmin(np.fmin(carros['Baixo'], ped['Baixo']), hora['Outro']),
+            np.fmin(carros['Baixo'], ped['Alto']),
+            np.fmin(carros['Médio'], hora['Outro']),
+        ], axis=-1)
+        self.contar_disparos(graus)
+        return graus
+
+    def defuzzificar_vetorizado(self, cortes):
+        """
+        Centróide da saída agregada para n conjuntos de cortes ({termo: array (n,)}), reproduzindo o
+        ControlSystemSimulation: o universo é reamostrado nos pontos onde cada termo cruza o seu corte
+        e a área é integrada exatamente entre pontos consecutivos. Sem área (nenhuma regra ativa) -> 12.0,
+        o mesmo fallback de calcular_tempo_a_partir_de_valores.
+        """
+        u = self.tempo_semaforo.universe.astype(np.float64)
+        n = len(next(iter(cortes.values())))
+        pontos = [np.broadcast_to(u, (n, len(u)))]
+        for termo, corte in cortes.items():
+            mf = self.tempo_semaforo[termo].mf.astype(np.float64)
+            c = corte[:, None]
+            acima = np.where(c == 0.0, mf > c, mf >= c)
+            cruza = acima[:, 1:] != acima[:, :-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x = u[:-1] + (c - mf[:-1]) * (u[1:] - u[:-1]) / (mf[1:] - mf[:-1])
+            # segmentos sem cruzamento viram um ponto repetido do universo (largura zero, não soma área)
+            pontos.append(np.where(cruza, x, u[0]))
+        x = np.sort(np.concatenate(pontos, axis=1), axis=1)
+
+        y = np.zeros_like(x)
+        for termo, corte in cortes.items():
+            np.maximum(y, np.minimum(corte[:, None], np.interp(x, u, self.tempo_semaforo[termo].mf)), out=y)
+
+        x1, x2, y1, y2 = x[:, :-1], x[:, 1:], y[:, :-1], y[:, 1:]
+        area = 0.5 * (x2 - x1) * (y1 + y2)
+        # momento exato de um trapézio (equivale à soma retângulo/triângulo do skfuzzy)
+        momento = (x2 - x1) * (x1 * (2.0 * y1 + y2) + x2 * (y1 + 2.0 * y2)) / 6.0
+        area_total = area.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tempos = momento.sum(axis=1) / area_total
+        return np.where(area_total > 0.0, tempos, TEMPO_FIXO_DEGRADADO)
+
+    def calcular_tempos_vetorizado(self, cf, pf, hr, cl, graus=None):
+        """
+        Versão vetorizada de calcular_tempo_a_partir_de_valores: entradas numéricas (escalares ou
+        arrays do mesmo tamanho) -> array de tempos recomendados, numa única passada.
+        Sem `graus`, usa a base compilada (só as cláusulas que podem mudar o resultado).
+        """
+        if graus is None:
+            return self.defuzzificar_vetorizado(self.compiladas.cortes(cf, pf, hr, cl))
+        graus = graus.reshape(-1, len(self.CONSEQUENTES_REGRA))
+        cortes = {}
+        for termo in self.tempo_semaforo.terms:
+            colunas = [i for i, c in enumerate(self.CONSEQUENTES_REGRA) if c == termo]
+            # acumulação das regras de mesmo consequente: máximo (padrão do skfuzzy)
+            cortes[termo] = graus[:, colunas].max(axis=1) if colunas else np.zeros(len(graus))
+        return self.defuzzificar_vetorizado(cortes)
+
+class RegrasCompiladas:
+    """
+    Compila a base de regras do FuzzyControlador. Cada antecedente vira uma disjunção de cláusulas
+    (conjunções de "variável é termo"); com min no E e max no OU e na acumulação, o corte de cada termo
+    de saída é o máximo, sobre as cláusulas das regras com esse consequente, do mínimo das pertinências.
+    Na compilação:
+      - cláusulas que nunca disparam (grau 0 em todo o universo) são removidas (regra morta);
+      - cláusulas iguais são unidas (regra duplicada);
+      - uma cláusula que contém outra do mesmo consequente é removida (absorção: grau menor ou igual
+        sempre, não altera o máximo) — regra subsumida;
+      - as regras de mesmo consequente viram um único grupo de cláusulas.
+    O resultado é exato; `verificacao_max_erro` compara os cortes com os da base original.
+    A checagem de "nunca dispara" usa a grade dos universos com os pontos médios das células: com
+    pertinências lineares por célula, o mínimo é côncavo na célula e, se for positivo em algum ponto,
+    é positivo no centro.
+    """
+    def __init__(self, fuzzy_brain):
+        self.fuzzy_brain = fuzzy_brain
+        self.variaveis = {v.label: v for v in (fuzzy_brain.fluxo_de_carros, fuzzy_brain.fluxo_de_pedestres, fuzzy_brain.horario, fuzzy_brain.clima)}
+        self.ordem_entradas = list(self.variaveis)
+        regras = fuzzy_brain.regras
+        self.consequentes = [r.consequent[0].term.label for r in regras]
+        self.clausulas_regra = [self._clausulas(r.antecedent) for r in regras]
+
+        # grade refinada (pontos do universo + pontos médios) para a checagem de disparo
+        eixos = []
+        for v in self.variaveis.values():
+            u = v.universe.astype(np.float64)
+            eixos.append(np.union1d(u, (u[:-1] + u[1:]) / 2.0))
+        malha = np.meshgrid(*eixos, indexing='ij')
+        self._grade = [m.ravel() for m in malha]
+
+        self.mortas, self.duplicadas, self.subsumidas = [], [], []  # (regra, motivo) com índices base 1
+        grupos = {}   # termo de saída -> {cláusula: regra de origem}
+        for i, (termo, clausulas) in enumerate(zip(self.consequentes, self.clausulas_regra)):
+            vivas = [c for c in clausulas if self._grau_clausula(c, self._grade).max() > 0.0]
+            if not vivas:
+                self.mortas.append((i + 1, "nunca dispara no universo"))
+                continue
+            grupo = grupos.setdefault(termo, {})
+            novas = [c for c in vivas if c not in grupo]
+            if not novas:
+                self.duplicadas.append((i + 1, f"igual à regra {grupo[vivas[0]] + 1}"))
+                continue
+            for c in novas:
+                grupo[c] = i
+        # absorção dentro de cada grupo: remove cláusulas que contêm outra
+        for termo, grupo in grupos.items():
+            for c in sorted(grupo, key=len, reverse=True):
+                if any(o < c for o in grupo):
+                    del grupo[c]
+        sobreviventes = {i for grupo in grupos.values() for i in grupo.values()}
+        ja_listadas = {r for r, _ in self.mortas + self.duplicadas}
+        for i, termo in enumerate(self.consequentes):
+            if i not in sobreviventes and i + 1 not in ja_listadas:
+                dominante = next((j for c in self.clausulas_regra[i] for o, j in grupos.get(termo, {}).items() if o <= c), None)
+                self.subsumidas.append((i + 1, f"contida na regra {dominante + 1}" if dominante is not None else "absorvida"))
+
+        # avaliador mínimo: literais usados, cláusulas (índices de literais) por termo de saída
+        self.grupos = {termo: sorted(grupo, key=lambda c: grupo[c]) for termo, grupo in grupos.items()}
+        self.literais = sorted({lit for clausulas in self.grupos.values() for c in clausulas for lit in c},
+                               key=lambda lit: (self.ordem_entradas.index(lit[0]), lit[1]))
+        indice = {lit: k for k, lit in enumerate(self.literais)}
+        self._clausulas_idx = {termo: [[indice[lit] for lit in c] for c in clausulas] for termo, clausulas in self.grupos.items()}
+        self.verificacao_max_erro = self._verificar()
+
+        # regras sem disparo nas combinações de rótulos que o ambiente realmente produz
+        rotulos = (NIVEIS_DE_FLUXO, NIVEIS_DE_FLUXO, ("03:00:00", "12:00:00", "08:00:00"), CLIMAS)  # horas: Outro, Normal, Pico
+        pontos = [fuzzy_brain.valores_do_ambiente(*combinacao) for combinacao in itertools.product(*rotulos)]
+        discretas = [np.array(coluna, dtype=np.float64) for coluna in zip(*pontos)]
+        self.sem_disparo_rotulos = [i + 1 for i, clausulas in enumerate(self.clausulas_regra)
+                                    if max(self._grau_clausula(c, discretas).max() for c in clausulas) <= 0.0]
+        self.combinacoes_rotulos = len(pontos)
+
+    def _clausulas(self, termo):
+        """Antecedente (Term/TermAggregate com and/or) -> lista de frozensets de (variável, termo)."""
+        if isinstance(termo, ctrl.term.TermAggregate):
+            if termo.kind == 'not':
+                raise ValueError("RegrasCompiladas: negação não suportada")
+            a, b = self._clausulas(termo.term1), self._clausulas(termo.term2)
+            if termo.kind == 'or':
+                return list(dict.fromkeys(a + b))
+            return list(dict.fromkeys(x | y for x in a for y in b))
+        return [frozenset([(termo.parent.label, termo.label)])]
+
+    def _pertinencia(self, literal, x):
+        var = self.variaveis[literal[0]]
+        u = var.universe
+        return np.interp(np.clip(x, u.min(), u.max()), u, var[literal[1]].mf)
+
+    def _grau_clausula(self, clausula, entradas):
+        graus = [self._pertinencia(lit, entradas[self.ordem_entradas.index(lit[0])]) for lit in clausula]
+        return np.minimum.reduce(graus)
+
+    def _cortes_originais(self, entradas):
+        """Cortes por termo de saída com a base original completa (referência)."""
+        n = len(entradas[0])
+        cortes = {t: np.zeros(n) for t in self.fuzzy_brain.tempo_semaforo.terms}
+        for termo, clausulas in zip(self.consequentes, self.clausulas_regra):
+            for c in clausulas:
+                np.maximum(cortes[termo], self._grau_clausula(c, entradas), out=cortes[termo])
+        return cortes
+
+    def _verificar(self):
+        rng = np.random.default_rng(0)
+        aleatorias = [rng.uniform(v.universe.min(), v.universe.max(), 5000) for v in self.variaveis.values()]
+        erro = 0.0
+        for entradas in (self._grade, aleatorias):
+            compilados, originais = self.cortes(*entradas), self._cortes_originais(entradas)
+            erro = max(erro, max(float(np.abs(compilados[t] - originais[t]).max()) for t in originais))
+        return erro
+
+    def cortes(self, cf, pf, hr, cl):
+        """Cortes {termo de saída: array (n,)} para entradas numéricas (escalares ou arrays)."""
+        entradas = [np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (cf, pf, hr, cl)]
+        n = max(len(x) for x in entradas)
+        m = np.empty((n, len(self.literais)))
+        for k, lit in enumerate(self.literais):
+            m[:, k] = self._pertinencia(lit, entradas[self.ordem_entradas.index(lit[0])])
+        cortes = {}
+        for termo in self.fuzzy_brain.tempo_semaforo.terms:
+            clausulas = self._clausulas_idx.get(termo)
+            if not clausulas:
+                cortes[termo] = np.zeros(n)
+                continue
+            corte = m[:, clausulas[0]].min(axis=1)
+            for c in clausulas[1:]:
+                np.maximum(corte, m[:, c].min(axis=1), out=corte)
+            cortes[termo] = corte
+        return cortes
+
+    def relatorio(self):
+        total = sum(len(c) for c in self.clausulas_regra)
+        linhas = [f"Base original: {len(self.consequentes)} regras, {total} cláusulas, "
+                  f"{len({l for cs in self.clausulas_regra for c in cs for l in c})} literais"]
+        for titulo, itens in (("Mortas", self.mortas), ("Duplicadas", self.duplicadas), ("Subsumidas", self.subsumidas)):
+            linhas.append(f"{titulo}: " + (", ".join(f"regra {r} ({motivo})" for r, motivo in itens) if itens else "nenhuma"))
+        linhas.append(f"Base compilada: {sum(len(c) for c in self.grupos.values())} cláusulas, {len(self.literais)} literais")
+        for termo, clausulas in self.grupos.items():
+            texto = " OU ".join("(" + " E ".join(f"{v} é {t}" for v, t in sorted(c, key=lambda lit: self.ordem_entradas.index(lit[0]))) + ")" for c in clausulas)
+            linhas.append(f"  tempo {termo} <- {texto}")
+        linhas.append(f"Sem disparo nas {self.combinacoes_rotulos} combinações de rótulos do ambiente: "
+                      + (", ".join(f"regra {r}" for r in self.sem_disparo_rotulos) if self.sem_disparo_rotulos else "nenhuma"))
+        linhas.append(f"Verificação (grade + 5000 pontos aleatórios): maior diferença nos cortes = {self.verificacao_max_erro:.3g}")
+        disparos = self.fuzzy_brain.resumo_disparos()
+        linhas.append(f"Disparos em execução: {disparos}")
+        return "\n".join(linhas)
+
+
 class Semaforo:
     def __init__(self, x, y, orientacao='vertical'):
         self.x, self.y, self.orientacao = x, y, orientacao
@@ -364,18 +995,21 @@ class Semaforo:
         self.radius = 14
         self.padding = 8
 
-    def draw(self):
+    def draw(self, superficie=None):
+        # superficie: destino do desenho (padrão: a tela; uma Surface comum no render offscreen)
+        if superficie is None:
+            superficie = tela
         # posições base e retângulo da carcaça
         housing = pygame.Rect(self.x, self.y, self.housing_w, self.housing_h)
         inner = housing.inflate(-10, -10)
 
         # desenha sombra da carcaça
         shadow = pygame.Rect(housing.x + 4, housing.y + 6, housing.w, housing.h)
-        pygame.draw.rect(tela, (15, 15, 15, 60), shadow, border_radius=8)
+        pygame.draw.rect(superficie, (15, 15, 15, 60), shadow, border_radius=8)
 
         # carcaça externa e placa interna
-        pygame.draw.rect(tela, (20, 20, 20), housing, border_radius=8)
-        pygame.draw.rect(tela, (40, 40, 40), inner, border_radius=6)
+        pygame.draw.rect(superficie, (20, 20, 20), housing, border_radius=8)
+        pygame.draw.rect(superficie, (40, 40, 40), inner, border_radius=6)
 
         # haste/pólo
         if self.orientacao == 'vertical':
@@ -384,8 +1018,8 @@ class Semaforo:
         else:
             pole = pygame.Rect(housing.right, housing.centery - 6, 60, 12)
             pole_shadow = pygame.Rect(pole.x + 4, pole.y + 3, pole.w, pole.h)
-        pygame.draw.rect(tela, (20, 20, 20), pole_shadow, border_radius=6)
-        pygame.draw.rect(tela, (60, 60, 60), pole, border_radius=6)
+        pygame.draw.rect(superficie, (20, 20, 20), pole_shadow, border_radius=6)
+        pygame.draw.rect(superficie, (60, 60, 60), pole, border_radius=6)
 
         # calcula centros das lâmpadas na ordem (vermelho, amarelo, verde)
         if self.orientacao == 'vertical':
@@ -420,32 +1054,41 @@ class Semaforo:
                 brilho_s = pygame.Surface((self.radius*6, self.radius*6), pygame.SRCALPHA)
                 brilho_col = (*col_on[st], 90)
                 pygame.draw.circle(brilho_s, brilho_col, (self.radius*3, self.radius*3), int(self.radius*2.6))
-                tela.blit(brilho_s, (center[0] - self.radius*3, center[1] - self.radius*3))
+                superficie.blit(brilho_s, (center[0] - self.radius*3, center[1] - self.radius*3))
 
             # lente com leve gradiente (simulado por dois círculos)
-            pygame.draw.circle(tela, (10,10,10), center, self.radius+2)  # borda escura
-            pygame.draw.circle(tela, base_cor, center, self.radius)
+            pygame.draw.circle(superficie, (10,10,10), center, self.radius+2)  # borda escura
+            pygame.draw.circle(superficie, base_cor, center, self.radius)
             # highlight frontal pequeno
             highlight = pygame.Surface((self.radius*2, self.radius*2), pygame.SRCALPHA)
             pygame.draw.circle(highlight, (255,255,255,60), (int(self.radius*0.6), int(self.radius*0.6)), int(self.radius*0.6))
-            tela.blit(highlight, (center[0]-self.radius, center[1]-self.radius))
+            superficie.blit(highlight, (center[0]-self.radius, center[1]-self.radius))
 
         # pequeno detalhe: para vertical desenha um parafuso/placa
         screw_color = (30, 30, 30)
         if self.orientacao == 'vertical':
-            pygame.draw.circle(tela, screw_color, (housing.centerx - 12, housing.centery), 3)
-            pygame.draw.circle(tela, screw_color, (housing.centerx + 12, housing.centery), 3)
+            pygame.draw.circle(superficie, screw_color, (housing.centerx - 12, housing.centery), 3)
+            pygame.draw.circle(superficie, screw_color, (housing.centerx + 12, housing.centery), 3)
         else:
-            pygame.draw.circle(tela, screw_color, (housing.centerx, housing.centery - 12), 3)
-            pygame.draw.circle(tela, screw_color, (housing.centerx, housing.centery + 12), 3)
+            pygame.draw.circle(superficie, screw_color, (housing.centerx, housing.centery - 12), 3)
+            pygame.draw.circle(superficie, screw_color, (housing.centerx, housing.centery + 12), 3)
+
+CORES_CARRO = [(30,144,255), (220,20,60), (255,215,0), (60,179,113)]
 
 class Carro(pygame.sprite.Sprite):
-    def __init__(self, x, y, direcao):
+    # registro de tempos por agente (RegistroAgentes) e índice deste carro nele; definidos por Simulacao
+    registro = None
+    indice = None
+
+    def __init__(self, x, y, direcao, sensor_fila=None, cor=None):
         super().__init__()
         self.direcao = direcao
+        self.eixo = 'v' if direcao in ('pra_cima', 'pra_baixo') else 'h'
+        self.movimento = INDICE_MOVIMENTO[direcao]
         w, h = (20, 40) if direcao in ['pra_cima', 'pra_baixo'] else (40, 20)
         surf = pygame.Surface((w, h), pygame.SRCALPHA)
-        cor_carro = random.choice([(30,144,255), (220,20,60), (255,215,0), (60,179,113)])
+        cor_carro = cor if cor is not None else random.choice(CORES_CARRO)
+        self.cor = cor_carro
         pygame.draw.rect(surf, cor_carro, (0, 0, w, h), border_radius=4)
         pygame.draw.rect(surf, (0,0,0), (0,0,w,h), 2, border_radius=4)  # contorno
 
@@ -468,54 +1111,37 @@ class Carro(pygame.sprite.Sprite):
         self.rect = self.image.get_rect(topleft=(x, y))
         self.velocidade = 2
 
-    def update(self, cars_group, traffic_light_v, traffic_light_h):
+        # estado de fila mantido incrementalmente pelo SensorFilas (se houver)
+        self.sensor_fila = sensor_fila
+        self.na_fila = False
+        self.bloqueado_por_carro = False
+
+    def update(self, cars_group, estados):
+        # estados: vetor de estados por movimento do plano de fases (PlanoFases.estados)
         global carros_saíram, BLOQUEIO_PEDESTRES_VERT, BLOQUEIO_PEDESTRES_HORI
         pode_mover = True
         # calcula deslocamento
         dx = (1 if self.direcao == 'direita' else -1 if self.direcao == 'esquerda' else 0) * self.velocidade
         dy = (1 if self.direcao == 'pra_baixo' else -1 if self.direcao == 'pra_cima' else 0) * self.velocidade
 
-        # --- Evitar parada SOBRE as faixas: calcula posições seguras de parada usando constantes de faixa ---
-        # faixa norte (quem vem de cima - 'pra_baixo')
-        topo_norte_cruzado = PARADA_EMBAIXO_MIN - CW_GAP - CW_THICKNESS
-        # aproxima ponto de parada para ficar mais perto da faixa (reduz folga)
-        parada_segura_embaixo = topo_norte_cruzado + 2  # antes: -4, agora mais próximo
-
-        # faixa sul (quem vem de baixo - 'pra_cima')
-        topo_cruzado_sul = PARADA_CIMA_MIN + CW_GAP
-        cruz_sul_inferior = topo_cruzado_sul + CW_THICKNESS
-        parada_segura_cima = cruz_sul_inferior + 4
-
-        # faixa oeste (quem vem da esquerda - 'direita')
-        cruz_oeste_esquerda = PARADA_DIREITA_MIN - CW_GAP - CW_THICKNESS
-        # aproxima ponto de parada vindo da esquerda para alinhar com faixas da direita/baixo
-        parada_segura_direita = cruz_oeste_esquerda + 2  # antes: -4, agora mais próximo
-
-        # faixa leste (quem vem da direita - 'esquerda')
-        cruz_leste_esquerda = PARADA_ESQUERDA_MIN + CW_GAP
-        cruz_leste_direita = cruz_leste_esquerda + CW_THICKNESS
-        parada_segura_esquerda = cruz_leste_direita + 4
-
-        # checa semáforo / posições de parada sem invadir faixas
-        if self.direcao == 'pra_baixo' and traffic_light_v.estado != 'verde':
-            # impede mover para dentro da área da faixa norte
-            if (self.rect.bottom + dy) > parada_segura_embaixo and self.rect.bottom <= PARADA_EMBAIXO_MAX:
-                pode_mover = False
-
-        if self.direcao == 'pra_cima' and traffic_light_v.estado != 'verde':
-            # impede mover para dentro da área da faixa sul
-            if (self.rect.top + dy) < parada_segura_cima and self.rect.top >= PARADA_CIMA_MIN:
-                pode_mover = False
-
-        if self.direcao == 'direita' and traffic_light_h.estado != 'verde':
-            # impede mover para dentro da área da faixa oeste
-            if (self.rect.right + dx) > parada_segura_direita and self.rect.right <= PARADA_DIREITA_MAX:
-                pode_mover = False
-
-        if self.direcao == 'esquerda' and traffic_light_h.estado != 'verde':
-            # impede mover para dentro da área da faixa leste
-            if (self.rect.left + dx) < parada_segura_esquerda and self.rect.left >= PARADA_ESQUERDA_MIN:
-                pode_mover = False
+        # checa semáforo (uma leitura no vetor do plano) / posições seguras de parada (PARADA_SEGURA_*) sem invadir faixas
+        if estados[self.movimento] != VERDE:
+            if self.direcao == 'pra_baixo':
+                # impede mover para dentro da área da faixa norte
+                if (self.rect.bottom + dy) > PARADA_SEGURA_EMBAIXO and self.rect.bottom <= PARADA_EMBAIXO_MAX:
+                    pode_mover = False
+            elif self.direcao == 'pra_cima':
+                # impede mover para dentro da área da faixa sul
+                if (self.rect.top + dy) < PARADA_SEGURA_CIMA and self.rect.top >= PARADA_CIMA_MIN:
+                    pode_mover = False
+            elif self.direcao == 'direita':
+                # impede mover para dentro da área da faixa oeste
+                if (self.rect.right + dx) > PARADA_SEGURA_DIREITA and self.rect.right <= PARADA_DIREITA_MAX:
+                    pode_mover = False
+            else:
+                # impede mover para dentro da área da faixa leste
+                if (self.rect.left + dx) < PARADA_SEGURA_ESQUERDA and self.rect.left >= PARADA_ESQUERDA_MIN:
+                    pode_mover = False
 
         # bloqueio por pedestres: se houver pedestres atravessando impactando este eixo, bloqueia carros na área de fila
         # vertical cars (pra_cima/pra_baixo) são impactados por BLOQUEIO_PEDESTRES_VERT
@@ -531,21 +1157,45 @@ class Carro(pygame.sprite.Sprite):
 
         # checa colisão futura com outro carro (bloqueio)
         proxima_reta = self.rect.move(dx, dy)
-        for other in cars_group:
-            if other is self: continue
-            if proxima_reta.colliderect(other.rect):
-                pode_mover = False
-                break
+        bloqueado_por_carro = False
+        retangulos = getattr(cars_group, 'retangulos', None)
+        if retangulos is not None:
+            # lista dos rects vivos montada pela Simulacao a cada frame (os objetos Rect andam junto com os carros)
+            for i in proxima_reta.collidelistall(retangulos):
+                if retangulos[i] is not self.rect:
+                    pode_mover = False
+                    bloqueado_por_carro = True
+                    break
+        else:
+            for other in cars_group:
+                if other is self: continue
+                if proxima_reta.colliderect(other.rect):
+                    pode_mover = False
+                    bloqueado_por_carro = True
+                    break
 
         # movimento
         if pode_mover:
             self.rect.move_ip(dx, dy)
+        if self.registro is not None:
+            self.registro.movimento(self.indice, pode_mover)
 
         # remove fora da tela
         if not tela.get_rect().colliderect(self.rect):
             # conta como saída antes de remover
             carros_saíram += 1
+            if self.sensor_fila is not None:
+                self.sensor_fila.remover(self)
+            if self.registro is not None:
+                self.registro.saida(self.indice)
+            if retangulos is not None:
+                for i, r in enumerate(retangulos):
+                    if r is self.rect:
+                        del retangulos[i]
+                        break
             self.kill()
+        elif self.sensor_fila is not None:
+            self.sensor_fila.atualizar(self, pode_mover, bloqueado_por_carro)
 
 class Pedestre(pygame.sprite.Sprite):
     """
@@ -555,9 +1205,13 @@ class Pedestre(pygame.sprite.Sprite):
      - 'v_r' = faixa direita horizontal (vem da direita)
      - 'v_l' = faixa esquerda horizontal (vem da esquerda)
     """
+    registro = None
+    indice = None
+
     def __init__(self, orientacao):
         super().__init__()
         self.orientacao = orientacao
+        self.movimento = INDICE_MOVIMENTO[orientacao]
         self.velocidade = 1.6
         self.esperando = True
         self.atravessando = False
@@ -603,19 +1257,15 @@ class Pedestre(pygame.sprite.Sprite):
         self.image = surf
         self.rect = self.image.get_rect(center=(int(self.pos.x), int(self.pos.y)))
 
-    def update(self, luz_vertical, luz_horizontal):
-        # decide se pode iniciar travessia: somente quando o tráfego PERPENDICULAR estiver RED
+    def update(self, estados):
+        # decide se pode iniciar travessia: somente com verde para a faixa no plano de fases
+        # (o plano garante que o tráfego que cruza a faixa está vermelho — MATRIZ_CONFLITOS)
         if self.esperando:
-            if self.orientacao in ('h_n', 'h_s'):
-                # esses atravessam a via vertical -> precisam que luz_vertical seja RED
-                if luz_vertical.estado == 'vermelho':
-                    self.esperando = False
-                    self.atravessando = True
-            else:
-                # atravessam a via horizontal -> precisam que luz_horizontal seja RED
-                if luz_horizontal.estado == 'vermelho':
-                    self.esperando = False
-                    self.atravessando = True
+            if estados[self.movimento] == VERDE:
+                self.esperando = False
+                self.atravessando = True
+            if self.registro is not None:
+                self.registro.movimento(self.indice, self.atravessando)
 
         if self.atravessando:
             # move em direção ao alvo
@@ -630,81 +1280,523 @@ class Pedestre(pygame.sprite.Sprite):
 
             # remove ao terminar travessia
             if (self.pos - self.alvo).length() < 2:
+                if self.registro is not None:
+                    self.registro.saida(self.indice)
                 self.kill()
 
+# --- LATÊNCIA DAS DECISÕES ---
+class HistogramaLatencia:
+    """Histograma de latências com faixas fixas (ms): contagens, média, máximo e percentis aproximados."""
+    LIMITES_MS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 33.0, 66.0, 133.0, float("inf"))
+
+    def __init__(self):
+        self.contagens = [0] * len(self.LIMITES_MS)
+        self.n = 0
+        self.soma_s = 0.0
+        self.max_s = 0.0
+
+    def registrar(self, latencia_s):
+        self.contagens[bisect.bisect_left(self.LIMITES_MS, latencia_s * 1000.0)] += 1
+        self.n += 1
+        self.soma_s += latencia_s
+        if latencia_s > self.max_s:
+            self.max_s = latencia_s
+
+    def media_ms(self):
+        return 1000.0 * self.soma_s / self.n if self.n else 0.0
+
+    def percentil_ms(self, p):
+        """Limite superior da faixa que contém o percentil p (0..100); o máximo se cair na última faixa."""
+        if self.n == 0:
+            return 0.0
+        alvo = p / 100.0 * self.n
+        acumulado = 0
+        for limite, c in zip(self.LIMITES_MS, self.contagens):
+            acumulado += c
+            if acumulado >= alvo:
+                return min(limite, self.max_s * 1000.0)
+        return self.max_s * 1000.0
+
+    def resumo(self):
+        return f"n={self.n} média={self.media_ms():.3f}ms p50<={self.percentil_ms(50):.3f}ms p99<={self.percentil_ms(99):.3f}ms máx={self.max_s * 1000.0:.3f}ms"
+
+
+# --- INFERÊNCIA FUZZY ASSÍNCRONA ---
+# decisão concluída: entradas (chave), tempo recomendado, graus das regras e instantes (perf_counter)
+DecisaoFuzzy = namedtuple("DecisaoFuzzy", ["chave", "tempo", "regras", "pedido_em", "concluido_em"])
+
+
+def calcular_decisao(fuzzy_brain, chave, rotulos, pedido_em):
+    """Executa a inferência do tempo recomendado + graus das regras para os rótulos (carros, pedestres, hora, clima)."""
+    tempo = float(fuzzy_brain.calcular_tempos_vetorizado(*fuzzy_brain.valores_do_ambiente(*rotulos))[0])
+    regras = fuzzy_brain.avaliar_regras(*rotulos)
+    return DecisaoFuzzy(chave, tempo, regras, pedido_em, time.perf_counter())
+
+
+def calcular_decisao_medida(fuzzy_brain, chave, rotulos, pedido_em):
+    """Como calcular_decisao, para fluxos medidos (números 0..10 nos rótulos): tempo pela tabela de fluxo."""
+    tempo = fuzzy_brain.tempo_por_fluxo(*fuzzy_brain.valores_do_ambiente(*rotulos))
+    regras = fuzzy_brain.avaliar_regras(*rotulos)
+    return DecisaoFuzzy(chave, tempo, regras, pedido_em, time.perf_counter())
+
+
+class TrabalhadorInferencia:
+    """
+    Roda calcular_decisao em uma thread separada para não travar o loop de frames: tempo recomendado pela
+    base compilada (calcular_tempos_vetorizado, sem o skfuzzy, que fica só como referência) e graus das regras.
+    Pedidos entram numa fila de tamanho 1 (o mais recente substitui o pendente) e cada resultado
+    é escrito no slot livre de um buffer duplo; o loop só lê o slot publicado, sem bloquear.
+    """
+    def __init__(self, fuzzy_brain):
+        self.fuzzy_brain = fuzzy_brain
+        self._pedidos = queue.Queue(maxsize=1)
+        self._slots = [None, None]
+        self._publicado = 0  # índice do slot com a última decisão concluída
+        self.erros = 0
+        self._thread = threading.Thread(target=self._executar, name="inferencia-fuzzy", daemon=True)
+        self._thread.start()
+
+    def solicitar(self, chave, rotulos):
+        self._enfileirar((chave, rotulos, time.perf_counter()))
+
+    def _enfileirar(self, pedido):
+        try:
+            self._pedidos.put_nowait(pedido)
+        except queue.Full:
+            # descarta o pedido pendente (desatualizado); só esta thread insere na fila
+            try:
+                self._pedidos.get_nowait()
+            except queue.Empty:
+                pass
+            self._pedidos.put_nowait(pedido)
+
+    def ultima_decisao(self):
+        return self._slots[self._publicado]
+
+    def _executar(self):
+        while True:
+            pedido = self._pedidos.get()
+            if pedido is None:
+                break
+            chave, rotulos, pedido_em = pedido
+            try:
+                decisao = calcular_decisao(self.fuzzy_brain, chave, rotulos, pedido_em)
+            except Exception as e:
+                # mantém a última decisão publicada
+                print("Erro na inferência assíncrona:", e)
+                self.erros += 1
+                continue
+            livre = 1 - self._publicado
+            self._slots[livre] = decisao
+            self._publicado = livre
+
+    def parar(self):
+        # None encerra a thread (descarta qualquer pedido pendente)
+        self._enfileirar(None)
+        self._thread.join(timeout=1.0)
+
+
+# --- PLANO DE FASES ---
+# códigos inteiros do estado de cada movimento (índices de ESTADOS_LUZ)
+VERMELHO, AMARELO, VERDE = 0, 1, 2
+# intervalos de uma fase: verde (duração decidida pelo controlador ou fixa), amarelo e vermelho total
+INTERVALO_VERDE, INTERVALO_AMARELO, INTERVALO_VERMELHO_TOTAL = 0, 1, 2
+
+# movimentos da interseção: os 4 de passagem dos carros e as 4 faixas (mesma ordem de GRUPOS_AGENTES),
+# mais as conversões à esquerda protegidas dos planos de 3-4 fases (nenhum carro da simulação converte)
+MOVIMENTOS = ['pra_baixo', 'pra_cima', 'direita', 'esquerda', 'h_n', 'h_s', 'v_r', 'v_l',
+              'conv_pra_baixo', 'conv_pra_cima', 'conv_direita', 'conv_esquerda']
+INDICE_MOVIMENTO = {m: i for i, m in enumerate(MOVIMENTOS)}
+MOVIMENTOS_PEDESTRES = ('h_n', 'h_s', 'v_r', 'v_l')
+# movimento mostrado por cada cabeça de semáforo desenhada (vertical, horizontal)
+CABECAS_LUZ = (INDICE_MOVIMENTO['pra_baixo'], INDICE_MOVIMENTO['direita'])
+
+# pares que não podem ter verde juntos (a matriz é simétrica; cada par aparece uma vez).
+# mão direita: conv_pra_baixo vem do norte e sai a leste, conv_direita vem do oeste e sai ao norte etc.
+# Faixas: h_n/h_s cruzam a via vertical nos braços norte/sul, v_r/v_l a horizontal nos braços leste/oeste;
+# um movimento conflita com as faixas dos braços por onde entra e sai.
+CONFLITOS_MOVIMENTOS = {
+    'pra_baixo': ('direita', 'esquerda', 'conv_pra_cima', 'conv_direita', 'conv_esquerda', 'h_n', 'h_s'),
+    'pra_cima': ('direita', 'esquerda', 'conv_pra_baixo', 'conv_direita', 'conv_esquerda', 'h_n', 'h_s'),
+    'direita': ('conv_pra_baixo', 'conv_pra_cima', 'conv_esquerda', 'v_r', 'v_l'),
+    'esquerda': ('conv_pra_baixo', 'conv_pra_cima', 'conv_direita', 'v_r', 'v_l'),
+    'conv_pra_baixo': ('conv_direita', 'conv_esquerda', 'h_n', 'v_r'),
+    'conv_pra_cima': ('conv_direita', 'conv_esquerda', 'h_s', 'v_l'),
+    'conv_direita': ('v_l', 'h_n'),
+    'conv_esquerda': ('v_r', 'h_s'),
+}
+
+
+def matriz_conflitos(conflitos=CONFLITOS_MOVIMENTOS):
+    """Matriz booleana simétrica len(MOVIMENTOS) x len(MOVIMENTOS): True onde os dois movimentos conflitam."""
+    n = len(MOVIMENTOS)
+    matriz = np.zeros((n, n), dtype=bool)
+    for movimento, outros in conflitos.items():
+        for outro in outros:
+            i, j = INDICE_MOVIMENTO[movimento], INDICE_MOVIMENTO[outro]
+            matriz[i, j] = matriz[j, i] = True
+    return matriz
+
+
+MATRIZ_CONFLITOS = matriz_conflitos()
+
+# planos declarativos. Cada fase: movimentos com verde e, opcionalmente, amarelo_s (2 s), vermelho_total_s (0),
+# verde_fixo_s (None = o controlador decide quando trocar) e travessia_no_amarelo (True: as faixas da fase
+# seguem liberadas durante o amarelo dos carros, como no cruzamento original)
+PLANO_DUAS_FASES = {
+    "nome": "2fases",
+    "fases": [
+        {"nome": "horizontal", "verde": ["direita", "esquerda", "h_n", "h_s"]},
+        {"nome": "vertical", "verde": ["pra_baixo", "pra_cima", "v_r", "v_l"]},
+    ],
+}
+PLANO_TRES_FASES = {
+    "nome": "3fases",
+    "fases": [
+        {"nome": "horizontal", "verde": ["direita", "esquerda"], "vermelho_total_s": 1.0},
+        {"nome": "vertical", "verde": ["pra_baixo", "pra_cima"], "vermelho_total_s": 1.0},
+        {"nome": "pedestres", "verde": list(MOVIMENTOS_PEDESTRES), "verde_fixo_s": 10.0, "vermelho_total_s": 1.0,
+         "travessia_no_amarelo": False},
+    ],
+}
+PLANO_QUATRO_FASES = {
+    "nome": "4fases",
+    "fases": [
+        {"nome": "horizontal", "verde": ["direita", "esquerda", "h_n", "h_s"], "vermelho_total_s": 1.0},
+        {"nome": "conversões horizontais", "verde": ["conv_direita", "conv_esquerda"], "verde_fixo_s": 6.0, "vermelho_total_s": 1.0},
+        {"nome": "vertical", "verde": ["pra_baixo", "pra_cima", "v_r", "v_l"], "vermelho_total_s": 1.0},
+        {"nome": "conversões verticais", "verde": ["conv_pra_baixo", "conv_pra_cima"], "verde_fixo_s": 6.0, "vermelho_total_s": 1.0},
+    ],
+}
+PLANOS = {p["nome"]: p for p in (PLANO_DUAS_FASES, PLANO_TRES_FASES, PLANO_QUATRO_FASES)}
+
+
+def carregar_plano(valor):
+    """Plano pelo nome (PLANOS) ou de um arquivo JSON no mesmo formato; valida compilando."""
+    if valor in PLANOS:
+        plano = PLANOS[valor]
+    else:
+        with open(valor, encoding="utf-8") as f:
+            plano = json.load(f)
+    PlanoFases(plano)
+    return plano
+
+
+class PlanoFases:
+    """
+    Plano de fases compilado em tabelas. O estado do sinal é um inteiro `codigo` = fase * 3 + intervalo
+    e, para cada código, há o vetor de estados por movimento (bytes indexados por INDICE_MOVIMENTO),
+    a duração do intervalo em frames (None no verde), o próximo código e os estados das duas cabeças
+    desenhadas. Saber se um movimento pode seguir é uma leitura: `plano.estados[movimento] == VERDE`.
+    Fases com movimentos em conflito (MATRIZ_CONFLITOS) são recusadas na compilação.
+    """
+    def __init__(self, plano):
+        fases = plano.get("fases") or []
+        if not fases:
+            raise ValueError("plano de fases sem fases")
+        self.nome = plano.get("nome", "personalizado")
+        self.nomes_fases = []
+        self.verde_fixo_s = []
+        self.tabela = []
+        self.duracoes = []
+        self.proximo = []
+        self.luzes = []
+        n = len(MOVIMENTOS)
+        for f, fase in enumerate(fases):
+            nome = fase.get("nome", str(f))
+            desconhecidos = [m for m in fase["verde"] if m not in INDICE_MOVIMENTO]
+            if desconhecidos:
+                raise ValueError(f"plano {self.nome}, fase {nome}: movimentos desconhecidos {desconhecidos}")
+            verdes = [INDICE_MOVIMENTO[m] for m in fase["verde"]]
+            for i, j in itertools.combinations(verdes, 2):
+                if MATRIZ_CONFLITOS[i, j]:
+                    raise ValueError(f"plano {self.nome}, fase {nome}: {MOVIMENTOS[i]} e {MOVIMENTOS[j]} em conflito")
+            travessia_no_amarelo = fase.get("travessia_no_amarelo", True)
+
+            verde = bytearray(n)
+            amarelo = bytearray(n)
+            for i in verdes:
+                verde[i] = VERDE
+                if MOVIMENTOS[i] in MOVIMENTOS_PEDESTRES:
+                    amarelo[i] = VERDE if travessia_no_amarelo else VERMELHO
+                else:
+                    amarelo[i] = AMARELO
+            frames_amarelo = int(round(fase.get("amarelo_s", 2.0) * FPS))
+            frames_vermelho = int(round(fase.get("vermelho_total_s", 0.0) * FPS))
+            seguinte = ((f + 1) % len(fases)) * 3
+
+            self.nomes_fases.append(nome)
+            self.verde_fixo_s.append(fase.get("verde_fixo_s"))
+            self.tabela += [bytes(verde), bytes(amarelo), bytes(n)]
+            self.duracoes += [None, frames_amarelo, frames_vermelho]
+            self.proximo += [f * 3 + INTERVALO_AMARELO, f * 3 + INTERVALO_VERMELHO_TOTAL if frames_vermelho > 0 else seguinte, seguinte]
+        self.luzes = [(ESTADOS_LUZ[estados[CABECAS_LUZ[0]]], ESTADOS_LUZ[estados[CABECAS_LUZ[1]]]) for estados in self.tabela]
+        self.restaurar(0)
+
+    def restaurar(self, codigo):
+        self.codigo = codigo
+        self.fase, self.intervalo = divmod(codigo, 3)
+        self.estados = self.tabela[codigo]
+
+    def avancar(self):
+        """Vai para o próximo intervalo do ciclo."""
+        self.restaurar(self.proximo[self.codigo])
+
+    @property
+    def duracao_frames(self):
+        return self.duracoes[self.codigo]
+
+    def resumo(self):
+        return f"{self.nome}: " + " → ".join(self.nomes_fases)
+
+
+# --- PEDIDOS DE TRAVESSIA ---
+class AgendadorTravessias:
+    """
+    Junta os pedidos de travessia por faixa em vez de cortar o verde a cada pedestre que chega.
+    Um pedido numa faixa sem verde fica pendente até o verde dela começar (fronteira de fase), quando
+    todos os pendentes da faixa são servidos de uma vez. Os pedestres só encurtam o verde atual depois
+    de verde_minimo_s e quando há `lote` pedidos pendentes ou o mais antigo já espera espera_maxima_s.
+    Com lote=1 e verde_minimo_s=0 cada pedido corta o verde na hora (comportamento antigo).
+
+    Métricas: pedidos servidos e espera por ativação de cada fase, cortes de verde por pedestres,
+    segundos de verde cortados (em relação ao tempo recomendado) e carros retidos na fila do eixo
+    que perdeu o verde — a vazão perdida para a preempção.
+    """
+    def __init__(self, plano, verde_minimo_s=8.0, espera_maxima_s=20.0, lote=4):
+        self.verde_minimo_s = float(verde_minimo_s)
+        self.espera_maxima_s = float(espera_maxima_s)
+        self.lote = max(1, int(lote))
+        self.nomes_fases = plano.nomes_fases
+        n = len(plano.nomes_fases)
+        # faixas liberadas no verde de cada fase
+        self.faixas_por_fase = [[faixa for faixa in MOVIMENTOS_PEDESTRES if plano.tabela[f * 3][INDICE_MOVIMENTO[faixa]] == VERDE]
+                                for f in range(n)]
+        self.pendentes = {faixa: deque() for faixa in MOVIMENTOS_PEDESTRES}  # frame de cada pedido
+        self.ativacoes = [0] * n
+        self.servidos = [0] * n
+        self.espera_s = [0.0] * n
+        self.cortes = 0
+        self.verde_cortado_s = 0.0
+        self.carros_retidos = 0
+
+    def registrar(self, faixa, quadro):
+        self.pendentes[faixa].append(quadro)
+
+    def servir_imediato(self, fase):
+        """Pedido numa faixa que já está liberada: atravessa sem esperar."""
+        self.servidos[fase] += 1
+
+    def servir(self, fase, quadro):
+        """Início do verde de `fase`: serve de uma vez os pedidos pendentes das faixas que ela libera."""
+        self.ativacoes[fase] += 1
+        for faixa in self.faixas_por_fase[fase]:
+            pendentes = self.pendentes[faixa]
+            if pendentes:
+                self.servidos[fase] += len(pendentes)
+                self.espera_s[fase] += sum(quadro - q for q in pendentes) / FPS
+                pendentes.clear()
+
+    def deve_cortar(self, estados, verde_s, quadro):
+        """True se os pedidos pendentes das faixas sem verde justificam encerrar o verde atual."""
+        if verde_s < self.verde_minimo_s:
+            return False
+        total = 0
+        mais_antigo = quadro
+        for faixa, pendentes in self.pendentes.items():
+            if pendentes and estados[INDICE_MOVIMENTO[faixa]] != VERDE:
+                total += len(pendentes)
+                mais_antigo = min(mais_antigo, pendentes[0])
+        return total > 0 and (total >= self.lote or (quadro - mais_antigo) / FPS >= self.espera_maxima_s)
+
+    def registrar_corte(self, verde_s, tempo_recomendado, carros_retidos):
+        self.cortes += 1
+        if tempo_recomendado is not None:
+            self.verde_cortado_s += max(0.0, tempo_recomendado - verde_s)
+        self.carros_retidos += carros_retidos
+
+    def estado(self):
+        return {"pendentes": {faixa: list(p) for faixa, p in self.pendentes.items()},
+                "contagens": (list(self.ativacoes), list(self.servidos), list(self.espera_s), self.cortes, self.verde_cortado_s, self.carros_retidos)}
+
+    def restaurar(self, estado):
+        for faixa, pendentes in estado["pendentes"].items():
+            self.pendentes[faixa] = deque(pendentes)
+        ativacoes, servidos, espera_s, self.cortes, self.verde_cortado_s, self.carros_retidos = estado["contagens"]
+        self.ativacoes, self.servidos, self.espera_s = list(ativacoes), list(servidos), list(espera_s)
+
+    def por_fase(self):
+        """(fase, ativações, pedidos servidos, pedidos por ativação, espera média s) de cada fase."""
+        linhas = []
+        for nome, ativacoes, servidos, espera_s in zip(self.nomes_fases, self.ativacoes, self.servidos, self.espera_s):
+            linhas.append((nome, ativacoes, servidos, servidos / ativacoes if ativacoes else 0.0, espera_s / servidos if servidos else 0.0))
+        return linhas
+
+    def resumo(self):
+        fases = " ".join(f"{nome}={por_ativacao:.1f}" for nome, _, _, por_ativacao, _ in self.por_fase())
+        return (f"pedidos servidos por ativação {fases} | cortes de verde={self.cortes} "
+                f"(verde cortado {self.verde_cortado_s:.1f}s, carros retidos {self.carros_retidos})")
+
+
 # --- AGENTE INTELIGENTE (Sem alterações) ---
 class ControladorSemaforo:
-    def __init__(self, luz_vertical, luz_horizontal):
+    def __init__(self, luz_vertical, luz_horizontal, inferencia_assincrona=False, plano=None):
         self.luz_vertical = luz_vertical
         self.luz_horizontal = luz_horizontal
         self.fuzzy_brain = FuzzyControlador()
-        self.luz_vertical.estado = 'vermelho'
-        self.luz_horizontal.estado = 'verde'
+        # plano de fases compilado; as cabeças desenhadas seguem o estado dele
+        self.plano = PlanoFases(plano if plano is not None else (PLANO_FASES or PLANO_DUAS_FASES))
+        self._aplicar_luzes()
         self.timer = 0
-        self.mudar_sequencia = None
+        # frames desde o início (relógio dos pedidos de travessia)
+        self.quadro = 0
+        self.agendador = AgendadorTravessias(self.plano, **AGENDA_TRAVESSIAS)
+        self.agendador.servir(self.plano.fase, self.quadro)
+        # sensor de filas da Simulacao (carros retidos quando um pedestre corta o verde); opcional
+        self.sensor_filas = None
         self.last_priority_score = 0
-        self.YELLOW_TIME = 2 * FPS
 
         # controle de frequência de impressão das ativações fuzzy
         self._last_fuzzy_print_time = 0.0
         self._fuzzy_print_interval = 1.5  # segundos
-
-    def requisicao_travessia_pedestre(self, axis):
+        self.imprimir_ativacoes = True  # desligado no modo headless
+
+        # cache incremental do ambiente: o horário só é remapeado quando a hora (HH) muda
+        # e a inferência fuzzy só roda de novo quando algum valor de entrada muda
+        self._hora_mapeada = None
+        self._horario_valor = None
+        self._chave_ambiente = None
+        self._chave_desde = 0.0
+        self._decisao = None
+
+        # inferência em thread separada (janela) ou síncrona (headless, reprodutível)
+        self.inferencia = TrabalhadorInferencia(self.fuzzy_brain) if inferencia_assincrona else None
+        # há quanto tempo (s) o tempo recomendado em uso não corresponde às entradas atuais
+        self.defasagem_decisao_s = 0.0
+        # latência (s) entre pedido e conclusão da última decisão usada
+        self.latencia_decisao_s = 0.0
+
+        # prazo: latência de cada update e de cada decisão nova; decisão fora do prazo -> modo degradado
+        self.latencias_update = HistogramaLatencia()
+        self.latencias_decisao = HistogramaLatencia()
+        self.perdas_prazo_update = 0
+        self.perdas_prazo_decisao = 0
+        self.em_modo_degradado = False
+        self._decisao_medida = None
+        self._chave_perdida = None
+        self._tempo_ultimo_bom = None
+        self.configurar_prazo(ORCAMENTO_DECISAO_S, MODO_DEGRADADO)
+
+        # modo preditivo (ControladorPreditivo) e troca imposta nos rollouts dele (frame do timer)
+        self.preditivo = None
+        self.troca_forcada_em = None
+        self._tempo_preditivo_s = 0.0
+
+    def configurar_prazo(self, orcamento_s, modo_degradado):
         """
-        Solicita ao controlador que prepare a troca para permitir travessia de pedestres.
-        axis: 'v' -> pedestres que atravessam a via vertical (impactam tráfego vertical => precisamos RED em vertical)
-              'h' -> pedestres que atravessam a via horizontal (impactam tráfego horizontal)
-        Isso inicia a sequência de amarelo para a via que estiver com verde, garantindo que em poucos frames a via perpendicular fique vermelha.
+        orcamento_s: latência máxima de uma decisão (e de cada update).
+        modo_degradado: o que usar quando a decisão atual não sai no prazo —
+          'ultimo_bom' (último tempo recomendado entregue no prazo), 'tabela' (tabela pré-calculada
+          de todas as combinações de rótulos) ou 'fixo' (TEMPO_FIXO_DEGRADADO).
         """
-        # se axis == 'v' queremos que a via vertical fique RED -> vertical vermelho happens when horizontal turns verde? 
-        # Implementação: se a via que atualmente está GREEN é a que atrapalha o pedestre, iniciamos amarelo nela para trocar.
-        if axis == 'v':
-            # pedestres atravessando horizontalmente (impactam tráfego vertical) =>
-            # precisamos que luz_vertical fique vermelho (ou seja, tornar vertical RED / horizontal GREEN).
-            if self.luz_horizontal.estado == 'verde' and not self.mudar_sequencia:
-                self.luz_horizontal.estado = 'amarelo'
-                self.mudar_sequencia = 'to_v'
-                self.timer = 0
-        elif axis == 'h':
-            # pedestres atravessando verticalmente (impactam tráfego horizontal) =>
-            # precisamos que luz_horizontal fique vermelho (tornar horizontal RED / vertical GREEN)
-            if self.luz_vertical.estado == 'verde' and not self.mudar_sequencia:
-                self.luz_vertical.estado = 'amarelo'
-                self.mudar_sequencia = 'to_h'
-                self.timer = 0
+        if modo_degradado not in ("ultimo_bom", "tabela", "fixo"):
+            raise ValueError(f"modo_degradado inválido: {modo_degradado}")
+        self.orcamento_decisao_s = float(orcamento_s)
+        self.modo_degradado = modo_degradado
+        self._tabela_degradada = self.fuzzy_brain.tabela_tempos() if modo_degradado == "tabela" else None
+
+    def _tempo_degradado(self, chave):
+        if self.modo_degradado == "tabela":
+            return self._tabela_degradada.get(chave, TEMPO_FIXO_DEGRADADO)
+        if self.modo_degradado == "ultimo_bom" and self._tempo_ultimo_bom is not None:
+            return self._tempo_ultimo_bom
+        return TEMPO_FIXO_DEGRADADO
+
+    def requisicao_travessia_pedestre(self, faixa):
+        """
+        Pedestre chegou à `faixa` (h_n/h_s atravessam a via vertical, v_r/v_l a horizontal).
+        Faixa já liberada: atravessa na hora. Senão o pedido vai para o AgendadorTravessias, que
+        junta os pedidos da faixa e decide se vale encerrar o verde atual agora ou servir o lote
+        na próxima fronteira de fase. Verdes fixos (conversões protegidas, fase exclusiva de
+        pedestres) não são encurtados.
+        """
+        plano = self.plano
+        if plano.estados[INDICE_MOVIMENTO[faixa]] == VERDE:
+            self.agendador.servir_imediato(plano.fase)
+            return
+        self.agendador.registrar(faixa, self.quadro)
+        if plano.intervalo == INTERVALO_VERDE and plano.verde_fixo_s[plano.fase] is None and \
+                self.agendador.deve_cortar(plano.estados, self.timer / FPS, self.quadro):
+            self._cortar_verde()
+
+    def _cortar_verde(self):
+        # preempção por pedestres: contabiliza o verde perdido e os carros parados no eixo que tinha verde
+        estados = self.plano.estados
+        retidos = 0
+        if self.sensor_filas is not None:
+            for cabeca, eixo in zip(CABECAS_LUZ, ('v', 'h')):
+                if estados[cabeca] == VERDE:
+                    retidos += self.sensor_filas.na_fila[eixo]
+        self.agendador.registrar_corte(self.timer / FPS, getattr(self, 'last_tempo_recomendado', None), retidos)
+        self.troca_forcada_em = None
+        self._iniciar_troca()
+
+    def _aplicar_luzes(self):
+        # cabeças desenhadas (e o trace/estado exportado) mostram o estado dos movimentos de CABECAS_LUZ
+        self.luz_vertical.estado, self.luz_horizontal.estado = self.plano.luzes[self.plano.codigo]
+
+    def _iniciar_troca(self):
+        # fim do verde: amarelo da fase atual
+        self.plano.avancar()
+        self._aplicar_luzes()
+        self.timer = 0
 
     def update(self, cars_v, cars_h, ambiente=None, pedestres_esperando_total=0):
         """
         Atualiza semáforos.
         Agora aceita 'ambiente' (dicionário gerado por gerar_ambiente_aleatorio) para cálculo
         do tempo recomendado via lógica fuzzy estendida.
+        Mede a latência de cada chamada contra orcamento_decisao_s.
         """
+        inicio = time.perf_counter()
+        self._tempo_preditivo_s = 0.0
+        self._atualizar(cars_v, cars_h, ambiente, pedestres_esperando_total)
+        # os rollouts do modo preditivo têm orçamento e histograma próprios
+        latencia = time.perf_counter() - inicio - self._tempo_preditivo_s
+        self.latencias_update.registrar(latencia)
+        if latencia > self.orcamento_decisao_s:
+            self.perdas_prazo_update += 1
+
+    def _atualizar(self, cars_v, cars_h, ambiente, pedestres_esperando_total):
         # incrementa timer (frames desde início do verde)
         self.timer += 1
 
-        # comportamento anterior mantido: tratamento de mudar_sequencia/amarelo
-        if self.mudar_sequencia:
-            if self.timer > self.YELLOW_TIME:
-                if self.mudar_sequencia == 'to_v':
-                    self.luz_horizontal.estado = 'vermelho'
-                    self.luz_vertical.estado = 'verde'
-                elif self.mudar_sequencia == 'to_h':
-                    self.luz_vertical.estado = 'vermelho'
-                    self.luz_horizontal.estado = 'verde'
-                self.mudar_sequencia = None
+        self.quadro += 1
+
+        # amarelo / vermelho total: duração fixa do plano, depois o próximo intervalo
+        plano = self.plano
+        if plano.intervalo != INTERVALO_VERDE:
+            if self.timer > plano.duracao_frames:
+                plano.avancar()
+                self._aplicar_luzes()
                 self.timer = 0
+                if plano.intervalo == INTERVALO_VERDE:
+                    # fronteira de fase: os pedidos pendentes das faixas liberadas saem juntos
+                    self.agendador.servir(plano.fase, self.quadro)
             return
 
-        # calcula prioridade original (mantendo compatibilidade)
-        carros_na_vermelha = cars_v if self.luz_horizontal.estado == 'verde' else cars_h
+        # calcula prioridade original (mantendo compatibilidade): carros dos eixos sem verde nesta fase
+        estados = plano.estados
+        carros_na_vermelha = (cars_v if estados[CABECAS_LUZ[0]] != VERDE else 0) + (cars_h if estados[CABECAS_LUZ[1]] != VERDE else 0)
         tempo_verde_segundos = self.timer / FPS
-        prioridade, ativacoes = self.fuzzy_brain.prioridade_de_computacao(carros_na_vermelha, tempo_verde_segundos)
+        prioridade = self.fuzzy_brain.prioridade_tabelada(carros_na_vermelha, tempo_verde_segundos, pedestres_esperando_total)
         self.last_priority_score = float(prioridade)
 
-        # imprime ativações conforme antes
+        # imprime ativações conforme antes (as ativações das regras só são avaliadas quando impressas)
         now = time.time()
-        should_print = (now - self._last_fuzzy_print_time >= self._fuzzy_print_interval) or (prioridade >= 5.0)
+        should_print = self.imprimir_ativacoes and ((now - self._last_fuzzy_print_time >= self._fuzzy_print_interval) or (prioridade >= 5.0))
         if should_print:
+            ativacoes = self.fuzzy_brain.ativacoes_prioridade(carros_na_vermelha, tempo_verde_segundos, pedestres_esperando_total)
             print(f"[FUZZY-PRIORIDADE] prioridade(defuzz)={prioridade:.2f} | entradas: carros_vermelho={carros_na_vermelha}, tempo_verde={tempo_verde_segundos:.2f}s, ped_esperando={pedestres_esperando_total}")
             for desc, grau in ativacoes:
                 if grau > 0.01:
@@ -717,11 +1809,64 @@ class ControladorSemaforo:
         regra_ativacoes = None
         if ambiente is not None:
             try:
-                tempo_recomendado = self.fuzzy_brain.calcular_tempo_a_partir_do_ambiente(ambiente['fluxo_de_carros'], ambiente['fluxo_de_pedestres'], ambiente['hora'], ambiente['clima'])
-                # guarda para exibição/debug
-                self.last_tempo_recomendado = float(tempo_recomendado)
-                # avalia regras e obtém graus
-                regra_ativacoes = self.fuzzy_brain.avaliar_regras(ambiente['fluxo_de_carros'], ambiente['fluxo_de_pedestres'], ambiente['hora'], ambiente['clima'])
+                # remapeia o horário apenas quando a hora muda (as faixas Outro/Normal/Pico são por hora cheia)
+                hora_hh = ambiente['hora'][:2]
+                if hora_hh != self._hora_mapeada:
+                    self._hora_mapeada = hora_hh
+                    self._horario_valor = self.fuzzy_brain.mapear_rotulo_hora_para_valor(ambiente['hora'])
+                chave = (ambiente['fluxo_de_carros'], ambiente['fluxo_de_pedestres'], self._horario_valor, ambiente['clima'])
+                # fluxos medidos (números) mudam a todo momento: tabela no próprio frame, sem a thread
+                medido = not isinstance(ambiente['fluxo_de_carros'], str)
+                calculou_agora = False
+                if chave != self._chave_ambiente:
+                    self._chave_ambiente = chave
+                    self._chave_desde = time.perf_counter()
+                    rotulos = (ambiente['fluxo_de_carros'], ambiente['fluxo_de_pedestres'], ambiente['hora'], ambiente['clima'])
+                    if medido:
+                        self._decisao = calcular_decisao_medida(self.fuzzy_brain, chave, rotulos, self._chave_desde)
+                        calculou_agora = True
+                    elif self.inferencia is not None:
+                        self.inferencia.solicitar(chave, rotulos)
+                    else:
+                        self._decisao = calcular_decisao(self.fuzzy_brain, chave, rotulos, self._chave_desde)
+                        calculou_agora = True
+                if self.inferencia is not None and not medido:
+                    # lê a última decisão concluída (pode ainda ser de entradas anteriores)
+                    self._decisao = self.inferencia.ultima_decisao()
+
+                decisao = self._decisao
+                if decisao is not None and decisao is not self._decisao_medida:
+                    self._decisao_medida = decisao
+                    self.latencia_decisao_s = decisao.concluido_em - decisao.pedido_em
+                    self.latencias_decisao.registrar(self.latencia_decisao_s)
+
+                atual = decisao is not None and decisao.chave == chave
+                if atual:
+                    self.defasagem_decisao_s = 0.0
+                    # síncrono: a decisão foi calculada neste update e estourou o prazo
+                    atrasada = calculou_agora and self.latencia_decisao_s > self.orcamento_decisao_s
+                else:
+                    # assíncrono: ainda sem resposta para as entradas atuais
+                    self.defasagem_decisao_s = time.perf_counter() - self._chave_desde
+                    atrasada = self.defasagem_decisao_s > self.orcamento_decisao_s
+
+                self.em_modo_degradado = atrasada
+                if atrasada:
+                    # decisão atrasada conta como errada: usa o modo degradado (uma perda por entrada)
+                    if self._chave_perdida != chave:
+                        self._chave_perdida = chave
+                        self.perdas_prazo_decisao += 1
+                    tempo_recomendado = self._tempo_degradado(chave)
+                elif atual:
+                    tempo_recomendado = decisao.tempo
+                    regra_ativacoes = decisao.regras
+                    self._tempo_ultimo_bom = decisao.tempo
+                else:
+                    # dentro do prazo: mantém o plano anterior enquanto a resposta não chega
+                    tempo_recomendado = self._tempo_ultimo_bom
+                if tempo_recomendado is not None:
+                    # guarda para exibição/debug
+                    self.last_tempo_recomendado = float(tempo_recomendado)
             except Exception as e:
                 # não deve quebrar o loop de simulação
                 print("Erro calcular_tempo_a_partir_do_ambiente:", e)
@@ -729,7 +1874,7 @@ class ControladorSemaforo:
 
         # imprime regras fuzzy do cálculo de tempo quando houver ambiente (com throttle igual)
         now = time.time()
-        if regra_ativacoes is not None and (now - self._last_fuzzy_print_time >= self._fuzzy_print_interval):
+        if self.imprimir_ativacoes and regra_ativacoes is not None and (now - self._last_fuzzy_print_time >= self._fuzzy_print_interval):
             print(f"[FUZZY-TEMPO] tempo_recomendado={tempo_recomendado:.2f}s | ambiente: clima={ambiente['clima']}, fluxo_de_carros={ambiente['fluxo_de_carros']}, fluxo_de_pedestres={ambiente['fluxo_de_pedestres']}, hora={ambiente['hora']}")
             for desc, grau in regra_ativacoes:
                 if grau > 0.01:
@@ -738,41 +1883,43 @@ class ControladorSemaforo:
             self._last_fuzzy_print_time = now
 
         # --- Decisão de troca (mantém lógica por prioridade) ---
-        # se a prioridade fuzzy exigir troca, executa sequência
-        if prioridade >= 5.0:
-            if self.luz_horizontal.estado == 'verde':
-                self.luz_horizontal.estado = 'amarelo'
-                self.mudar_sequencia = 'to_v'
-            else:
-                self.luz_vertical.estado = 'amarelo'
-                self.mudar_sequencia = 'to_h'
-            self.timer = 0
-            return
-
-        # adicional: se o tempo verde atual exceder o tempo recomendado (quando disponível), inicia troca
-        if tempo_recomendado is not None:
-            if tempo_verde_segundos >= tempo_recomendado:
-                if self.luz_horizontal.estado == 'verde':
-                    self.luz_horizontal.estado = 'amarelo'
-                    self.mudar_sequencia = 'to_v'
-                else:
-                    self.luz_vertical.estado = 'amarelo'
-                    self.mudar_sequencia = 'to_h'
-                self.timer = 0
+        # troca se a prioridade fuzzy exigir ou se o tempo verde atual exceder o tempo recomendado (quando disponível)
+        trocar = prioridade >= 5.0 or (tempo_recomendado is not None and tempo_verde_segundos >= tempo_recomendado)
+        verde_fixo_s = plano.verde_fixo_s[plano.fase]
+        if verde_fixo_s is not None:
+            # fase de duração fixa do plano (conversão protegida, pedestres exclusivos)
+            trocar = tempo_verde_segundos >= verde_fixo_s
+        elif self.troca_forcada_em is not None:
+            # rollout do modo preditivo: o instante da troca é imposto
+            trocar = self.timer >= self.troca_forcada_em
+            if trocar:
+                self.troca_forcada_em = None
+        elif self.preditivo is not None:
+            # modo preditivo: a decisão fuzzy entra como prior dos rollouts
+            inicio = time.perf_counter()
+            trocar = self.preditivo.decidir(trocar, tempo_recomendado, tempo_verde_segundos)
+            self._tempo_preditivo_s += time.perf_counter() - inicio
+        if trocar:
+            self._iniciar_troca()
+        elif verde_fixo_s is None and self.agendador.deve_cortar(estados, tempo_verde_segundos, self.quadro):
+            # lote de pedidos de travessia (ou espera máxima atingida) depois do verde mínimo
+            self._cortar_verde()
 
 # --- AMBIENTE ---
-def desenho_ambiente():
-    tela.fill(COR_CINZA)
-    pygame.draw.rect(tela, COR_CINZA_ESCURO, (350, 0, 100, ALTURA_TELA))   # via vertical
-    pygame.draw.rect(tela, COR_CINZA_ESCURO, (0, 350, LARGURA_TELA, 100))    # via horizontal
+def desenho_ambiente(superficie=None):
+    if superficie is None:
+        superficie = tela
+    superficie.fill(COR_CINZA)
+    pygame.draw.rect(superficie, COR_CINZA_ESCURO, (350, 0, 100, ALTURA_TELA))   # via vertical
+    pygame.draw.rect(superficie, COR_CINZA_ESCURO, (0, 350, LARGURA_TELA, 100))    # via horizontal
 
     # linhas de divisão das vias (não desenhar dentro do quadrado do cruzamento)
     for y in range(0, ALTURA_TELA, 40):
         if not 350 < y < 450:
-            pygame.draw.rect(tela, COR_BRANCA, (395, y, 10, 20))
+            pygame.draw.rect(superficie, COR_BRANCA, (395, y, 10, 20))
     for x in range(0, LARGURA_TELA, 40):
         if not 350 < x < 450:
-            pygame.draw.rect(tela, COR_BRANCA, (x, 395, 20, 10))
+            pygame.draw.rect(superficie, COR_BRANCA, (x, 395, 20, 10))
 
     # --- Faixas de pedestre restritas às vias, posicionadas na SAÍDA da via ---
     cw_thickness = CW_THICKNESS
@@ -788,22 +1935,22 @@ def desenho_ambiente():
     # - faixa norte (quem vem de cima -> 'pra_baixo'): alinhar com PARADA_EMBAIXO_MAX
     norte_y = PARADA_EMBAIXO_MAX - cw_gap - cw_thickness
     for x in range(estrada_x0 + faixa_margem, estrada_x1 - faixa_margem, faixa_w + faixa_brecha):
-        pygame.draw.rect(tela, COR_BRANCA, (x, norte_y, faixa_w, cw_thickness))
+        pygame.draw.rect(superficie, COR_BRANCA, (x, norte_y, faixa_w, cw_thickness))
 
     # - faixa sul (quem vem de baixo -> 'pra_cima'): continua alinhada com PARADA_CIMA_MIN + gap
     sul_y = PARADA_CIMA_MIN + cw_gap
     for x in range(estrada_x0 + faixa_margem, estrada_x1 - faixa_margem, faixa_w + faixa_brecha):
-        pygame.draw.rect(tela, COR_BRANCA, (x, sul_y, faixa_w, cw_thickness))
+        pygame.draw.rect(superficie, COR_BRANCA, (x, sul_y, faixa_w, cw_thickness))
 
     # - faixa oeste (quem vem da esquerda -> 'direita'): alinhar com PARADA_DIREITA_MAX
     esquerda_x = PARADA_DIREITA_MAX - cw_gap - cw_thickness
     for y in range(estrada_y0 + faixa_margem, estrada_y1 - faixa_margem, faixa_w + faixa_brecha):
-        pygame.draw.rect(tela, COR_BRANCA, (esquerda_x, y, cw_thickness, faixa_w))
+        pygame.draw.rect(superficie, COR_BRANCA, (esquerda_x, y, cw_thickness, faixa_w))
 
     # - faixa leste (quem vem da direita -> 'esquerda'): continua alinhada com PARADA_ESQUERDA_MIN + gap
     direita_x = PARADA_ESQUERDA_MIN + cw_gap
     for y in range(estrada_y0 + faixa_margem, estrada_y1 - faixa_margem, faixa_w + faixa_brecha):
-        pygame.draw.rect(tela, COR_BRANCA, (direita_x, y, cw_thickness, faixa_w))
+        pygame.draw.rect(superficie, COR_BRANCA, (direita_x, y, cw_thickness, faixa_w))
 
 # Função auxiliar para detectar se um carro está "esperando"
 def carros_esperando(car, todos_carros, controlador):
@@ -821,90 +1968,2481 @@ def carros_esperando(car, todos_carros, controlador):
             break
 
     # define área de fila (zona mais longa que a linha de parada)
-    if car.direcao == 'pra_baixo':
-        na_fila = (car.rect.bottom <= PARADA_EMBAIXO_MAX) and (car.rect.bottom > PARADA_EMBAIXO_MAX - COMPRIMENTO_FILA)
+    na_fila = carro_na_fila(car)
+    if car.eixo == 'v':
         luz_vermelha = controlador.luz_vertical.estado != 'verde'
-    elif car.direcao == 'pra_cima':
-        na_fila = (car.rect.top >= PARADA_CIMA_MIN) and (car.rect.top < PARADA_CIMA_MIN + COMPRIMENTO_FILA)
-        luz_vermelha = controlador.luz_vertical.estado != 'verde'
-    elif car.direcao == 'direita':
-        na_fila = (car.rect.right <= PARADA_DIREITA_MAX) and (car.rect.right > PARADA_DIREITA_MAX - COMPRIMENTO_FILA)
-        luz_vermelha = controlador.luz_horizontal.estado != 'verde'
-    else:  # left
-        na_fila = (car.rect.left >= PARADA_ESQUERDA_MIN) and (car.rect.left < PARADA_ESQUERDA_MIN + COMPRIMENTO_FILA)
+    else:
         luz_vermelha = controlador.luz_horizontal.estado != 'verde'
 
     # conta se está na área de fila e ou o semáforo está vermelho ou está bloqueado por outro carro
     return na_fila and (luz_vermelha or bloqueador_por_carro)
 
+def carro_na_fila(car):
+    """True se o carro está na área de fila (COMPRIMENTO_FILA atrás da linha de parada) da sua aproximação."""
+    if car.direcao == 'pra_baixo':
+        return (car.rect.bottom <= PARADA_EMBAIXO_MAX) and (car.rect.bottom > PARADA_EMBAIXO_MAX - COMPRIMENTO_FILA)
+    elif car.direcao == 'pra_cima':
+        return (car.rect.top >= PARADA_CIMA_MIN) and (car.rect.top < PARADA_CIMA_MIN + COMPRIMENTO_FILA)
+    elif car.direcao == 'direita':
+        return (car.rect.right <= PARADA_DIREITA_MAX) and (car.rect.right > PARADA_DIREITA_MAX - COMPRIMENTO_FILA)
+    else:  # left
+        return (car.rect.left >= PARADA_ESQUERDA_MIN) and (car.rect.left < PARADA_ESQUERDA_MIN + COMPRIMENTO_FILA)
+
+class SensorFilas:
+    """
+    Ocupação das filas por eixo mantida incrementalmente (substitui a varredura de carros_esperando).
+    Cada carro avisa, no próprio update, se andou e se a colisão à frente o bloqueou; a zona de fila
+    só é recalculada quando a posição muda; no fim do frame reavaliar_bloqueios() refaz o bloqueio dos
+    carros em fila com luz verde contra as posições finais. Por eixo guardamos quantos carros estão na zona e quantos
+    desses estão bloqueados por outro carro, então a contagem de "esperando" é uma leitura O(1):
+    com luz não-verde, todos na zona; com luz verde, apenas os bloqueados.
+    """
+    def __init__(self, luz_vertical, luz_horizontal):
+        self.luz_vertical = luz_vertical
+        self.luz_horizontal = luz_horizontal
+        self.resetar()
+
+    def resetar(self):
+        self.na_fila = {'v': 0, 'h': 0}
+        self.bloqueados_na_fila = {'v': 0, 'h': 0}
+
+    def _contar(self, car, sinal):
+        if car.na_fila:
+            self.na_fila[car.eixo] += sinal
+            if car.bloqueado_por_carro:
+                self.bloqueados_na_fila[car.eixo] += sinal
+
+    def atualizar(self, car, moveu, bloqueado_por_carro):
+        na_fila = carro_na_fila(car) if moveu else car.na_fila
+        if na_fila == car.na_fila and bloqueado_por_carro == car.bloqueado_por_carro:
+            return
+        self._contar(car, -1)
+        car.na_fila = na_fila
+        car.bloqueado_por_carro = bloqueado_por_carro
+        self._contar(car, +1)
+
+    def remover(self, car):
+        self._contar(car, -1)
+        car.na_fila = False
+        car.bloqueado_por_carro = False
+
+    def reavaliar_bloqueios(self, carros, retangulos):
+        """
+        Refaz o bloqueio por carro nas posições de fim de frame (as que o controlador lê no próximo passo).
+        No update os carros andam um a um, então o da frente pode já ter saído do caminho quando o de trás
+        testou a colisão. Só importa para quem está na zona de fila de um eixo com luz verde.
+        """
+        verde = {'v': self.luz_vertical.estado == 'verde', 'h': self.luz_horizontal.estado == 'verde'}
+        if not (verde['v'] or verde['h']):
+            return
+        for car in carros:
+            if not (car.na_fila and verde[car.eixo]):
+                continue
+            dx = (1 if car.direcao == 'direita' else -1 if car.direcao == 'esquerda' else 0) * car.velocidade
+            dy = (1 if car.direcao == 'pra_baixo' else -1 if car.direcao == 'pra_cima' else 0) * car.velocidade
+            bloqueado = False
+            for i in car.rect.move(dx, dy).collidelistall(retangulos):
+                if retangulos[i] is not car.rect:
+                    bloqueado = True
+                    break
+            if bloqueado != car.bloqueado_por_carro:
+                self._contar(car, -1)
+                car.bloqueado_por_carro = bloqueado
+                self._contar(car, +1)
+
+    @property
+    def carros_esperando_vertical(self):
+        if self.luz_vertical.estado != 'verde':
+            return self.na_fila['v']
+        return self.bloqueados_na_fila['v']
+
+    @property
+    def carros_esperando_horizontal(self):
+        if self.luz_horizontal.estado != 'verde':
+            return self.na_fila['h']
+        return self.bloqueados_na_fila['h']
+
+# --- TEMPOS POR AGENTE ---
+# grupos: aproximações dos carros (direção) e faixas dos pedestres
+GRUPOS_AGENTES = ['pra_baixo', 'pra_cima', 'direita', 'esquerda', 'h_n', 'h_s', 'v_r', 'v_l']
+GRUPOS_CARROS = range(0, 4)
+GRUPOS_PEDESTRES = range(4, 8)
+
+
+class RegistroAgentes:
+    """
+    Tempos de cada carro/pedestre em arrays pré-alocados (crescem dobrando), indexados pelo agente:
+    spawn, primeira parada, última saída da fila (voltou a andar), saída e tempo parado acumulado.
+    Carros andam em velocidade constante, então o tempo parado é exatamente o atraso em relação ao
+    fluxo livre; para pedestres é a espera até começar a travessia.
+    Na saída de cada agente o atraso entra no histograma do seu grupo (faixas de LARGURA_FAIXA_S),
+    de onde saem média e percentis sem guardar a lista de atrasos. O índice de quem saiu (ou foi
+    removido num reset) volta para `livres` e é reaproveitado: os arrays crescem até o pico de
+    agentes vivos, não com o total gerado.
+    """
+    LARGURA_FAIXA_S = 0.25
+    MAX_ATRASO_S = 600.0
+
+    def __init__(self, capacidade=4096):
+        self.agora = 0.0  # tempo simulado do passo atual (definido pela Simulacao)
+        self.dt = 0.0
+        self.n = 0
+        self.livres = []  # índices liberados, reaproveitados antes de crescer
+        self.spawn = np.full(capacidade, np.nan)
+        self.primeira_parada = np.full(capacidade, np.nan)
+        self.saiu_fila = np.full(capacidade, np.nan)
+        self.saida_em = np.full(capacidade, np.nan)
+        self.tempo_parado = np.zeros(capacidade)
+        self.parado = np.zeros(capacidade, dtype=bool)
+        self.grupo = np.zeros(capacidade, dtype=np.int8)
+        faixas = int(self.MAX_ATRASO_S / self.LARGURA_FAIXA_S)
+        self.histogramas = np.zeros((len(GRUPOS_AGENTES), faixas + 1), dtype=np.int64)  # última = acima do máximo
+        self.soma_atraso = np.zeros(len(GRUPOS_AGENTES))
+        self.concluidos = np.zeros(len(GRUPOS_AGENTES), dtype=np.int64)
+
+    def _crescer(self):
+        for nome in ("spawn", "primeira_parada", "saiu_fila", "saida_em", "tempo_parado", "parado", "grupo"):
+            atual = getattr(self, nome)
+            novo = np.full(2 * len(atual), np.nan) if atual.dtype == np.float64 else np.zeros(2 * len(atual), dtype=atual.dtype)
+            novo[:len(atual)] = atual
+            setattr(self, nome, novo)
+        self.tempo_parado[self.n:] = 0.0
+
+    def novo(self, grupo, spawn=None):
+        if self.livres:
+            i = self.livres.pop()
+            self.primeira_parada[i] = self.saiu_fila[i] = self.saida_em[i] = np.nan
+            self.tempo_parado[i] = 0.0
+            self.parado[i] = False
+        else:
+            if self.n == len(self.spawn):
+                self._crescer()
+            i = self.n
+            self.n += 1
+        self.grupo[i] = GRUPOS_AGENTES.index(grupo)
+        self.spawn[i] = self.agora if spawn is None else spawn
+        return i
+
+    def movimento(self, i, moveu):
+        if not moveu:
+            self.tempo_parado[i] += self.dt
+            if not self.parado[i]:
+                self.parado[i] = True
+                if self.primeira_parada[i] != self.primeira_parada[i]:  # NaN: ainda não tinha parado
+                    self.primeira_parada[i] = self.agora
+        elif self.parado[i]:
+            self.parado[i] = False
+            self.saiu_fila[i] = self.agora
+
+    def saida(self, i):
+        self.saida_em[i] = self.agora
+        atraso = self.tempo_parado[i]
+        g = self.grupo[i]
+        self.histogramas[g, min(int(atraso / self.LARGURA_FAIXA_S), self.histogramas.shape[1] - 1)] += 1
+        self.soma_atraso[g] += atraso
+        self.concluidos[g] += 1
+        self.livres.append(i)
+
+    def liberar(self, i):
+        """Devolve o índice de um agente removido sem sair (reset do ambiente); não entra nos atrasos."""
+        self.livres.append(i)
+
+    def estado_agente(self, i):
+        """(spawn, primeira parada, saída da fila, tempo parado, parado) — para instantâneos."""
+        return (float(self.spawn[i]), float(self.primeira_parada[i]), float(self.saiu_fila[i]), float(self.tempo_parado[i]), bool(self.parado[i]))
+
+    def restaurar_agente(self, grupo, estado):
+        spawn, primeira_parada, saiu_fila, tempo_parado, parado = estado
+        i = self.novo(grupo, spawn)
+        self.primeira_parada[i], self.saiu_fila[i], self.tempo_parado[i], self.parado[i] = primeira_parada, saiu_fila, tempo_parado, parado
+        return i
+
+    def media(self, grupos):
+        n = self.concluidos[list(grupos)].sum()
+        return float(self.soma_atraso[list(grupos)].sum() / n) if n else 0.0
+
+    def percentil(self, grupos, p):
+        """Percentil p (0..100) do atraso dos agentes que já saíram nos grupos, interpolado dentro da faixa."""
+        contagens = self.histogramas[list(grupos)].sum(axis=0)
+        total = contagens.sum()
+        if total == 0:
+            return 0.0
+        acumulado = np.cumsum(contagens)
+        alvo = p / 100.0 * total
+        k = int(np.searchsorted(acumulado, alvo))
+        anterior = acumulado[k - 1] if k > 0 else 0
+        fracao = (alvo - anterior) / contagens[k] if contagens[k] else 0.0
+        return float((k + fracao) * self.LARGURA_FAIXA_S)
+
+    def resumo_grupos(self):
+        """[(grupo, concluídos, média, p50, p95, p99)] por aproximação/faixa."""
+        return [(nome, int(self.concluidos[g]), self.media([g]), self.percentil([g], 50), self.percentil([g], 95), self.percentil([g], 99))
+                for g, nome in enumerate(GRUPOS_AGENTES)]
+
+# --- TAXAS DE CHEGADA MEDIDAS ---
+# taxas base do spawn (por segundo) e as taxas que cada rótulo de fluxo produz
+TAXA_BASE_CARROS_EIXO = 0.6       # carros/s em cada eixo (vertical e horizontal)
+TAXA_BASE_PEDESTRES_FAIXA = 0.06  # pedestres/s em cada uma das 4 faixas
+
+
+class EstimadorTaxa:
+    """
+    Taxa de chegadas (eventos/s) de um fluxo, com custo O(1) por evento e por consulta:
+      - janela deslizante de `janela_s` em `baldes` contagens (anel); ao avançar, as fatias que saíram da
+        janela são zeradas e descontadas da soma, que é mantida incrementalmente;
+      - EWMA em tempo contínuo com constante `tau_s`: a cada evento a média decai por exp(-Δt/tau) e
+        recebe 1/tau, então acompanha a taxa com atraso ~tau_s.
+    No início (menos de uma janela / poucos tau de dados) as duas são corrigidas pela cobertura, em vez
+    de partirem de zero; a cobertura conta no mínimo uma fatia, para uma chegada logo no primeiro frame
+    não virar uma taxa enorme.
+    """
+    def __init__(self, janela_s=30.0, baldes=30, tau_s=8.0, inicio=0.0):
+        self.janela_s = float(janela_s)
+        self.largura = self.janela_s / baldes
+        self.contagens = [0] * baldes
+        self.soma = 0
+        self.balde = int(inicio // self.largura)  # índice absoluto da fatia atual
+        self.inicio = inicio
+        self.tau_s = float(tau_s)
+        self.ewma = 0.0
+        self.t_ewma = inicio
+
+    def _avancar(self, t):
+        balde = int(t // self.largura)
+        if balde > self.balde:
+            n = len(self.contagens)
+            for b in range(self.balde + 1, self.balde + 1 + min(balde - self.balde, n)):
+                self.soma -= self.contagens[b % n]
+                self.contagens[b % n] = 0
+            self.balde = balde
+
+    def registrar(self, t, n=1):
+        self._avancar(t)
+        self.contagens[self.balde % len(self.contagens)] += n
+        self.soma += n
+        self.ewma = self.ewma * math.exp(-(t - self.t_ewma) / self.tau_s) + n / self.tau_s
+        self.t_ewma = t
+
+    def taxa_janela(self, t):
+        self._avancar(t)
+        # fatias completas + a parte decorrida da atual, limitado ao que já foi observado
+        largura = (len(self.contagens) - 1) * self.largura + (t - self.balde * self.largura)
+        largura = min(largura, max(t - self.inicio, self.largura))
+        return self.soma / largura
+
+    def taxa_ewma(self, t):
+        cobertura = 1.0 - math.exp(-max(t - self.inicio, self.largura) / self.tau_s)
+        return self.ewma * math.exp(-(t - self.t_ewma) / self.tau_s) / cobertura
+
+    def estado(self):
+        return (list(self.contagens), self.soma, self.balde, self.inicio, self.ewma, self.t_ewma)
+
+    def restaurar(self, estado):
+        contagens, self.soma, self.balde, self.inicio, self.ewma, self.t_ewma = estado
+        self.contagens = list(contagens)
+
+
+class MedidorChegadas:
+    """
+    Taxas de chegada medidas por aproximação (os 4 sentidos de carro e as 4 faixas de pedestre de
+    GRUPOS_AGENTES), convertidas nas entradas de fluxo (0..10) do FuzzyControlador.
+    Escala: a taxa que cada rótulo produz no spawn (Baixo/Médio/Alto) cai no valor desse rótulo
+    (2/5/9), com interpolação linear entre eles; acima de 'Alto' segue a mesma inclinação até 10.
+      carros: média dos dois eixos (carros/s por eixo); pedestres: soma das 4 faixas (pedestres/s).
+    estimador: 'ewma' (reage a um surto em ~tau_s) ou 'janela' (média dos últimos janela_s).
+    As entradas saem arredondadas a FuzzyControlador.PASSO_TABELA_FLUXO: o controlador só refaz a
+    decisão quando o fluxo medido muda de fato. Para não somar 8 estimadores a cada frame, as entradas
+    vêm de dois estimadores agregados (todos os carros, todos os pedestres) alimentados junto, e são
+    reavaliadas a cada `intervalo_s` (bem menor que tau_s e que a janela).
+    """
+    VALORES_ROTULOS = (0.0, 2.0, 5.0, 9.0, 10.0)
+
+    def __init__(self, estimador="ewma", janela_s=30.0, tau_s=8.0, intervalo_s=0.25, inicio=0.0):
+        if estimador not in ("ewma", "janela"):
+            raise ValueError(f"estimador inválido: {estimador}")
+        self.estimador = estimador
+        self.opcoes = {"estimador": estimador, "janela_s": janela_s, "tau_s": tau_s, "intervalo_s": intervalo_s}
+        self.intervalo_s = intervalo_s
+        self.estimadores = {grupo: EstimadorTaxa(janela_s, int(round(janela_s)), tau_s, inicio) for grupo in GRUPOS_AGENTES}
+        self.total_carros = EstimadorTaxa(janela_s, int(round(janela_s)), tau_s, inicio)
+        self.total_pedestres = EstimadorTaxa(janela_s, int(round(janela_s)), tau_s, inicio)
+        self.ancoras_carros = self._ancoras(TAXA_BASE_CARROS_EIXO, FLUXO_CARROS_MULTIPLOS)
+        self.ancoras_pedestres = self._ancoras(TAXA_BASE_PEDESTRES_FAIXA * len(FAIXAS_PEDESTRE), FLUXO_PEDESTRES_MULTIPLOS)
+        self._entradas = None
+        self._proxima_leitura = inicio
+        self._ambiente_base = None
+        self._ambiente_medido = None
+
+    @classmethod
+    def _ancoras(cls, base, multiplos):
+        taxas = [0.0] + [base * multiplos[n] for n in NIVEIS_DE_FLUXO]
+        # acima de 'Alto': mesma inclinação do trecho Médio -> Alto até o fim do universo
+        inclinacao = (taxas[3] - taxas[2]) / (cls.VALORES_ROTULOS[3] - cls.VALORES_ROTULOS[2])
+        return taxas + [taxas[3] + inclinacao * (cls.VALORES_ROTULOS[4] - cls.VALORES_ROTULOS[3])]
+
+    def _para_valor(self, taxa, ancoras):
+        valores = self.VALORES_ROTULOS
+        k = min(bisect.bisect_right(ancoras, taxa), len(ancoras) - 1)
+        valor = valores[k - 1] + (taxa - ancoras[k - 1]) * (valores[k] - valores[k - 1]) / (ancoras[k] - ancoras[k - 1])
+        passo = FuzzyControlador.PASSO_TABELA_FLUXO
+        return round(round(min(valor, valores[-1]) / passo) * passo, 6)
+
+    def registrar(self, grupo, t):
+        self.estimadores[grupo].registrar(t)
+        (self.total_carros if grupo in GRUPOS_AGENTES[:len(GRUPOS_CARROS)] else self.total_pedestres).registrar(t)
+
+    def _taxa(self, estimador, t):
+        return estimador.taxa_ewma(t) if self.estimador == "ewma" else estimador.taxa_janela(t)
+
+    def taxas(self, t):
+        """Taxa atual (eventos/s) de cada aproximação, pelo estimador escolhido."""
+        return {grupo: self._taxa(e, t) for grupo, e in self.estimadores.items()}
+
+    def entradas_fuzzy(self, t):
+        """(fluxo de carros, fluxo de pedestres) medidos, na escala 0..10."""
+        carros = self._taxa(self.total_carros, t) / 2.0
+        pedestres = self._taxa(self.total_pedestres, t)
+        self._entradas = (self._para_valor(carros, self.ancoras_carros), self._para_valor(pedestres, self.ancoras_pedestres))
+        return self._entradas
+
+    def ambiente_medido(self, ambiente, t):
+        """Cópia do ambiente com os fluxos medidos no lugar dos rótulos (reaproveitada enquanto nada muda)."""
+        if t >= self._proxima_leitura or self._entradas is None:
+            self.entradas_fuzzy(t)
+            self._proxima_leitura = t + self.intervalo_s
+        entradas = self._entradas
+        base = (ambiente["clima"], ambiente["hora"]) + entradas
+        if base != self._ambiente_base:
+            self._ambiente_base = base
+            self._ambiente_medido = dict(ambiente, fluxo_de_carros=entradas[0], fluxo_de_pedestres=entradas[1])
+        return self._ambiente_medido
+
+    def estado(self):
+        return {"opcoes": self.opcoes, "estimadores": {grupo: e.estado() for grupo, e in self.estimadores.items()},
+                "totais": (self.total_carros.estado(), self.total_pedestres.estado()), "leitura": (self._entradas, self._proxima_leitura)}
+
+    @classmethod
+    def de_estado(cls, estado):
+        medidor = cls(**estado["opcoes"])
+        for grupo, e in estado["estimadores"].items():
+            medidor.estimadores[grupo].restaurar(e)
+        medidor.total_carros.restaurar(estado["totais"][0])
+        medidor.total_pedestres.restaurar(estado["totais"][1])
+        medidor._entradas, medidor._proxima_leitura = estado["leitura"]
+        return medidor
+
+    def resumo(self, t):
+        taxas = self.taxas(t)
+        cf, pf = self.entradas_fuzzy(t)
+        return (f"{self.estimador}: carros={cf:.1f} (" + " ".join(f"{GRUPOS_AGENTES[g]}={taxas[GRUPOS_AGENTES[g]]:.2f}/s" for g in GRUPOS_CARROS)
+                + f") pedestres={pf:.1f} (" + " ".join(f"{GRUPOS_AGENTES[g]}={taxas[GRUPOS_AGENTES[g]]:.3f}/s" for g in GRUPOS_PEDESTRES) + ")")
+
+# --- ALEATORIEDADE REPRODUTÍVEL E TRACE ---
+class FluxosAleatorios:
+    """
+    Um random.Random independente por subsistema, todos derivados de uma semente:
+    'ambiente' (gerar_ambiente_aleatorio), 'carros' (spawn de carros), 'pedestres' (spawn de pedestres)
+    e 'cores' (cor dos carros). Mudar o consumo de um subsistema não altera os outros.
+    """
+    NOMES = ("ambiente", "carros", "pedestres", "cores")
+
+    def __init__(self, semente=None):
+        if semente is None:
+            semente = random.SystemRandom().randrange(2**63)
+        self.semente = int(semente)
+        for nome in self.NOMES:
+            # semente em texto: derivação estável (sha512), independente de PYTHONHASHSEED
+            setattr(self, nome, random.Random(f"{self.semente}:{nome}"))
+
+    def estados(self):
+        return {nome: getattr(self, nome).getstate() for nome in self.NOMES}
+
+    def restaurar(self, estados):
+        for nome, estado in estados.items():
+            getattr(self, nome).setstate(estado)
+
+
+# códigos compactos usados no trace
+ESTADOS_LUZ = ['vermelho', 'amarelo', 'verde']
+FAIXAS_PEDESTRE = ['h_n', 'h_s', 'v_r', 'v_l']
+TRACE_MAGICO = b"SEMTRC01"
+TRACE_CABECALHO = struct.Struct("<8sQdBdd")  # mágico, semente, dt inicial, modo dia, hora inicial (s), escala
+T_CARRO, T_PEDESTRE, T_AMBIENTE, T_DT, T_DECISAO, T_FIM = range(1, 7)
+_T_AMBIENTE = struct.Struct("<BBBI")   # clima, fluxo carros, fluxo pedestres, hora (s do dia)
+_T_DT = struct.Struct("<d")
+_T_DECISAO = struct.Struct("<Bff")     # estados (v*3+h), prioridade, tempo recomendado (-1 = nenhum)
+_T_FIM = struct.Struct("<III")         # assinatura do estado final, total gerado, carros que saíram
+
+
+def _varint(n):
+    saida = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            saida.append(b | 0x80)
+        else:
+            saida.append(b)
+            return bytes(saida)
+
+
+class GravadorTrace:
+    """
+    Trace binário compacto de uma execução: spawns, mudanças de ambiente, dt (só quando muda),
+    decisões do controlador (cada troca de estado das luzes) e uma assinatura do estado final.
+    Cada registro = varint(frames desde o registro anterior) + tipo (1 byte) + payload fixo.
+    """
+    def __init__(self, caminho, semente, dt, relogio=None):
+        self.arquivo = open(caminho, "wb")
+        modo_dia = relogio is not None
+        self.arquivo.write(TRACE_CABECALHO.pack(TRACE_MAGICO, semente, dt, int(modo_dia),
+                                                relogio.inicio if modo_dia else 0.0, relogio.escala if modo_dia else 0.0))
+        self._ultimo_frame = 0
+        self._dt = dt
+
+    def _registro(self, frame, tipo, payload=b""):
+        self.arquivo.write(_varint(frame - self._ultimo_frame) + bytes((tipo,)) + payload)
+        self._ultimo_frame = frame
+
+    def carro(self, frame, eixo, cor_idx):
+        self._registro(frame, T_CARRO, bytes(((0 if eixo == 'h' else 1) * 4 + cor_idx,)))
+
+    def pedestre(self, frame, faixa):
+        self._registro(frame, T_PEDESTRE, bytes((FAIXAS_PEDESTRE.index(faixa),)))
+
+    def ambiente(self, frame, ambiente):
+        self._registro(frame, T_AMBIENTE, _T_AMBIENTE.pack(CLIMAS.index(ambiente['clima']), NIVEIS_DE_FLUXO.index(ambiente['fluxo_de_carros']),
+                                                           NIVEIS_DE_FLUXO.index(ambiente['fluxo_de_pedestres']), hora_para_segundos(ambiente['hora'])))
+
+    def dt(self, frame, dt):
+        if dt != self._dt:
+            self._dt = dt
+            self._registro(frame, T_DT, _T_DT.pack(dt))
+
+    def decisao(self, frame, estado_v, estado_h, prioridade, tempo):
+        self._registro(frame, T_DECISAO, _T_DECISAO.pack(ESTADOS_LUZ.index(estado_v) * 3 + ESTADOS_LUZ.index(estado_h),
+                                                         prioridade, -1.0 if tempo is None else tempo))
+
+    def fechar(self, sim):
+        self._registro(sim.frame, T_FIM, _T_FIM.pack(sim.assinatura_estado(), sim.total_gerado, sim.carros_saíram))
+        self.arquivo.close()
+
+
+class LeitorTrace:
+    """Lê um trace gravado por GravadorTrace e entrega os eventos de cada frame (sem usar RNG)."""
+    def __init__(self, caminho):
+        with open(caminho, "rb") as f:
+            dados = f.read()
+        magico, self.semente, self.dt, modo_dia, self.hora_inicial_s, self.escala = TRACE_CABECALHO.unpack_from(dados, 0)
+        if magico != TRACE_MAGICO:
+            raise ValueError(f"{caminho}: não é um trace do simulador")
+        self.modo_dia = bool(modo_dia)
+        self.eventos = {}      # frame -> lista de (tipo, valor)
+        self.decisoes = []     # (frame, estado_v, estado_h, prioridade, tempo)
+        self.fim = None        # (frame, assinatura, total_gerado, carros_saíram)
+        pos, frame = TRACE_CABECALHO.size, 0
+        while pos < len(dados):
+            delta, deslocamento = 0, 0
+            while True:
+                b = dados[pos]
+                pos += 1
+                delta |= (b & 0x7F) << deslocamento
+                deslocamento += 7
+                if not b & 0x80:
+                    break
+            frame += delta
+            tipo = dados[pos]
+            pos += 1
+            if tipo == T_CARRO:
+                codigo = dados[pos]
+                pos += 1
+                evento = ('h' if codigo // 4 == 0 else 'v', codigo % 4)
+            elif tipo == T_PEDESTRE:
+                evento = FAIXAS_PEDESTRE[dados[pos]]
+                pos += 1
+            elif tipo == T_AMBIENTE:
+                cl, fc, fp, hora = _T_AMBIENTE.unpack_from(dados, pos)
+                pos += _T_AMBIENTE.size
+                evento = {"clima": CLIMAS[cl], "fluxo_de_carros": NIVEIS_DE_FLUXO[fc], "fluxo_de_pedestres": NIVEIS_DE_FLUXO[fp], "hora": segundos_para_hora(hora)}
+            elif tipo == T_DT:
+                evento = _T_DT.unpack_from(dados, pos)[0]
+                pos += _T_DT.size
+            elif tipo == T_DECISAO:
+                estados, prioridade, tempo = _T_DECISAO.unpack_from(dados, pos)
+                pos += _T_DECISAO.size
+                self.decisoes.append((frame, ESTADOS_LUZ[estados // 3], ESTADOS_LUZ[estados % 3], prioridade, tempo))
+                continue
+            elif tipo == T_FIM:
+                self.fim = (frame,) + _T_FIM.unpack_from(dados, pos)
+                pos += _T_FIM.size
+                continue
+            else:
+                raise ValueError(f"tipo de registro desconhecido no trace: {tipo}")
+            self.eventos.setdefault(frame, []).append((tipo, evento))
+
+    def relogio(self):
+        if not self.modo_dia:
+            return None
+        return RelogioDia(segundos_para_hora(self.hora_inicial_s), self.escala)
+
+    def ambiente_inicial(self):
+        return next((v for t, v in self.eventos.get(0, []) if t == T_AMBIENTE), None)
+
+
+# --- SIMULAÇÃO (estado + passo, sem desenho) ---
+class Simulacao:
+    """
+    Estado completo de uma execução: semáforos, controlador, sprites, contadores e ambiente.
+    `passo(dt)` avança um frame (ambiente, spawn, sensores, pedestres, controlador, carros)
+    sem desenhar nada, para ser usado tanto pela janela (main) quanto pelo modo headless.
+
+    Toda a aleatoriedade vem de FluxosAleatorios(semente). Com `gravador` a execução é gravada
+    num trace; com `trace` (LeitorTrace) os spawns e ambientes vêm do trace, sem RNG.
+    """
+    def __init__(self, ambiente=None, relogio=None, inferencia_assincrona=False, semente=None, gravador=None, trace=None):
+        self.luz_vertical = Semaforo(300, 150, 'vertical')
+        self.luz_horizontal = Semaforo(150, 300, 'horizontal')
+        self.controlador = ControladorSemaforo(self.luz_vertical, self.luz_horizontal, inferencia_assincrona)
+        self.todos_carros = pygame.sprite.Group()
+        self.todos_pedestres = pygame.sprite.Group()
+        self.sensor_filas = SensorFilas(self.luz_vertical, self.luz_horizontal)
+        self.controlador.sensor_filas = self.sensor_filas
+
+        # Variáveis para alternar o lado do spawn manual
+        self.lado_de_spawn_horizontal = 'esquerda'  # O próximo carro 'h' virá da esquerda
+        self.vertical_spawn_side = 'top'    # O próximo carro 'v' virá de cima
+
+        self.rng = FluxosAleatorios(trace.semente if trace is not None else semente)
+        self.agentes = RegistroAgentes()
+        self.gravador = gravador
+        self.trace = trace
+        self.frame = 0
+
+        # relógio do modo dia (None = ambiente fixo, alterado só por botão/tecla)
+        if relogio is None and trace is not None:
+            relogio = trace.relogio()
+        self.relogio = relogio
+        if relogio is not None:
+            self.ambiente = relogio.ambiente
+        elif trace is not None:
+            self.ambiente = trace.ambiente_inicial()
+        else:
+            self.ambiente = ambiente if ambiente is not None else gerar_ambiente_aleatorio(self.rng.ambiente)
+        if gravador is not None and relogio is None:
+            gravador.ambiente(0, self.ambiente)
+        self._dt_trace = trace.dt if trace is not None else None
+
+        self.tempo_sim = 0.0
+        self.total_gerado = 0
+        self.carros_saíram = 0
+
+        # leituras dos sensores no último passo
+        self.carros_esperando_vertical = 0
+        self.carros_esperando_horizontal = 0
+        self.pedestres_esperando_total = 0
+        self.pedestres_atravessando_vertical = 0
+        self.pedestres_atravessando_horizontal = 0
+
+        # modo de estresse: fator extra sobre as taxas de spawn e tempos acumulados por etapa do passo
+        self.multiplicador_demanda = 1.0
+        self.tempos_etapas = None  # dict {etapa: segundos} quando medido (ver ETAPAS_PASSO)
+
+        # fluxos medidos (MedidorChegadas): o controlador recebe as taxas de chegada em vez dos rótulos
+        self.medidor = None
+
+    def sortear_ambiente(self):
+        """Novo ambiente aleatório (fluxo 'ambiente' do RNG)."""
+        return gerar_ambiente_aleatorio(self.rng.ambiente)
+
+    def alterar_ambiente(self, novo_ambiente):
+        """Troca o ambiente e reseta a interseção (remove todos os carros e pedestres)."""
+        if self.gravador is not None:
+            # aplicado no início do próximo passo, também no replay
+            self.gravador.ambiente(self.frame + 1, novo_ambiente)
+        self.ambiente = novo_ambiente
+        for agente in itertools.chain(self.todos_carros, self.todos_pedestres):
+            if agente.registro is not None:
+                agente.registro.liberar(agente.indice)
+        self.todos_carros.empty()
+        self.todos_pedestres.empty()
+        self.sensor_filas.resetar()
+        # zera contagens de bloqueio de pedestres (caso algum estivesse atravessando)
+        self.pedestres_atravessando_vertical = 0
+        self.pedestres_atravessando_horizontal = 0
+
+    def assinatura_estado(self):
+        """CRC32 do estado observável (luzes, contadores e posição de cada carro/pedestre) — compara execuções."""
+        partes = [self.luz_vertical.estado, self.luz_horizontal.estado, str(self.total_gerado), str(self.carros_saíram)]
+        partes += [f"{c.direcao}:{c.rect.x}:{c.rect.y}" for c in self.todos_carros]
+        partes += [f"{p.orientacao}:{p.pos.x!r}:{p.pos.y!r}" for p in self.todos_pedestres]
+        return zlib.crc32("|".join(partes).encode("utf-8"))
+
+    # campos do ControladorSemaforo que determinam as próximas decisões
+    CAMPOS_CONTROLADOR = ("timer", "quadro", "last_priority_score", "_hora_mapeada", "_horario_valor", "_chave_ambiente",
+                          "defasagem_decisao_s", "_tempo_ultimo_bom", "em_modo_degradado", "_chave_perdida",
+                          "perdas_prazo_update", "perdas_prazo_decisao")
+
+    def instantaneo(self):
+        """
+        Estado completo da simulação em tipos simples (tuplas/dicts, picklável): carros na ordem do grupo
+        (a ordem decide colisões), pedestres, luzes, campos do controlador, relógio, contadores e estado do RNG.
+        Gravador/trace e histogramas de latência não fazem parte do estado.
+        """
+        controlador = self.controlador
+        decisao = controlador._decisao
+        relogio = self.relogio
+        return {
+            "versao": VERSAO_INSTANTANEO,
+            "frame": self.frame,
+            "tempo_sim": self.tempo_sim,
+            "total_gerado": self.total_gerado,
+            "carros_saíram": self.carros_saíram,
+            "lados_spawn": (self.lado_de_spawn_horizontal, self.vertical_spawn_side),
+            "ambiente": dict(self.ambiente),
+            "relogio": (relogio.inicio, relogio.escala, relogio.segundos) if relogio is not None else None,
+            "luzes": (self.luz_vertical.estado, self.luz_horizontal.estado),
+            "plano": controlador.plano.codigo,
+            "travessias": controlador.agendador.estado(),
+            "carros": [(c.direcao, CORES_CARRO.index(c.cor), c.rect.x, c.rect.y, c.na_fila, c.bloqueado_por_carro, self.agentes.estado_agente(c.indice))
+                       for c in self.todos_carros],
+            "pedestres": [(p.orientacao, p.pos.x, p.pos.y, p.esperando, p.atravessando, self.agentes.estado_agente(p.indice))
+                          for p in self.todos_pedestres],
+            "controlador": {campo: getattr(controlador, campo) for campo in self.CAMPOS_CONTROLADOR},
+            "tempo_recomendado": getattr(controlador, "last_tempo_recomendado", None),
+            "decisao": (decisao.chave, decisao.tempo, decisao.regras) if decisao is not None else None,
+            "sensores": (self.carros_esperando_vertical, self.carros_esperando_horizontal, self.pedestres_esperando_total,
+                         self.pedestres_atravessando_vertical, self.pedestres_atravessando_horizontal),
+            "semente": self.rng.semente,
+            "rng": self.rng.estados(),
+            "medidor": self.medidor.estado() if self.medidor is not None else None,
+        }
+
+    def restaurar(self, estado, semente=None):
+        """
+        Volta a simulação ao `estado` de instantaneo(). Com `semente`, os fluxos aleatórios são
+        re-semeados em vez de restaurados: é assim que um mesmo instantâneo aquecido vira vários ramos.
+        Os tempos dos agentes vivos são restaurados; os histogramas de atraso recomeçam do zero.
+        """
+        if estado.get("versao") != VERSAO_INSTANTANEO:
+            raise ValueError(f"instantâneo de versão {estado.get('versao')} (esperado {VERSAO_INSTANTANEO})")
+        self.frame = estado["frame"]
+        self.tempo_sim = estado["tempo_sim"]
+        self.total_gerado = estado["total_gerado"]
+        self.carros_saíram = estado["carros_saíram"]
+        self.lado_de_spawn_horizontal, self.vertical_spawn_side = estado["lados_spawn"]
+
+        if estado["relogio"] is not None:
+            inicio, escala, segundos = estado["relogio"]
+            relogio = RelogioDia(segundos_para_hora(inicio), escala)
+            relogio.segundos = segundos
+            relogio._segundo_exibido = int(segundos)
+            relogio.ambiente["hora"] = segundos_para_hora(int(segundos))
+            relogio._recalcular_rotulos()
+            self.relogio = relogio
+            self.ambiente = relogio.ambiente
+        else:
+            self.relogio = None
+            self.ambiente = dict(estado["ambiente"])
+
+        self.luz_vertical.estado, self.luz_horizontal.estado = estado["luzes"]
+        self.controlador.plano.restaurar(estado["plano"])
+        self.controlador.agendador.restaurar(estado["travessias"])
+
+        # sprites na mesma ordem; contagens do sensor refeitas a partir das flags de cada carro
+        self.todos_carros.empty()
+        self.sensor_filas.resetar()
+        self.agentes = RegistroAgentes()
+        for direcao, cor_idx, x, y, na_fila, bloqueado, tempos in estado["carros"]:
+            c = Carro(x, y, direcao, self.sensor_filas, CORES_CARRO[cor_idx])
+            c.na_fila, c.bloqueado_por_carro = na_fila, bloqueado
+            self.sensor_filas._contar(c, +1)
+            c.registro, c.indice = self.agentes, self.agentes.restaurar_agente(direcao, tempos)
+            self.todos_carros.add(c)
+        self.todos_pedestres.empty()
+        for orientacao, x, y, esperando, atravessando, tempos in estado["pedestres"]:
+            p = Pedestre(orientacao)
+            p.pos = pygame.Vector2(x, y)
+            p.rect.center = (int(x), int(y))
+            p.esperando, p.atravessando = esperando, atravessando
+            p.registro, p.indice = self.agentes, self.agentes.restaurar_agente(orientacao, tempos)
+            self.todos_pedestres.add(p)
+
+        controlador = self.controlador
+        for campo, valor in estado["controlador"].items():
+            setattr(controlador, campo, valor)
+        if estado["tempo_recomendado"] is not None:
+            controlador.last_tempo_recomendado = estado["tempo_recomendado"]
+        elif hasattr(controlador, "last_tempo_recomendado"):
+            del controlador.last_tempo_recomendado
+        agora = time.perf_counter()
+        controlador._chave_desde = agora - controlador.defasagem_decisao_s
+        if estado["decisao"] is not None:
+            # já medida: não entra de novo no histograma de latência
+            controlador._decisao = controlador._decisao_medida = DecisaoFuzzy(*estado["decisao"], agora, agora)
+        else:
+            controlador._decisao = controlador._decisao_medida = None
+
+        (self.carros_esperando_vertical, self.carros_esperando_horizontal, self.pedestres_esperando_total,
+         self.pedestres_atravessando_vertical, self.pedestres_atravessando_horizontal) = estado["sensores"]
+
+        if semente is None:
+            self.rng = FluxosAleatorios(estado["semente"])
+            self.rng.restaurar(estado["rng"])
+        else:
+            self.rng = FluxosAleatorios(semente)
+        self.medidor = MedidorChegadas.de_estado(estado["medidor"]) if estado.get("medidor") is not None else None
+        if self.medidor is not None:
+            self.controlador.fuzzy_brain.montar_tabela_fluxo()
+
+    def ativar_medidor(self, **opcoes):
+        """Passa a alimentar o controlador com os fluxos medidos (MedidorChegadas). Retorna o medidor."""
+        self.medidor = MedidorChegadas(inicio=self.tempo_sim, **opcoes)
+        # a decisão com fluxos medidos roda no frame: a tabela tem de estar pronta antes do primeiro passo
+        self.controlador.fuzzy_brain.montar_tabela_fluxo()
+        return self.medidor
+
+    def ativar_preditivo(self, **opcoes):
+        """Liga o modo preditivo (ControladorPreditivo) no controlador desta simulação. Retorna o preditivo."""
+        self.controlador.preditivo = ControladorPreditivo(self, **opcoes)
+        return self.controlador.preditivo
+
+    @classmethod
+    def a_partir_de(cls, estado, semente=None, **kwargs):
+        """Nova Simulacao já no `estado` de um instantâneo (ver restaurar)."""
+        sim = cls(semente=estado["semente"], **kwargs)
+        sim.restaurar(estado, semente)
+        return sim
+
+    def _sortear_spawns(self, ambiente, dt):
+        """Decide os spawns do frame com os fluxos de RNG. Retorna [(T_CARRO, (eixo, cor)), (T_PEDESTRE, faixa), ...]."""
+        rng = self.rng
+        spawns = []
+        # taxas base (por segundo)
+        base_spam_carros_horizontal = TAXA_BASE_CARROS_EIXO   # base carros por segundo na via horizontal
+        base_spam_carros_vertical = TAXA_BASE_CARROS_EIXO   # base carros por segundo na via vertical
+        base_spam_pedestres_cada = TAXA_BASE_PEDESTRES_FAIXA  # base probabilidade por segundo por faixa (cada uma das 4)
+
+        # aplica multiplicadores gerados pelo "fluxo" do ambiente (e o fator do modo de estresse)
+        carros_multiplicadores = FLUXO_CARROS_MULTIPLOS.get(ambiente["fluxo_de_carros"], 1.0) * self.multiplicador_demanda
+        pedestres_multiplicadores = FLUXO_PEDESTRES_MULTIPLOS.get(ambiente["fluxo_de_pedestres"], 1.0) * self.multiplicador_demanda
+
+        taxa_geracao_carros_horizontal = base_spam_carros_horizontal * carros_multiplicadores
+        taxa_geracao_carros_vertical = base_spam_carros_vertical * carros_multiplicadores
+        taxa_geracao_pedestres_cada = base_spam_pedestres_cada * pedestres_multiplicadores
+
+        # carros horizontais e verticais (cor sorteada no fluxo próprio)
+        if rng.carros.random() < taxa_geracao_carros_horizontal * dt:
+            spawns.append((T_CARRO, ('h', rng.cores.randrange(len(CORES_CARRO)))))
+        if rng.carros.random() < taxa_geracao_carros_vertical * dt:
+            spawns.append((T_CARRO, ('v', rng.cores.randrange(len(CORES_CARRO)))))
+
+        # pedestres — cada faixa tem sua chance
+        for faixa in FAIXAS_PEDESTRE:
+            if rng.pedestres.random() < taxa_geracao_pedestres_cada * dt:
+                spawns.append((T_PEDESTRE, faixa))
+        return spawns
+
+    def _gerar_carro(self, eixo, cor_idx):
+        cor = CORES_CARRO[cor_idx]
+        if eixo == 'h':
+            # carros horizontais (alterna lado de spawn)
+            if self.lado_de_spawn_horizontal == 'esquerda':
+                c = Carro(-40, 370, 'direita', self.sensor_filas, cor)  # vem da esquerda
+                self.lado_de_spawn_horizontal = 'direita'
+            else:
+                c = Carro(LARGURA_TELA, 410, 'esquerda', self.sensor_filas, cor)  # vem da direita
+                self.lado_de_spawn_horizontal = 'esquerda'
+        else:
+            # carros verticais (alterna topo/baixo)
+            if self.vertical_spawn_side == 'top':
+                c = Carro(370, -40, 'pra_baixo', self.sensor_filas, cor)  # vem de cima
+                self.vertical_spawn_side = 'bottom'
+            else:
+                c = Carro(410, ALTURA_TELA, 'pra_cima', self.sensor_filas, cor)  # vem de baixo
+                self.vertical_spawn_side = 'top'
+        c.registro, c.indice = self.agentes, self.agentes.novo(c.direcao)
+        self.todos_carros.add(c)
+        self.total_gerado += 1
+        if self.medidor is not None:
+            self.medidor.registrar(c.direcao, self.tempo_sim)
+
+    def _gerar_pedestre(self, faixa):
+        p = Pedestre(faixa)
+        p.registro, p.indice = self.agentes, self.agentes.novo(faixa)
+        self.todos_pedestres.add(p)
+        if self.medidor is not None:
+            self.medidor.registrar(faixa, self.tempo_sim)
+        # faixas h_* atravessam a via vertical; v_* a horizontal
+        self.controlador.requisicao_travessia_pedestre(faixa)
+
+    def passo(self, dt):
+        """Avança a simulação em dt segundos. Retorna True se o relógio do modo dia mudou o ambiente."""
+        global carros_saíram, BLOQUEIO_PEDESTRES_VERT, BLOQUEIO_PEDESTRES_HORI
+        tempos = self.tempos_etapas
+        if tempos is not None:
+            marca = time.perf_counter()
+        self.frame += 1
+        estados_antes = (self.luz_vertical.estado, self.luz_horizontal.estado)
+
+        # replay: dt e mudanças de ambiente vêm do trace
+        eventos_trace = self.trace.eventos.get(self.frame, ()) if self.trace is not None else ()
+        for tipo, valor in eventos_trace:
+            if tipo == T_DT:
+                self._dt_trace = valor
+            elif tipo == T_AMBIENTE:
+                self.alterar_ambiente(valor)
+        if self._dt_trace is not None:
+            dt = self._dt_trace
+        elif self.gravador is not None:
+            self.gravador.dt(self.frame, dt)
+
+        self.tempo_sim += dt
+        self.agentes.agora, self.agentes.dt = self.tempo_sim, dt
+        ambiente_mudou = self.relogio.avancar(dt) if self.relogio is not None else False
+        ambiente = self.ambiente
+
+        # --- SPAWN AUTOMÁTICO ALEATÓRIO (ou do trace) ---
+        if self.trace is not None:
+            spawns = [(tipo, valor) for tipo, valor in eventos_trace if tipo in (T_CARRO, T_PEDESTRE)]
+        else:
+            spawns = self._sortear_spawns(ambiente, dt)
+        for tipo, valor in spawns:
+            if tipo == T_CARRO:
+                self._gerar_carro(*valor)
+                if self.gravador is not None:
+                    self.gravador.carro(self.frame, *valor)
+            else:
+                self._gerar_pedestre(valor)
+                if self.gravador is not None:
+                    self.gravador.pedestre(self.frame, valor)
+        controlador = self.controlador
+        if tempos is not None:
+            agora = time.perf_counter()
+            tempos["spawn"] += agora - marca
+            marca = agora
+
+        # --- PERCEPÇÃO DO AGENTE (SENSORES) ---
+        # carros em fila por eixo: leitura O(1) do sensor incremental (atualizado no update dos carros)
+        carros_esperando_vertical = self.sensor_filas.carros_esperando_vertical
+        carros_esperando_horizontal = self.sensor_filas.carros_esperando_horizontal
+
+        # atualiza pedestres (decidem iniciar travessia) e conta esperando / atravessando
+        pedestres_esperando_total = 0
+        pedestres_atravessando_vertical = 0  # pedestres atravessando sobre a via vertical (impactam tráfego vertical)
+        pedestres_atravessando_horizontal = 0  # pedestres atravessando sobre a via horizontal (impactam tráfego horizontal)
+
+        # atualiza estado dos pedestres (move quem já está atravessando)
+        for ped in list(self.todos_pedestres):
+            ped.update(controlador.plano.estados)
+
+        # computa contagens após update
+        for ped in self.todos_pedestres:
+            if ped.esperando:
+                pedestres_esperando_total += 1
+            if ped.atravessando:
+                if ped.orientacao in ('h_n', 'h_s'):
+                    pedestres_atravessando_vertical += 1
+                else:
+                    pedestres_atravessando_horizontal += 1
+
+        self.carros_esperando_vertical = carros_esperando_vertical
+        self.carros_esperando_horizontal = carros_esperando_horizontal
+        self.pedestres_esperando_total = pedestres_esperando_total
+        self.pedestres_atravessando_vertical = pedestres_atravessando_vertical
+        self.pedestres_atravessando_horizontal = pedestres_atravessando_horizontal
+
+        # atualiza flags globais que bloqueiam carros nas áreas de fila
+        # (definidas a cada passo a partir desta simulação, então várias instâncias podem coexistir)
+        BLOQUEIO_PEDESTRES_VERT = pedestres_atravessando_vertical
+        BLOQUEIO_PEDESTRES_HORI = pedestres_atravessando_horizontal
+        if tempos is not None:
+            agora = time.perf_counter()
+            tempos["pedestres"] += agora - marca
+            marca = agora
+
+        # atualiza controlador com as contagens de carros esperando (e os fluxos medidos, se ligados)
+        if self.medidor is not None:
+            ambiente = self.medidor.ambiente_medido(ambiente, self.tempo_sim)
+        controlador.update(carros_esperando_vertical, carros_esperando_horizontal, ambiente=ambiente, pedestres_esperando_total=pedestres_esperando_total)
+        if tempos is not None:
+            agora = time.perf_counter()
+            tempos["controlador"] += agora - marca
+            marca = agora
+
+        # --- Atualiza movimento dos carros (depois de avaliar bloqueios por pedestres) ---
+        saidas_antes = carros_saíram
+        self.todos_carros.retangulos = [c.rect for c in self.todos_carros]
+        self.todos_carros.update(self.todos_carros, controlador.plano.estados)
+        self.sensor_filas.reavaliar_bloqueios(self.todos_carros, self.todos_carros.retangulos)
+        self.carros_saíram += carros_saíram - saidas_antes
+
+        # decisões do controlador (trocas de estado das luzes) vão para o trace
+        estados = (self.luz_vertical.estado, self.luz_horizontal.estado)
+        if self.gravador is not None and estados != estados_antes:
+            self.gravador.decisao(self.frame, estados[0], estados[1], controlador.last_priority_score, getattr(controlador, 'last_tempo_recomendado', None))
+        if tempos is not None:
+            tempos["carros"] += time.perf_counter() - marca
+
+        return ambiente_mudou
+
+
+# --- INSTANTÂNEOS E RAMOS ---
+VERSAO_INSTANTANEO = 4
+
+
+def salvar_instantaneo(estado, caminho):
+    """Grava um instantâneo (pickle comprimido com zlib)."""
+    Path(caminho).write_bytes(zlib.compress(pickle.dumps(estado, protocol=pickle.HIGHEST_PROTOCOL), 6))
+
+
+def carregar_instantaneo(caminho):
+    return pickle.loads(zlib.decompress(Path(caminho).read_bytes()))
+
+
+_SIM_RAMO = None  # uma Simulacao por processo, reaproveitada entre ramos
+
+
+def _executar_ramo(estado, semente, duracao_s, dt):
+    """Roda um ramo a partir do instantâneo; devolve um resumo (contadores e fila média)."""
+    global _SIM_RAMO
+    if _SIM_RAMO is None:
+        _SIM_RAMO = Simulacao(semente=semente)
+        _SIM_RAMO.controlador.imprimir_ativacoes = False
+    sim = _SIM_RAMO
+    sim.restaurar(estado, semente)
+    gerados, saidas, tempo_inicial = sim.total_gerado, sim.carros_saíram, sim.tempo_sim
+    soma_fila, passos = 0, 0
+    while sim.tempo_sim - tempo_inicial < duracao_s:
+        sim.passo(dt)
+        soma_fila += sim.carros_esperando_vertical + sim.carros_esperando_horizontal
+        passos += 1
+    return {"semente": semente, "gerados": sim.total_gerado - gerados, "saíram": sim.carros_saíram - saidas,
+            "fila_media": soma_fila / max(passos, 1), "assinatura": sim.assinatura_estado()}
+
+
+def executar_ramos(estado, sementes, duracao_s, dt=1.0 / FPS, processos=None):
+    """
+    Bifurca um instantâneo (já aquecido) em um ramo por semente e roda cada um por duracao_s,
+    em paralelo (processos=None -> um por CPU; 1 -> no próprio processo). Resumos na ordem das sementes.
+    """
+    if processos == 1:
+        return [_executar_ramo(estado, semente, duracao_s, dt) for semente in sementes]
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(_executar_ramo, estado, semente, duracao_s, dt) for semente in sementes]
+        return [f.result() for f in futuros]
+
+
+# --- MODO PREDITIVO (ROLLOUTS) ---
+class ControladorPreditivo:
+    """
+    Controle preditivo das trocas. Em cada ponto de decisão, o estado é clonado (instantaneo()) numa
+    Simulacao de rollout reaproveitada e cada opção ("trocar agora", "em 5 s", "em 10 s") é simulada por
+    horizonte_s. Depois da troca imposta, o rollout segue a lógica fuzzy normal. Custo previsto é o atraso
+    total: (carros na fila + pedestres esperando) * dt. Todas as opções usam a mesma semente (mesmas
+    chegadas), derivada da semente principal e do frame, então a execução continua reprodutível.
+    A decisão fuzzy é o prior: ela é simulada primeiro, e outra opção só vence se prever pelo menos
+    `margem_prior` a menos de atraso.
+    Pontos de decisão: quando o fuzzy pede a troca e a cada `intervalo_s` de verde. Depois de uma consulta
+    que mantém o verde, a próxima só acontece após intervalo_s. verde_maximo_s força a troca.
+    Orçamento: `orcamento_ms` por consulta (tempo de relógio). O horizonte é encurtado pelo custo medido de
+    um passo de rollout para caberem todas as opções (até a maior espera + 1 s), e as opções que ainda
+    sobrarem depois de o orçamento acabar são puladas. Com orçamento, a escolha depende da máquina; com
+    None não há limite e a execução é reprodutível.
+    Fatia: com `fatia_ms` (a janela usa FATIA_PREDITIVO_JANELA_MS), os rollouts saem do frame: cada frame
+    roda no máximo fatia_ms da consulta e o verde é mantido até ela terminar. Sem fatia (headless), a
+    consulta roda inteira no frame do ponto de decisão.
+    """
+    PENDENTE = object()  # consulta (ou rollout) que cedeu no fim da fatia e continua no próximo frame
+
+    def __init__(self, sim, opcoes_s=(0.0, 5.0, 10.0), horizonte_s=20.0, intervalo_s=5.0, margem_prior=0.05,
+                 orcamento_ms=None, verde_maximo_s=60.0, fatia_ms=None):
+        self.sim = sim
+        self.opcoes_s = tuple(opcoes_s)
+        self.horizonte_s = horizonte_s
+        self.intervalo_frames = int(round(intervalo_s * FPS))
+        self.margem_prior = margem_prior
+        self.orcamento_s = orcamento_ms / 1000.0 if orcamento_ms else None
+        self.verde_maximo_s = verde_maximo_s
+        self.fatia_s = fatia_ms / 1000.0 if fatia_ms else None
+        self._rollout = None
+        self._ultima_consulta = 0
+        self._consulta = None  # gerador da consulta em andamento (com fatia, atravessa frames)
+        self._prazo_fatia = None
+        self._inicio_fatia = 0.0
+        self._gasto_fatias_s = 0.0
+        self._fatias = 0
+        self.consultas_abandonadas = 0
+        self.max_fatias = 0  # frames ocupados pela consulta mais longa
+        self.latencias_fatia = HistogramaLatencia()  # tempo da consulta dentro de cada frame
+        if self.fatia_s is not None:
+            self._simulacao_rollout()  # criar a Simulacao de rollout custa mais que um frame: já na ativação
+        self.consultas = 0
+        self.rollouts = 0
+        self.divergencias_fuzzy = 0
+        self.orcamentos_estourados = 0
+        self.podados = 0
+        self.horizontes_cortados = 0
+        self._segundos_por_passo = None  # custo médio (móvel) de um passo de rollout
+        self.latencias = HistogramaLatencia()
+
+    def _simulacao_rollout(self):
+        if self._rollout is None:
+            self._rollout = Simulacao(semente=self.sim.rng.semente)
+            self._rollout.controlador.imprimir_ativacoes = False
+        return self._rollout
+
+    def _custo_opcao(self, estado, semente, espera_s, dt, limite=None, passos=None):
+        """
+        Gerador do rollout de uma opção: atraso previsto (agente-segundos) trocando daqui a espera_s, em
+        `passos` frames de rollout (padrão: horizonte_s), devolvido no fim (StopIteration.value).
+        O atraso só cresce ao longo do rollout: ao passar de `limite` a opção já perdeu e o rollout
+        para cedo (devolve None). Com fatia por frame, cede (yield) quando o prazo da fatia acaba.
+        """
+        rollout = self._simulacao_rollout()
+        if passos is None:
+            passos = int(round(self.horizonte_s / dt))
+        inicio = time.perf_counter()
+        gasto, executados = 0.0, 0
+        rollout.restaurar(estado, semente)
+        controlador = rollout.controlador
+        controlador.troca_forcada_em = controlador.timer + int(round(espera_s * FPS))
+        custo = 0.0
+        for _ in range(passos):
+            rollout.passo(dt)
+            executados += 1
+            custo += (rollout.carros_esperando_vertical + rollout.carros_esperando_horizontal + rollout.pedestres_esperando_total) * dt
+            if limite is not None and custo >= limite:
+                self.podados += 1
+                custo = None
+                break
+            if self._prazo_fatia is not None and time.perf_counter() >= self._prazo_fatia:
+                gasto += time.perf_counter() - inicio
+                yield
+                inicio = time.perf_counter()
+        gasto += time.perf_counter() - inicio
+        self.rollouts += 1
+        if executados:
+            por_passo = gasto / executados
+            self._segundos_por_passo = por_passo if self._segundos_por_passo is None else 0.8 * self._segundos_por_passo + 0.2 * por_passo
+        return custo
+
+    def custo_opcao(self, estado, semente, espera_s, dt, limite=None, passos=None):
+        """Rollout de uma opção de uma vez (ver _custo_opcao); retorna o atraso previsto ou None se podado."""
+        return self._executar(self._custo_opcao(estado, semente, espera_s, dt, limite, passos))
+
+    def _executar(self, gerador):
+        """
+        Avança o gerador (rollout ou consulta) até ele ceder ou terminar; retorna o valor final, ou
+        PENDENTE se cedeu. O rollout roda no meio do passo da simulação principal: devolve depois os
+        globais de bloqueio/saídas (cada passo do rollout recalcula os seus).
+        """
+        global BLOQUEIO_PEDESTRES_VERT, BLOQUEIO_PEDESTRES_HORI, carros_saíram
+        bloqueios = (BLOQUEIO_PEDESTRES_VERT, BLOQUEIO_PEDESTRES_HORI, carros_saíram)
+        try:
+            next(gerador)
+            return self.PENDENTE
+        except StopIteration as fim:
+            return fim.value
+        finally:
+            BLOQUEIO_PEDESTRES_VERT, BLOQUEIO_PEDESTRES_HORI, carros_saíram = bloqueios
+
+    def _consultar(self, prior, trocar_fuzzy):
+        """Gerador de uma consulta (todas as opções, a partir do prior); devolve True = trocar agora."""
+        estado = self.sim.instantaneo()
+        semente = zlib.crc32(f"{self.sim.rng.semente}:{self.sim.frame}".encode("utf-8"))
+        dt = self.sim.agentes.dt or 1.0 / FPS
+        ordem = [prior] + [i for i in range(len(self.opcoes_s)) if i != prior]
+        passos = int(round(self.horizonte_s / dt))
+        if self.orcamento_s is not None and self._segundos_por_passo:
+            # encurta o horizonte para caberem todas as opções no orçamento, sem ficar aquém da maior espera + 1 s
+            cabem = int(self.orcamento_s / (len(ordem) * self._segundos_por_passo))
+            minimo = int(round((max(self.opcoes_s) + 1.0) / dt))
+            if cabem < passos:
+                passos = max(cabem, minimo)
+                self.horizontes_cortados += 1
+        melhor, limite = prior, None
+        for i in ordem:
+            if limite is not None and self.orcamento_s is not None and self._gasto_consulta() > self.orcamento_s:
+                self.orcamentos_estourados += 1
+                break
+            custo = yield from self._custo_opcao(estado, semente, self.opcoes_s[i], dt, limite, passos)
+            if custo is None:
+                continue
+            if limite is None:
+                limite = custo * (1.0 - self.margem_prior)  # o prior: as outras opções precisam ficar abaixo disso
+            else:
+                melhor, limite = i, custo
+        self.consultas += 1
+        self.divergencias_fuzzy += (self.opcoes_s[melhor] == 0.0) != trocar_fuzzy
+        return self.opcoes_s[melhor] == 0.0
+
+    def _gasto_consulta(self):
+        """Tempo de relógio já gasto pela consulta em andamento (soma das fatias, incluindo a atual)."""
+        return self._gasto_fatias_s + time.perf_counter() - self._inicio_fatia
+
+    def _continuar_consulta(self):
+        """Roda uma fatia da consulta em andamento; True/False quando ela termina, PENDENTE se ainda não."""
+        self._inicio_fatia = time.perf_counter()
+        self._prazo_fatia = self._inicio_fatia + self.fatia_s if self.fatia_s is not None else None
+        resultado = self._executar(self._consulta)
+        gasto = time.perf_counter() - self._inicio_fatia
+        self.latencias_fatia.registrar(gasto)
+        self._gasto_fatias_s += gasto
+        self._fatias += 1
+        if resultado is not self.PENDENTE:
+            self.latencias.registrar(self._gasto_fatias_s)
+            self.max_fatias = max(self.max_fatias, self._fatias)
+            self._consulta = None
+        return resultado
+
+    def _abandonar_consulta(self):
+        if self._consulta is not None:
+            self._consulta.close()
+            self._consulta = None
+            self.consultas_abandonadas += 1
+
+    def decidir(self, trocar_fuzzy, tempo_recomendado, tempo_verde_s):
+        """
+        Chamado pelo ControladorSemaforo a cada frame de verde; True = iniciar a troca agora.
+        Com fatia_ms, uma consulta ocupa vários frames e o verde é mantido até ela terminar.
+        """
+        controlador = self.sim.controlador
+        if controlador.timer < self._ultima_consulta:
+            self._ultima_consulta = 0  # nova fase de verde
+            self._abandonar_consulta()  # o verde anterior acabou sem ela (corte por travessia)
+        if tempo_verde_s >= self.verde_maximo_s:
+            self._abandonar_consulta()
+            return True
+        if self._consulta is None:
+            # dentro do intervalo: mantém o verde se já houve consulta nesta fase ou se o fuzzy também mantém
+            if controlador.timer - self._ultima_consulta < self.intervalo_frames and (self._ultima_consulta or not trocar_fuzzy):
+                return False
+            self._ultima_consulta = controlador.timer
+
+            # prior fuzzy: trocar agora, ou a opção mais próxima do que falta para o tempo recomendado
+            if trocar_fuzzy:
+                prior = min(range(len(self.opcoes_s)), key=lambda i: self.opcoes_s[i])
+            else:
+                falta = (tempo_recomendado - tempo_verde_s) if tempo_recomendado is not None else max(self.opcoes_s)
+                prior = min(range(len(self.opcoes_s)), key=lambda i: (abs(self.opcoes_s[i] - falta), -self.opcoes_s[i]))
+            self._consulta = self._consultar(prior, trocar_fuzzy)
+            self._gasto_fatias_s, self._fatias = 0.0, 0
+        resultado = self._continuar_consulta()
+        return False if resultado is self.PENDENTE else resultado
+
+    def resumo(self):
+        return (f"consultas={self.consultas} rollouts={self.rollouts} (podados {self.podados}) diferente do fuzzy={self.divergencias_fuzzy} "
+                f"horizonte cortado={self.horizontes_cortados} orçamento estourado={self.orcamentos_estourados} | "
+                f"latência por consulta: {self.latencias.resumo()}"
+                + (f" | por frame: {self.latencias_fatia.resumo()} (até {self.max_fatias} frames por consulta, {self.consultas_abandonadas} abandonadas)"
+                   if self.fatia_s is not None else ""))
+
+
+# --- ESTADO ESTACIONÁRIO / PARADA ANTECIPADA ---
+class MonitorEstacionario:
+    """
+    Monitor online das saídas principais, amostradas a cada `intervalo` s simulados:
+    'fila' (carros esperando nos dois eixos), 'vazao' (carros que saíram por segundo) e
+    'pedestres_esperando'. A cada `lotes` amostras novas:
+      - fim do aquecimento pelo MSER-5 (truncamento que minimiza o erro padrão do restante),
+        o maior entre as séries, limitado à primeira metade dos dados;
+      - intervalo de confiança por médias de lotes (`lotes` lotes, t de Student) após o aquecimento.
+    Convergiu quando, em todas as séries, meia-largura <= max(precisao * |média|, precisao_absoluta).
+    Só faz sentido com ambiente fixo (no modo dia as taxas mudam com a hora).
+    """
+    SERIES = ("fila", "vazao", "pedestres_esperando")
+
+    def __init__(self, precisao=0.05, precisao_absoluta=0.05, intervalo=1.0, lotes=20, confianca=0.95, min_amostras=300, janela_movel=60):
+        self.precisao = precisao
+        self.precisao_absoluta = precisao_absoluta
+        self.intervalo = intervalo
+        self.lotes = lotes
+        # scipy.stats só é importado quando há monitor (a janela e os outros modos não pagam o import)
+        from scipy import stats
+        self.t_critico = stats.t.ppf(0.5 + confianca / 2.0, lotes - 1)
+        self.min_amostras = min_amostras
+        self.janela_movel = janela_movel
+        self.amostras = {serie: [] for serie in self.SERIES}
+        self._proxima_amostra = None
+        self._saidas_anteriores = 0
+        self.aquecimento_amostras = 0
+        self.estimativas = {}  # série -> (média, meia-largura)
+        self.convergiu = False
+        self.convergiu_em_s = None
+
+    @staticmethod
+    def _mser5(x):
+        """Índice de truncamento (em amostras) pelo MSER-5."""
+        k = len(x) // 5
+        if k < 4:
+            return 0
+        y = np.asarray(x[:5 * k], dtype=float).reshape(k, 5).mean(axis=1)
+        # somas a partir de cada ponto de corte d
+        s1 = np.cumsum(y[::-1])[::-1]
+        s2 = np.cumsum((y * y)[::-1])[::-1]
+        n = np.arange(k, 0, -1, dtype=float)
+        estatistica = (s2 - s1 * s1 / n) / (n * n)
+        return 5 * int(np.argmin(estatistica[:k // 2 + 1]))
+
+    def registrar(self, sim):
+        """Amostra a simulação quando chega a hora. Retorna True quando as estimativas convergiram."""
+        if self._proxima_amostra is None:
+            self._proxima_amostra = sim.tempo_sim + self.intervalo
+            self._saidas_anteriores = sim.carros_saíram
+            return False
+        if sim.tempo_sim < self._proxima_amostra:
+            return self.convergiu
+        self._proxima_amostra += self.intervalo
+        self.amostras["fila"].append(sim.carros_esperando_vertical + sim.carros_esperando_horizontal)
+        self.amostras["vazao"].append((sim.carros_saíram - self._saidas_anteriores) / self.intervalo)
+        self.amostras["pedestres_esperando"].append(sim.pedestres_esperando_total)
+        self._saidas_anteriores = sim.carros_saíram
+        n = len(self.amostras["fila"])
+        if n >= self.min_amostras and n % self.lotes == 0:
+            self._avaliar(sim.tempo_sim)
+        return self.convergiu
+
+    def _avaliar(self, tempo_sim):
+        self.aquecimento_amostras = max(self._mser5(x) for x in self.amostras.values())
+        convergiu = True
+        for serie, x in self.amostras.items():
+            restante = np.asarray(x[self.aquecimento_amostras:], dtype=float)
+            tamanho = len(restante) // self.lotes
+            if tamanho < 2:
+                return
+            medias = restante[:tamanho * self.lotes].reshape(self.lotes, tamanho).mean(axis=1)
+            media = float(medias.mean())
+            meia_largura = float(self.t_critico * medias.std(ddof=1) / np.sqrt(self.lotes))
+            self.estimativas[serie] = (media, meia_largura)
+            convergiu &= meia_largura <= max(self.precisao * abs(media), self.precisao_absoluta)
+        if convergiu and not self.convergiu:
+            self.convergiu_em_s = tempo_sim
+        self.convergiu = convergiu
+
+    def media_movel(self, serie):
+        """Média das últimas `janela_movel` amostras (acompanhamento ao vivo)."""
+        x = self.amostras[serie][-self.janela_movel:]
+        return sum(x) / len(x) if x else 0.0
+
+    def resumo(self):
+        partes = [f"aquecimento={self.aquecimento_amostras * self.intervalo:.0f}s",
+                  f"convergiu={'sim em %.0fs' % self.convergiu_em_s if self.convergiu else 'não'}"]
+        for serie, (media, meia_largura) in self.estimativas.items():
+            partes.append(f"{serie}={media:.3f}±{meia_largura:.3f}")
+        return " | ".join(partes)
+
+
+# --- ESTADO AO VIVO (ARQUIVO MAPEADO EM MEMÓRIA) ---
+ESTADO_MAGICO = b"SEMEST01"
+# cabeçalho: mágico, versão, capacidade do anel, tamanho do registro, total de registros publicados
+ESTADO_CABECALHO = np.dtype([("magico", "S8"), ("versao", "<u4"), ("capacidade", "<u4"), ("tamanho_registro", "<u4"),
+                             ("_reservado", "<u4"), ("publicados", "<u8")])
+# registro de largura fixa; 'seq' é o seqlock do slot (ímpar = sendo escrito)
+ESTADO_REGISTRO = np.dtype([("seq", "<u8"), ("frame", "<u8"), ("tempo_sim", "<f8"), ("publicado_em", "<f8"),
+                            ("luz_vertical", "u1"), ("luz_horizontal", "u1"), ("estado_plano", "u1"), ("modo_degradado", "u1"),
+                            ("esperando_vertical", "<u2"), ("esperando_horizontal", "<u2"), ("pedestres_esperando", "<u2"),
+                            ("carros_via", "<u2"), ("timer", "<u4"), ("prioridade", "<f4"), ("tempo_recomendado", "<f4"),
+                            ("defasagem_decisao_s", "<f4"), ("duracao_frame_ms", "<f4"), ("duracao_passo_ms", "<f4")])
+
+
+class PublicadorEstado:
+    """
+    Publica o estado a cada frame num anel de registros de largura fixa dentro de um arquivo mapeado
+    em memória (ESTADO_CABECALHO + capacidade * ESTADO_REGISTRO). Sem locks: cada slot tem um seqlock
+    (seq ímpar durante a escrita, par ao terminar) e `publicados` só avança depois do slot pronto.
+    Leitores externos mapeiam o mesmo arquivo (LeitorEstado ou np.memmap com os mesmos dtypes).
+    """
+    def __init__(self, caminho, capacidade=1024):
+        tamanho = ESTADO_CABECALHO.itemsize + capacidade * ESTADO_REGISTRO.itemsize
+        with open(caminho, "wb") as f:
+            f.truncate(tamanho)
+        self._arquivo = open(caminho, "r+b")
+        self._mapa = mmap.mmap(self._arquivo.fileno(), tamanho)
+        self.cabecalho = np.frombuffer(self._mapa, dtype=ESTADO_CABECALHO, count=1)
+        self.registros = np.frombuffer(self._mapa, dtype=ESTADO_REGISTRO, count=capacidade, offset=ESTADO_CABECALHO.itemsize)
+        self.cabecalho[0] = (ESTADO_MAGICO, 2, capacidade, ESTADO_REGISTRO.itemsize, 0, 0)
+        self.capacidade = capacidade
+        self.publicados = 0
+
+    def publicar(self, sim, duracao_frame_s, duracao_passo_s):
+        n = self.publicados
+        slot = n % self.capacidade
+        seq = self.registros["seq"]
+        seq[slot] = 2 * n + 1
+        controlador = sim.controlador
+        tempo_recomendado = getattr(controlador, "last_tempo_recomendado", float("nan"))
+        self.registros[slot] = (2 * n + 1, sim.frame, sim.tempo_sim, time.time(),
+                                ESTADOS_LUZ.index(sim.luz_vertical.estado), ESTADOS_LUZ.index(sim.luz_horizontal.estado),
+                                controlador.plano.codigo, int(controlador.em_modo_degradado),
+                                sim.carros_esperando_vertical, sim.carros_esperando_horizontal, sim.pedestres_esperando_total,
+                                len(sim.todos_carros), controlador.timer, controlador.last_priority_score, tempo_recomendado,
+                                controlador.defasagem_decisao_s, duracao_frame_s * 1000.0, duracao_passo_s * 1000.0)
+        seq[slot] = 2 * n + 2
+        self.publicados = n + 1
+        self.cabecalho["publicados"] = n + 1
+
+    def fechar(self):
+        del self.cabecalho, self.registros
+        self._mapa.close()
+        self._arquivo.close()
+
+
+class LeitorEstado:
+    """Lado do leitor: mapeia o arquivo de PublicadorEstado só para leitura; os arrays são vistas (sem cópia)."""
+    def __init__(self, caminho):
+        self._arquivo = open(caminho, "rb")
+        self._mapa = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        self.cabecalho = np.frombuffer(self._mapa, dtype=ESTADO_CABECALHO, count=1)
+        if self.cabecalho["magico"][0] != ESTADO_MAGICO:
+            raise ValueError(f"{caminho}: não é um arquivo de estado do simulador")
+        self.capacidade = int(self.cabecalho["capacidade"][0])
+        self.registros = np.frombuffer(self._mapa, dtype=ESTADO_REGISTRO, count=self.capacidade, offset=ESTADO_CABECALHO.itemsize)
+
+    def ultimo(self, tentativas=100):
+        """Cópia consistente do registro mais recente (ou None se nada foi publicado)."""
+        for _ in range(tentativas):
+            n = int(self.cabecalho["publicados"][0])
+            if n == 0:
+                return None
+            slot = (n - 1) % self.capacidade
+            antes = int(self.registros["seq"][slot])
+            registro = self.registros[slot].copy()
+            if antes % 2 == 0 and antes == int(self.registros["seq"][slot]):
+                return registro
+        return None
+
+
+def monitorar_estado(caminho, intervalo=0.5):
+    """Exemplo de leitor externo: imprime o último estado publicado a cada `intervalo` s (Ctrl+C sai)."""
+    leitor = LeitorEstado(caminho)
+    try:
+        while True:
+            r = leitor.ultimo()
+            if r is not None:
+                print(f"frame={r['frame']} t={r['tempo_sim']:.1f}s luzes V={ESTADOS_LUZ[r['luz_vertical']]} H={ESTADOS_LUZ[r['luz_horizontal']]} fase={r['estado_plano'] // 3} "
+                      f"fila V={r['esperando_vertical']} H={r['esperando_horizontal']} ped={r['pedestres_esperando']} "
+                      f"prioridade={r['prioridade']:.2f} tempo_rec={r['tempo_recomendado']:.2f}s "
+                      f"duração frame={r['duracao_frame_ms']:.2f}ms passo={r['duracao_passo_ms']:.3f}ms atraso={time.time() - r['publicado_em']:.3f}s")
+            time.sleep(intervalo)
+    except KeyboardInterrupt:
+        pass
+
+
+# --- MÉTRICAS (CSV) ---
+METRICAS_CABECALHO = ["timestamp", "sim_time_s", "carros_via", "total_gerado", "carros_saíram", "esperando_vertical", "esperando_horizontal", "pedestres_esperando", "prioridade", "hora", "defasagem_decisao_s", "perdas_prazo_update", "perdas_prazo_decisao", "modo_degradado", "atraso_medio_carros_s", "atraso_p95_carros_s", "espera_media_pedestres_s"]
+
+
+# colunas numéricas agregadas no armazém (mesmos valores das linhas do CSV)
+COLUNAS_ARMAZEM = ["carros_via", "total_gerado", "carros_saíram", "esperando_vertical", "esperando_horizontal", "pedestres_esperando",
+                   "prioridade", "defasagem_decisao_s", "atraso_medio_carros_s", "espera_media_pedestres_s"]
+RESOLUCOES_ARMAZEM = {"1s": 1, "1min": 60, "1h": 3600}
+
+
+class ArmazemMetricas:
+    """
+    Rollups das métricas em várias resoluções (1 s, 1 min, 1 h), um arquivo por resolução com
+    registros de largura fixa: início do intervalo, nº de amostras e, por coluna, mín/máx (float32)
+    e soma (float64) — a média é soma/n. A cada PASSO_INDICE registros um par (t, nº do registro)
+    vai para o índice esparso (<resolução>.idx), então consultar() lê só os blocos do intervalo pedido.
+    O eixo de tempo é contínuo entre execuções: cada execução começa depois do último intervalo de 1 h
+    gravado (ver inicio_execucao).
+    """
+    PASSO_INDICE = 256
+    _INDICE = np.dtype([("t", "<f8"), ("registro", "<u8")])
+
+    def __init__(self, diretorio, colunas=COLUNAS_ARMAZEM):
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.colunas = list(colunas)
+        arquivo_colunas = self.diretorio / "colunas.txt"
+        if arquivo_colunas.exists():
+            gravadas = arquivo_colunas.read_text(encoding="utf-8").split()
+            if gravadas != self.colunas:
+                raise ValueError(f"{self.diretorio}: armazém com outras colunas ({gravadas})")
+        else:
+            arquivo_colunas.write_text("\n".join(self.colunas), encoding="utf-8")
+        campos = [("t", "<f8"), ("n", "<u4")]
+        for c in self.colunas:
+            campos += [(c + "_min", "<f4"), (c + "_max", "<f4"), (c + "_soma", "<f8")]
+        self.registro = np.dtype(campos)
+        self._arquivos = {}
+        self._indices = {}
+        self._contagem = {}
+        self._aberto = {}  # resolução -> [início, n, mín, máx, soma] do intervalo em andamento
+        self.fim = 0.0     # fim do último intervalo gravado na maior resolução
+        for nome, largura in RESOLUCOES_ARMAZEM.items():
+            caminho = self.diretorio / f"{nome}.bin"
+            self._contagem[nome] = caminho.stat().st_size // self.registro.itemsize if caminho.exists() else 0
+            caminho_indice = self.diretorio / f"{nome}.idx"
+            self._indices[nome] = np.fromfile(caminho_indice, dtype=self._INDICE) if caminho_indice.exists() else np.zeros(0, self._INDICE)
+            if self._contagem[nome]:
+                ultimo = np.fromfile(caminho, dtype=self.registro, count=1, offset=(self._contagem[nome] - 1) * self.registro.itemsize)
+                self.fim = max(self.fim, float(ultimo["t"][0]) + largura)
+            self._aberto[nome] = None
+
+    def inicio_execucao(self, agora=None):
+        """Instante inicial de uma nova execução: agora, ou logo após o último intervalo de 1 h gravado."""
+        agora = time.time() if agora is None else agora
+        return max(agora, self.fim)
+
+    def _arquivo(self, nome):
+        if nome not in self._arquivos:
+            self._arquivos[nome] = (open(self.diretorio / f"{nome}.bin", "ab"), open(self.diretorio / f"{nome}.idx", "ab"))
+        return self._arquivos[nome]
+
+    def _gravar(self, nome, aberto):
+        inicio, n, minimo, maximo, soma = aberto
+        rec = np.zeros(1, self.registro)
+        rec["t"], rec["n"] = inicio, n
+        for i, c in enumerate(self.colunas):
+            rec[c + "_min"], rec[c + "_max"], rec[c + "_soma"] = minimo[i], maximo[i], soma[i]
+        dados, indice = self._arquivo(nome)
+        numero = self._contagem[nome]
+        if numero % self.PASSO_INDICE == 0:
+            entrada = np.array([(inicio, numero)], dtype=self._INDICE)
+            indice.write(entrada.tobytes())
+            self._indices[nome] = np.concatenate([self._indices[nome], entrada])
+        dados.write(rec.tobytes())
+        self._contagem[nome] = numero + 1
+        self.fim = max(self.fim, inicio + RESOLUCOES_ARMAZEM[nome])
+
+    def adicionar(self, t, valores):
+        """Acrescenta uma amostra (valores na ordem de `colunas`) no instante t; t deve ser crescente."""
+        valores = np.asarray(valores, dtype=float)
+        for nome, largura in RESOLUCOES_ARMAZEM.items():
+            inicio = t - t % largura
+            aberto = self._aberto[nome]
+            if aberto is not None and aberto[0] != inicio:
+                self._gravar(nome, aberto)
+                aberto = None
+            if aberto is None:
+                self._aberto[nome] = [inicio, 1, valores.copy(), valores.copy(), valores.copy()]
+            else:
+                aberto[1] += 1
+                np.minimum(aberto[2], valores, out=aberto[2])
+                np.maximum(aberto[3], valores, out=aberto[3])
+                aberto[4] += valores
+
+    def fechar(self):
+        """Grava os intervalos em andamento (parciais) e fecha os arquivos."""
+        for nome, aberto in self._aberto.items():
+            if aberto is not None:
+                self._gravar(nome, aberto)
+                self._aberto[nome] = None
+        for dados, indice in self._arquivos.values():
+            dados.close()
+            indice.close()
+        self._arquivos = {}
+
+    def escolher_resolucao(self, inicio, fim, max_pontos=2000):
+        """Resolução mais fina cujo número de intervalos em [inicio, fim) não passa de max_pontos."""
+        for nome, largura in RESOLUCOES_ARMAZEM.items():
+            if (fim - inicio) / largura <= max_pontos:
+                return nome
+        return nome
+
+    def consultar(self, inicio, fim, resolucao=None, colunas=None):
+        """
+        Intervalos com início em [inicio, fim) na resolução pedida (None = escolher_resolucao).
+        Retorna dict: 't', 'n' e, por coluna, '<c>_min', '<c>_max', '<c>_media' (arrays numpy).
+        Só lê do arquivo os blocos do índice que cobrem o intervalo.
+        """
+        nome = resolucao or self.escolher_resolucao(inicio, fim)
+        for dados, _ in self._arquivos.values():
+            dados.flush()
+        indice = self._indices[nome]
+        total = self._contagem[nome]
+        k = int(np.searchsorted(indice["t"], inicio, side="right")) - 1
+        primeiro = int(indice["registro"][k]) if k >= 0 else 0
+        k = int(np.searchsorted(indice["t"], fim, side="left"))
+        ultimo = int(indice["registro"][k]) if k < len(indice) else total
+        recs = np.fromfile(self.diretorio / f"{nome}.bin", dtype=self.registro, count=max(ultimo - primeiro, 0),
+                           offset=primeiro * self.registro.itemsize) if ultimo > primeiro else np.zeros(0, self.registro)
+        recs = recs[(recs["t"] >= inicio) & (recs["t"] < fim)]
+        saida = {"resolucao": nome, "t": recs["t"], "n": recs["n"]}
+        for c in colunas or self.colunas:
+            saida[c + "_min"] = recs[c + "_min"]
+            saida[c + "_max"] = recs[c + "_max"]
+            saida[c + "_media"] = recs[c + "_soma"] / np.maximum(recs["n"], 1)
+        return saida
+
+
+class RegistradorMetricas:
+    """
+    Grava uma linha de métricas por intervalo de tempo simulado (append em CSV).
+    Com `armazem` (ArmazemMetricas) as mesmas amostras alimentam os rollups, no instante
+    inicio_execucao + tempo simulado.
+    """
+    def __init__(self, caminho=ARQUIVOS_METRICAS, intervalo=1.0, armazem=None):
+        caminho = self.arquivo_compativel(Path(caminho))
+        self.caminho = caminho
+        self.armazem = armazem
+        self._inicio_armazem = armazem.inicio_execucao() if armazem is not None else None
+        # logging CSV: cria arquivo e escreve header se necessário
+        metricas_cabecalho = not caminho.exists() or caminho.stat().st_size == 0
+        self.arquivo = open(caminho, "a", newline="", encoding="utf-8")
+        self.escritor = csv.writer(self.arquivo)
+        if metricas_cabecalho:
+            self.escritor.writerow(METRICAS_CABECALHO)
+            self.arquivo.flush()
+        self.intervalo = intervalo
+        self.ultimo_registro = 0.0
+
+    @staticmethod
+    def arquivo_compativel(caminho):
+        """
+        Arquivo onde as linhas de METRICAS_CABECALHO podem ser acrescentadas: o próprio `caminho` se não
+        existir ou tiver o mesmo cabeçalho; senão <nome>.v2.csv, .v3... (nunca mistura esquemas num arquivo).
+        """
+        candidato, versao = caminho, 1
+        while candidato.exists():
+            with open(candidato, newline="", encoding="utf-8") as f:
+                cabecalho = next(csv.reader(f), None)
+            if cabecalho in (None, METRICAS_CABECALHO):
+                break
+            versao += 1
+            candidato = caminho.with_name(f"{caminho.stem}.v{versao}{caminho.suffix}")
+        if candidato != caminho:
+            print(f"{caminho}: cabeçalho de outra versão; métricas gravadas em {candidato}")
+        return candidato
+
+    def registrar(self, sim, timestamp=None):
+        """Grava a linha se já passou `intervalo` segundos simulados desde a última."""
+        if sim.tempo_sim - self.ultimo_registro < self.intervalo:
+            return False
+        if timestamp is None:
+            timestamp = time.time()
+        carros_via = len(sim.todos_carros)
+        atraso_medio, espera_media = sim.agentes.media(GRUPOS_CARROS), sim.agentes.media(GRUPOS_PEDESTRES)
+        self.escritor.writerow([timestamp, f"{sim.tempo_sim:.2f}", carros_via, sim.total_gerado, sim.carros_saíram, sim.carros_esperando_vertical, sim.carros_esperando_horizontal, sim.pedestres_esperando_total, f"{sim.controlador.last_priority_score:.2f}", sim.ambiente['hora'], f"{sim.controlador.defasagem_decisao_s:.3f}", sim.controlador.perdas_prazo_update, sim.controlador.perdas_prazo_decisao, int(sim.controlador.em_modo_degradado),
+                                f"{atraso_medio:.2f}", f"{sim.agentes.percentil(GRUPOS_CARROS, 95):.2f}", f"{espera_media:.2f}"])
+        self.arquivo.flush()
+        if self.armazem is not None:
+            self.armazem.adicionar(self._inicio_armazem + sim.tempo_sim, [
+                carros_via, sim.total_gerado, sim.carros_saíram, sim.carros_esperando_vertical, sim.carros_esperando_horizontal,
+                sim.pedestres_esperando_total, sim.controlador.last_priority_score, sim.controlador.defasagem_decisao_s, atraso_medio, espera_media])
+        self.ultimo_registro = sim.tempo_sim
+        return True
+
+    def gravar_latencias(self, controlador):
+        """Grava os histogramas de latência (update e decisão) em <arquivo>_latencias.csv (sobrescreve)."""
+        caminho = self.caminho.with_name(self.caminho.stem + "_latencias.csv")
+        with open(caminho, "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["limite_ms", "updates", "decisoes"])
+            for limite, cu, cd in zip(HistogramaLatencia.LIMITES_MS, controlador.latencias_update.contagens, controlador.latencias_decisao.contagens):
+                escritor.writerow([limite, cu, cd])
+            escritor.writerow([])
+            escritor.writerow(["orcamento_ms", controlador.orcamento_decisao_s * 1000.0])
+            escritor.writerow(["modo_degradado", controlador.modo_degradado])
+            escritor.writerow(["perdas_prazo_update", controlador.perdas_prazo_update])
+            escritor.writerow(["perdas_prazo_decisao", controlador.perdas_prazo_decisao])
+
+    def gravar_atrasos(self, agentes):
+        """Grava atraso médio e percentis por aproximação/faixa em <arquivo>_atrasos.csv (sobrescreve)."""
+        caminho = self.caminho.with_name(self.caminho.stem + "_atrasos.csv")
+        with open(caminho, "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["grupo", "concluidos", "atraso_medio_s", "p50_s", "p95_s", "p99_s"])
+            for grupo, n, media, p50, p95, p99 in agentes.resumo_grupos():
+                escritor.writerow([grupo, n, f"{media:.3f}", f"{p50:.3f}", f"{p95:.3f}", f"{p99:.3f}"])
+
+    def gravar_travessias(self, agendador):
+        """Grava os pedidos de travessia servidos por fase e a vazão perdida para os cortes em <arquivo>_travessias.csv (sobrescreve)."""
+        caminho = self.caminho.with_name(self.caminho.stem + "_travessias.csv")
+        with open(caminho, "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["fase", "ativacoes", "pedidos_servidos", "pedidos_por_ativacao", "espera_media_s"])
+            for nome, ativacoes, servidos, por_ativacao, espera in agendador.por_fase():
+                escritor.writerow([nome, ativacoes, servidos, f"{por_ativacao:.3f}", f"{espera:.3f}"])
+            escritor.writerow([])
+            escritor.writerow(["cortes_de_verde", agendador.cortes])
+            escritor.writerow(["verde_cortado_s", f"{agendador.verde_cortado_s:.3f}"])
+            escritor.writerow(["carros_retidos", agendador.carros_retidos])
+
+    def fechar(self):
+        self.arquivo.close()
+        if self.armazem is not None:
+            self.armazem.fechar()
+
+
+def executar_headless(duracao_s, relogio=None, ambiente=None, arquivo_metricas=ARQUIVOS_METRICAS, dt=1.0 / FPS, semente=None, caminho_trace=None, estado_inicial=None, monitor=None,
+                      renderizador=None):
+    """
+    Roda a simulação sem desenhar e sem limitar o FPS, com passo fixo dt (padrão: 1 frame).
+    duracao_s é tempo simulado; com relogio (modo dia) o dia avança dt * relogio.escala por passo.
+    Mesma semente => mesma execução; caminho_trace grava o trace binário.
+    estado_inicial (instantâneo) pula o aquecimento: a execução continua dele (re-semeada se houver semente).
+    Com monitor (MonitorEstacionario), para assim que as estimativas convergirem (duracao_s vira o máximo).
+    Com renderizador (RenderizadorOffscreen), grava os quadros enquanto roda.
+    Retorna a Simulacao ao final.
+    """
+    if estado_inicial is not None:
+        sim = Simulacao.a_partir_de(estado_inicial, semente)
+    else:
+        fluxos = FluxosAleatorios(semente)
+        gravador = GravadorTrace(caminho_trace, fluxos.semente, dt, relogio) if caminho_trace is not None else None
+        sim = Simulacao(ambiente=ambiente, relogio=relogio, semente=fluxos.semente, gravador=gravador)
+    gravador = sim.gravador
+    sim.controlador.imprimir_ativacoes = False
+    if FLUXO_MEDIDO is not None and sim.medidor is None:
+        sim.ativar_medidor(**FLUXO_MEDIDO)
+    if PREDITIVO is not None:
+        sim.ativar_preditivo(**PREDITIVO)
+    registrador = RegistradorMetricas(arquivo_metricas, armazem=ArmazemMetricas(ARMAZEM_METRICAS) if ARMAZEM_METRICAS else None) if arquivo_metricas is not None else None
+    publicador = PublicadorEstado(EXPORTACAO_ESTADO) if EXPORTACAO_ESTADO else None
+    inicio = time.perf_counter()
+    fim_s = sim.tempo_sim + duracao_s
+    try:
+        while sim.tempo_sim < fim_s:
+            inicio_passo = time.perf_counter()
+            if sim.passo(dt):
+                a = sim.ambiente
+                print(f"[{a['hora']}] ambiente: {a['clima']} | Carros: {a['fluxo_de_carros']} | Pedestres: {a['fluxo_de_pedestres']}")
+            if publicador is not None:
+                duracao_passo = time.perf_counter() - inicio_passo
+                publicador.publicar(sim, duracao_passo, duracao_passo)
+            if registrador is not None:
+                registrador.registrar(sim)
+            if renderizador is not None:
+                renderizador.quadro(sim)
+            if monitor is not None and monitor.registrar(sim):
+                break
+    finally:
+        if registrador is not None:
+            registrador.gravar_latencias(sim.controlador)
+            registrador.gravar_atrasos(sim.agentes)
+            registrador.gravar_travessias(sim.controlador.agendador)
+            registrador.fechar()
+        if gravador is not None:
+            gravador.fechar(sim)
+        if publicador is not None:
+            publicador.fechar()
+    decorrido = time.perf_counter() - inicio
+    print(f"Headless: {sim.tempo_sim:.0f}s simulados em {decorrido:.1f}s ({sim.tempo_sim / max(decorrido, 1e-9):.1f}x tempo real) | gerados={sim.total_gerado} saíram={sim.carros_saíram} | semente={sim.rng.semente} assinatura={sim.assinatura_estado():08x}")
+    print(f"  latência update: {sim.controlador.latencias_update.resumo()} | perdas de prazo: {sim.controlador.perdas_prazo_update}")
+    print(f"  latência decisão: {sim.controlador.latencias_decisao.resumo()} | perdas de prazo: {sim.controlador.perdas_prazo_decisao} (modo degradado: {sim.controlador.modo_degradado})")
+    agentes = sim.agentes
+    print(f"  atraso carros: média={agentes.media(GRUPOS_CARROS):.2f}s p50={agentes.percentil(GRUPOS_CARROS, 50):.2f}s "
+          f"p95={agentes.percentil(GRUPOS_CARROS, 95):.2f}s p99={agentes.percentil(GRUPOS_CARROS, 99):.2f}s | "
+          f"espera pedestres: média={agentes.media(GRUPOS_PEDESTRES):.2f}s p95={agentes.percentil(GRUPOS_PEDESTRES, 95):.2f}s")
+    print(f"  disparos das regras: {sim.controlador.fuzzy_brain.resumo_disparos()}")
+    if sim.medidor is not None:
+        print(f"  fluxo medido: {sim.medidor.resumo(sim.tempo_sim)}")
+    if sim.controlador.preditivo is not None:
+        print(f"  preditivo: {sim.controlador.preditivo.resumo()}")
+    if PLANO_FASES is not None:
+        print(f"  plano de fases: {sim.controlador.plano.resumo()}")
+    print(f"  travessias: {sim.controlador.agendador.resumo()}")
+    if monitor is not None:
+        print(f"  estado estacionário: {monitor.resumo()}")
+    return sim
+
+
+def reproduzir_trace(caminho, renderizador=None):
+    """
+    Reexecuta um trace gravado (spawns/ambientes do arquivo, sem RNG) e confere decisões e assinatura final.
+    Com renderizador (RenderizadorOffscreen), grava os quadros da reexecução.
+    Retorna True se a reexecução bateu com a gravação.
+    """
+    trace = LeitorTrace(caminho)
+    if trace.fim is None:
+        raise ValueError(f"{caminho}: trace incompleto (sem registro final)")
+    sim = Simulacao(trace=trace)
+    sim.controlador.imprimir_ativacoes = False
+    if FLUXO_MEDIDO is not None:
+        sim.ativar_medidor(**FLUXO_MEDIDO)
+    if PREDITIVO is not None:
+        sim.ativar_preditivo(**PREDITIVO)
+    gravadas = iter(trace.decisoes)
+    divergencias = 0
+    estados = (sim.luz_vertical.estado, sim.luz_horizontal.estado)
+    inicio = time.perf_counter()
+    while sim.frame < trace.fim[0]:
+        sim.passo(trace.dt)
+        if renderizador is not None:
+            renderizador.quadro(sim)
+        novos = (sim.luz_vertical.estado, sim.luz_horizontal.estado)
+        if novos != estados:
+            esperada = next(gravadas, None)
+            if esperada is None or esperada[:3] != (sim.frame,) + novos:
+                divergencias += 1
+                if divergencias <= 5:
+                    print(f"  divergência no frame {sim.frame}: gravado={esperada} reexecutado={novos}")
+            estados = novos
+    decorrido = time.perf_counter() - inicio
+    _, assinatura, total_gerado, saidas = trace.fim
+    ok = divergencias == 0 and sim.assinatura_estado() == assinatura and (sim.total_gerado, sim.carros_saíram) == (total_gerado, saidas)
+    print(f"Replay: {sim.frame} frames em {decorrido:.1f}s | semente={trace.semente} | decisões divergentes={divergencias} | "
+          f"assinatura {sim.assinatura_estado():08x} (gravada {assinatura:08x}) -> {'OK' if ok else 'DIVERGIU'}")
+    return ok
+
+
+# --- RENDER OFFSCREEN ---
+FORMATOS_QUADRO = ("png", "raw")
+
+
+def _png(rgb, largura, altura, nivel=6):
+    """PNG (RGB, 8 bits, sem entrelaçamento) a partir de bytes RGB crus, só com zlib/struct."""
+    passo = largura * 3
+    linhas = b"".join(b"\x00" + rgb[y * passo:(y + 1) * passo] for y in range(altura))  # filtro 0 em cada linha
+
+    def bloco(tipo, dados):
+        return struct.pack(">I", len(dados)) + tipo + dados + struct.pack(">I", zlib.crc32(tipo + dados))
+    return (b"\x89PNG\r\n\x1a\n" + bloco(b"IHDR", struct.pack(">IIBBBBB", largura, altura, 8, 2, 0, 0, 0))
+            + bloco(b"IDAT", zlib.compress(linhas, nivel)) + bloco(b"IEND", b""))
+
+
+def _codificar_quadro(rgb, largura, altura, caminho, nivel):
+    """Roda no pool: codifica um quadro em PNG e grava. Retorna o tamanho em bytes."""
+    dados = _png(rgb, largura, altura, nivel)
+    Path(caminho).write_bytes(dados)
+    return len(dados)
+
+
+class RenderizadorOffscreen:
+    """
+    Desenha a simulação numa Surface comum (driver de vídeo dummy, sem janela) e grava quadros:
+     - 'png': um PNG por quadro em destino/quadro_<frame>.png, codificados num pool de processos;
+     - 'raw': vídeo cru rgb24 num único arquivo `destino`
+       (ex.: ffmpeg -f rawvideo -pix_fmt rgb24 -s 800x800 -r 60/passo -i destino clip.mp4).
+    Só 1 a cada `passo_quadros` frames é desenhado. O fundo (vias e faixas) é estático e desenhado uma vez.
+    Cada processo tem no máximo 2 quadros pendentes. Acima disso o loop espera o mais antigo, para a
+    memória não crescer quando a codificação é mais lenta que a simulação.
+    """
+    def __init__(self, destino, formato="png", passo_quadros=1, processos=None, nivel_compressao=6):
+        if formato not in FORMATOS_QUADRO:
+            raise ValueError(f"formato de quadro desconhecido: {formato} (use {', '.join(FORMATOS_QUADRO)})")
+        self.destino = Path(destino)
+        self.formato = formato
+        self.passo_quadros = max(1, int(passo_quadros))
+        self.nivel_compressao = nivel_compressao
+        self.superficie = pygame.Surface((LARGURA_TELA, ALTURA_TELA))
+        self.fundo = pygame.Surface((LARGURA_TELA, ALTURA_TELA))
+        desenho_ambiente(self.fundo)
+        self.quadros = 0
+        self.bytes_gravados = 0
+        self.tempo_desenho_s = 0.0
+        self.tempo_espera_s = 0.0
+        if formato == "png":
+            self.destino.mkdir(parents=True, exist_ok=True)
+            self._pool = ProcessPoolExecutor(max_workers=processos)
+            self._max_pendentes = 2 * self._pool._max_workers
+            self._pendentes = deque()
+            self._arquivo = None
+        else:
+            self.destino.parent.mkdir(parents=True, exist_ok=True)
+            self._pool = None
+            self._arquivo = open(self.destino, "wb")
+        self._inicio = time.perf_counter()
+
+    def desenhar(self, sim):
+        """Quadro da simulação: fundo, sprites, semáforos e uma linha de estado. Retorna a Surface."""
+        superficie = self.superficie
+        superficie.blit(self.fundo, (0, 0))
+        sim.todos_carros.draw(superficie)
+        sim.todos_pedestres.draw(superficie)
+        sim.luz_vertical.draw(superficie)
+        sim.luz_horizontal.draw(superficie)
+        a = sim.ambiente
+        texto = (f"{a['hora']} t={sim.tempo_sim:.1f}s | fila V:{sim.carros_esperando_vertical} H:{sim.carros_esperando_horizontal} "
+                 f"| ped:{sim.pedestres_esperando_total} | prioridade {sim.controlador.last_priority_score:.2f} | {a['clima']}")
+        superficie.blit(fonte.render(texto, True, COR_PRETA), (10, 10))
+        return superficie
+
+    def quadro(self, sim):
+        """Chamado a cada frame; desenha e envia para gravação 1 a cada passo_quadros."""
+        if sim.frame % self.passo_quadros:
+            return
+        inicio = time.perf_counter()
+        rgb = pygame.image.tobytes(self.desenhar(sim), "RGB")
+        self.tempo_desenho_s += time.perf_counter() - inicio
+        self.quadros += 1
+        if self._arquivo is not None:
+            self._arquivo.write(rgb)
+            self.bytes_gravados += len(rgb)
+            return
+        if len(self._pendentes) >= self._max_pendentes:
+            inicio = time.perf_counter()
+            self.bytes_gravados += self._pendentes.popleft().result()
+            self.tempo_espera_s += time.perf_counter() - inicio
+        caminho = self.destino / f"quadro_{sim.frame:08d}.png"
+        self._pendentes.append(self._pool.submit(_codificar_quadro, rgb, LARGURA_TELA, ALTURA_TELA, caminho, self.nivel_compressao))
+
+    def fechar(self):
+        if self._pool is not None:
+            while self._pendentes:
+                self.bytes_gravados += self._pendentes.popleft().result()
+            self._pool.shutdown()
+        if self._arquivo is not None:
+            self._arquivo.close()
+        decorrido = time.perf_counter() - self._inicio
+        print(f"Render: {self.quadros} quadros ({self.formato}, 1 a cada {self.passo_quadros} frames) em {self.destino} | "
+              f"{self.bytes_gravados / 2 ** 20:.1f}MB | {decorrido:.1f}s (desenho {self.tempo_desenho_s:.1f}s, espera do pool {self.tempo_espera_s:.1f}s)")
+
+
+# --- PAINEL DA JANELA ---
+class PainelInterface:
+    """
+    Textos informativos, botão "Alterar Ambiente" e alerta de mudança de ambiente desenhados sobre a simulação.
+    As superfícies de texto ficam num cache por conteúdo (até MAX_TEXTOS; ao encher, é esvaziado): os
+    valores mudam poucas vezes por segundo, então quase todo frame reaproveita as superfícies do anterior.
+    O fundo do alerta também é reaproveitado enquanto o tamanho não muda.
+    """
+    MAX_TEXTOS = 256
+    ALERTA_ALTERACAO_AMBIENTE = 3.0  # segundos que o alerta permanece visível
+
+    def __init__(self, botao_ativo=True):
+        # botão para alterar ambiente (canto superior direito)
+        self.botao_rect = pygame.Rect(LARGURA_TELA - 180, 50, 170, 34)
+        self.botao_cor = (50, 50, 60)
+        self.botao_texto = fonte.render("Alterar Ambiente (E)", True, COR_BRANCA)
+        self.botao_ativo = botao_ativo
+        # alerta visual quando o ambiente muda
+        self.alerta_comeco = None
+        self.alerta_texto = ""
+        self._textos = {}
+        self._overlay = None
+
+    def texto(self, conteudo, cor=COR_PRETA):
+        """Superfície do texto (fonte padrão), renderizada só na primeira vez que aparece."""
+        chave = (conteudo, cor)
+        superficie = self._textos.get(chave)
+        if superficie is None:
+            if len(self._textos) >= self.MAX_TEXTOS:
+                self._textos.clear()
+            superficie = self._textos[chave] = fonte.render(conteudo, True, cor)
+        return superficie
+
+    def alertar(self, sim):
+        a = sim.ambiente
+        self.alerta_texto = f"Ambiente alterado: {a['clima']} | Carros: {a['fluxo_de_carros']} | Pedestres: {a['fluxo_de_pedestres']} | Hora: {a['hora']}"
+        self.alerta_comeco = sim.tempo_sim
+
+    def _desenhar_botao(self, superficie):
+        pygame.draw.rect(superficie, self.botao_cor, self.botao_rect, border_radius=6)
+        # borda ligeiramente mais clara
+        pygame.draw.rect(superficie, (90,90,100), self.botao_rect, 2, border_radius=6)
+        superficie.blit(self.botao_texto, (self.botao_rect.x + 10, self.botao_rect.y + (self.botao_rect.height - self.botao_texto.get_height())//2))
+
+    def desenhar(self, sim, superficie=None):
+        if superficie is None:
+            superficie = tela
+        controlador, ambiente = sim.controlador, sim.ambiente
+
+        # textos informativos
+        info_v = self.texto(f"Carros esperando na Vertical: {sim.carros_esperando_vertical}")
+        info_h = self.texto(f"Carros esperando na Horizontal: {sim.carros_esperando_horizontal}")
+        ped_info = self.texto(f"Pedestres esperando: {sim.pedestres_esperando_total} | atravessando V:{sim.pedestres_atravessando_vertical} H:{sim.pedestres_atravessando_horizontal}")
+        if PLANO_FASES is not None:
+            # plano escolhido no --plano: mostra a fase em curso
+            plano = controlador.plano
+            priority_text = self.texto(f"Prioridade (Fuzzy): {controlador.last_priority_score:.2f} | Fase: {plano.nomes_fases[plano.fase]}")
+        else:
+            priority_text = self.texto(f"Prioridade (Fuzzy): {controlador.last_priority_score:.2f}")
+
+        # mostra tempo recomendado (se disponível no controlador) logo abaixo de pedestres esperando
+        if hasattr(controlador, 'last_tempo_recomendado'):
+            tempo_recomendado_text = self.texto(f"Tempo recomendado: {controlador.last_tempo_recomendado:.2f}s (defasagem {controlador.defasagem_decisao_s:.2f}s)")
+        else:
+            tempo_recomendado_text = self.texto("Tempo recomendado: -")
+
+        # posições de desenho dos textos (mantém espaçamento)
+        superficie.blit(info_v, (10, 10))
+        superficie.blit(info_h, (10, 35))
+        superficie.blit(ped_info, (10, 60))
+        superficie.blit(tempo_recomendado_text, (10, 60 + ped_info.get_height() + 6))  # abaixo de ped_info
+        superficie.blit(priority_text, (LARGURA_TELA // 2 - priority_text.get_width() // 2, 10))
+
+        # exibe variáveis aleatórias do ambiente
+        ambiente_clima = self.texto(f"Clima: {ambiente['clima']}")
+        if sim.medidor is not None and sim.medidor._entradas is not None:
+            # fluxos que o controlador está usando (medidos, 0..10) ao lado do rótulo do ambiente
+            medido_carros, medido_pedestres = sim.medidor._entradas
+            ambiente_fluxo_carros = self.texto(f"Fluxo Carros: {ambiente['fluxo_de_carros']} (medido {medido_carros:.1f})")
+            ambiente_fluxo_pedestres = self.texto(f"Fluxo Pedestres: {ambiente['fluxo_de_pedestres']} (medido {medido_pedestres:.1f})")
+        else:
+            ambiente_fluxo_carros = self.texto(f"Fluxo Carros: {ambiente['fluxo_de_carros']}")
+            ambiente_fluxo_pedestres = self.texto(f"Fluxo Pedestres: {ambiente['fluxo_de_pedestres']}")
+        ambiente_hora = self.texto(f"Horário: {ambiente['hora']}")
+
+        superficie.blit(info_v, (10, 10))
+        superficie.blit(info_h, (10, 35))
+        superficie.blit(ped_info, (10, 60))
+        superficie.blit(tempo_recomendado_text, (10, 60 + ped_info.get_height() + 6))  # abaixo de ped_info
+        superficie.blit(priority_text, (LARGURA_TELA // 2 - priority_text.get_width() // 2, 10))
+
+        # posição de exibição das variáveis ambientais (canto superior direito),
+        # e posiciona o botão logo abaixo do "Horário"
+        x_off = LARGURA_TELA - 10
+        y0 = 10
+        y_clima = y0
+        y_fluxo_carros = y_clima + ambiente_clima.get_height() + 4
+        y_fluxo_pedestres = y_fluxo_carros + ambiente_fluxo_carros.get_height() + 4
+        y_hora = y_fluxo_pedestres + ambiente_fluxo_pedestres.get_height() + 4
+
+        superficie.blit(ambiente_clima, (x_off - ambiente_clima.get_width(), y_clima))
+        superficie.blit(ambiente_fluxo_carros, (x_off - ambiente_fluxo_carros.get_width(), y_fluxo_carros))
+        superficie.blit(ambiente_fluxo_pedestres, (x_off - ambiente_fluxo_pedestres.get_width(), y_fluxo_pedestres))
+        superficie.blit(ambiente_hora, (x_off - ambiente_hora.get_width(), y_hora))
+
+        # posiciona o botão imediatamente abaixo do "Horário"
+        padding_botao = 6
+        self.botao_rect.topleft = (x_off - self.botao_rect.width, y_hora + ambiente_hora.get_height() + padding_botao)
+
+        # desenha botão de alterar ambiente (agora posicionado dinamicamente)
+        if self.botao_ativo:
+            self._desenhar_botao(superficie)
+
+        # --- Desenha alerta de alteração de ambiente (se ativo) ---
+        if self.alerta_comeco is not None:
+            decorrido = sim.tempo_sim - self.alerta_comeco
+            if decorrido <= self.ALERTA_ALTERACAO_AMBIENTE:
+                # quebra o texto em linhas para evitar overflow
+                wrap_width = 56
+                lines = textwrap.wrap(self.alerta_texto, wrap_width)
+                # calcula dimensões do overlay conforme o maior texto
+                overlay_w = max((fonte.size(line)[0] for line in lines), default=200) + 40
+                overlay_h = len(lines) * fonte.get_linesize() + 24
+                if self._overlay is None or self._overlay.get_size() != (overlay_w, overlay_h):
+                    self._overlay = pygame.Surface((overlay_w, overlay_h), pygame.SRCALPHA)
+                    self._overlay.fill((20, 20, 20, 220))  # fundo escuro translúcido
+                ox = LARGURA_TELA // 2 - overlay_w // 2
+                oy = 80
+                superficie.blit(self._overlay, (ox, oy))
+                # desenha linhas centradas
+                for i, line in enumerate(lines):
+                    line_surf = self.texto(line, (255, 255, 255))
+                    superficie.blit(line_surf, (LARGURA_TELA // 2 - line_surf.get_width() // 2, oy + 12 + i * fonte.get_linesize()))
+            else:
+                self.alerta_comeco = None
+
+        # --- Botão para alterar ambiente (não usa refresh automático) ---
+        if self.botao_ativo:
+            self._desenhar_botao(superficie)
+
+
+# --- ESTRESSE: CAPACIDADE DO LOOP ---
+# níveis de demanda em múltiplos das taxas base (0.6 carro/s por via, 0.06 pedestre/s por faixa); 'Alto' = 1.3
+NIVEIS_ESTRESSE = (1.3, 2.0, 3.0, 5.0, 8.0, 12.0, 18.0, 27.0, 40.0)
+ETAPAS_PASSO = ("spawn", "pedestres", "controlador", "carros")
+ETAPAS_ESTRESSE = ETAPAS_PASSO + ("desenho",)
+
+
+def _memoria_residente_mb():
+    """Memória residente atual do processo (MB); sem /proc, o pico (getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / 2 ** 20 if sys.platform == "darwin" else pico / 1024
+
+
+def _medir_nivel_estresse(nivel, instancias, duracao_nivel_s, semente, dt, desenhar):
+    """Roda `instancias` cruzamentos lado a lado (um passo de cada por frame) com demanda `nivel` e mede o frame."""
+    alto = FLUXO_CARROS_MULTIPLOS["Alto"]
+    sims = []
+    for i in range(instancias):
+        sim = Simulacao(ambiente={"clima": "Ensolarado", "fluxo_de_carros": "Alto", "fluxo_de_pedestres": "Alto", "hora": "08:00:00"},
+                        semente=None if semente is None else semente + i)
+        sim.controlador.imprimir_ativacoes = False
+        sim.multiplicador_demanda = nivel / alto
+        sim.tempos_etapas = dict.fromkeys(ETAPAS_ESTRESSE, 0.0)
+        sims.append(sim)
+    frames = int(round(duracao_nivel_s / dt))
+    duracoes = np.empty(frames)
+    populacao = np.empty(frames, dtype=np.int64)
+    for f in range(frames):
+        inicio = time.perf_counter()
+        vivos = 0
+        for sim in sims:
+            sim.passo(dt)
+            if desenhar:
+                marca = time.perf_counter()
+                desenho_ambiente()
+                sim.todos_carros.draw(tela)
+                sim.todos_pedestres.draw(tela)
+                sim.luz_vertical.draw()
+                sim.luz_horizontal.draw()
+                sim.tempos_etapas["desenho"] += time.perf_counter() - marca
+            vivos += len(sim.todos_carros) + len(sim.todos_pedestres)
+        duracoes[f] = time.perf_counter() - inicio
+        populacao[f] = vivos
+    return {
+        "nivel": nivel,
+        "instancias": instancias,
+        "populacao_media": float(populacao.mean()),
+        "populacao_max": int(populacao.max()),
+        "frame_medio_ms": float(duracoes.mean() * 1000.0),
+        "frame_p95_ms": float(np.percentile(duracoes, 95) * 1000.0),
+        "frame_max_ms": float(duracoes.max() * 1000.0),
+        "etapas_ms": {etapa: sum(sim.tempos_etapas[etapa] for sim in sims) * 1000.0 / frames for etapa in ETAPAS_ESTRESSE},
+        "memoria_mb": _memoria_residente_mb(),
+        "saidas_carros_min": sum(sim.carros_saíram for sim in sims) * 60.0 / duracao_nivel_s,
+    }
+
+
+def encontrar_capacidade(niveis=NIVEIS_ESTRESSE, duracao_nivel_s=60.0, semente=None, orcamento_s=1.0 / FPS, dt=1.0 / FPS,
+                         desenhar=True, max_instancias=256):
+    """
+    Mede até onde o loop aguenta dentro do orçamento de um frame (passo + desenho dos sprites, sem textos).
+    1) Sobe a demanda de um cruzamento (ambiente Alto/Alto com multiplicador_demanda extra) pelos `niveis`.
+       A população de um cruzamento é limitada pela tela: carros que nascem sobre a fila parada saem na hora.
+       Quando a população média para de crescer (< 5% entre níveis), o cruzamento está saturado fisicamente.
+    2) A partir daí, com a maior demanda, dobra o número de cruzamentos simulados no mesmo processo (1, 2, 4...).
+    Cada nível começa de simulações novas e a subida para no primeiro nível cujo p95 do frame passa do orçamento.
+    A população sustentável é a maior população média de um nível dentro do orçamento. A etapa que
+    satura primeiro é a que mais cresceu (ms/frame) entre o primeiro nível e o que estourou.
+    Retorna (lista de dicts por nível, resumo).
+    """
+    resultados = []
+
+    def medir(nivel, instancias):
+        r = _medir_nivel_estresse(nivel, instancias, duracao_nivel_s, semente, dt, desenhar)
+        r["dentro_do_orcamento"] = r["frame_p95_ms"] <= orcamento_s * 1000.0
+        resultados.append(r)
+        print(f"  nível {nivel:>5.1f}x {instancias:>3d} cruz.: pop média={r['populacao_media']:7.1f} máx={r['populacao_max']:5d} | "
+              f"frame média={r['frame_medio_ms']:6.2f}ms p95={r['frame_p95_ms']:6.2f}ms | "
+              + " ".join(f"{etapa}={ms:.2f}" for etapa, ms in r["etapas_ms"].items())
+              + f" | mem={r['memoria_mb']:.0f}MB | saídas={r['saidas_carros_min']:.0f}/min", flush=True)
+        return r
+
+    saturacao_fisica = None
+    anterior = None
+    for nivel in niveis:
+        r = medir(nivel, 1)
+        if not r["dentro_do_orcamento"]:
+            break
+        if anterior is not None and r["populacao_media"] < anterior["populacao_media"] * 1.05:
+            saturacao_fisica = anterior["nivel"]
+            break
+        anterior = r
+    instancias = 2
+    while resultados[-1]["dentro_do_orcamento"] and instancias <= max_instancias:
+        medir(resultados[-1]["nivel"], instancias)
+        instancias *= 2
+
+    sustentaveis = [r for r in resultados if r["dentro_do_orcamento"]]
+    melhor = max(sustentaveis, key=lambda r: r["populacao_media"], default=None)
+    estouro = next((r for r in resultados if not r["dentro_do_orcamento"]), None)
+    resumo = {
+        "orcamento_ms": orcamento_s * 1000.0,
+        "populacao_sustentavel": melhor["populacao_media"] if melhor else 0.0,
+        "nivel_sustentavel": (melhor["nivel"], melhor["instancias"]) if melhor else None,
+        "saturacao_fisica": saturacao_fisica,
+        "nivel_estouro": (estouro["nivel"], estouro["instancias"]) if estouro else None,
+        "etapa_saturada": None,
+    }
+    if estouro is not None:
+        base = resultados[0]["etapas_ms"]
+        crescimento = {etapa: estouro["etapas_ms"][etapa] - base[etapa] for etapa in ETAPAS_ESTRESSE}
+        resumo["etapa_saturada"] = max(crescimento, key=crescimento.get)
+        resumo["crescimento_etapas_ms"] = crescimento
+    return resultados, resumo
+
+
+# --- TESTE DE MEMÓRIA (SOAK) ---
+# arquivos cujas alocações não interessam no ranking (o próprio tracemalloc e o import de módulos)
+FILTROS_TRACEMALLOC = ("<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>", tracemalloc.__file__)
+
+
+def teste_memoria(duracao_s, intervalo_s=300.0, limite_mb=32.0, semente=None, relogio=None, troca_ambiente_s=600.0,
+                  arquivo_metricas=None, desenhar=True, top=10, quadros_pilha=1, dt=1.0 / FPS):
+    """
+    Roda o loop da janela (passo, desenho dos sprites e do painel, métricas) por duracao_s simulados, sem
+    limitar o FPS, e amostra a memória a cada intervalo_s: RSS do processo, memória rastreada pelo
+    tracemalloc, agentes vivos e tamanho do arquivo de métricas. O RSS pega também o que o tracemalloc
+    não vê (superfícies do SDL/pygame); o tracemalloc diz em que linha do Python a memória foi alocada.
+    A primeira amostra (após um intervalo de aquecimento: caches, pools e arrays pré-alocados enchendo)
+    é a base. A cada amostra imprime as `top` linhas que mais cresceram desde a base.
+    Sem relógio (modo dia), o ambiente é sorteado de novo a cada troca_ambiente_s, como o botão do quiosque.
+    Falha se o RSS ou a memória rastreada crescer mais de limite_mb da base até o fim.
+    Retorna (lista de amostras, resumo).
+    """
+    sim = Simulacao(relogio=relogio, semente=semente)
+    sim.controlador.imprimir_ativacoes = False
+    painel = PainelInterface(botao_ativo=relogio is None)
+    registrador = RegistradorMetricas(arquivo_metricas) if arquivo_metricas is not None else None
+    filtros = [tracemalloc.Filter(False, nome) for nome in FILTROS_TRACEMALLOC]
+    ja_rastreava = tracemalloc.is_tracing()
+    if not ja_rastreava:
+        tracemalloc.start(quadros_pilha)
+    amostras = []
+    base = None
+    crescimento = []
+
+    def amostrar():
+        nonlocal base, crescimento
+        gc.collect()
+        rastreada, pico = tracemalloc.get_traced_memory()
+        amostra = {
+            "tempo_sim": sim.tempo_sim,
+            "rss_mb": _memoria_residente_mb(),
+            "rastreada_mb": rastreada / 2 ** 20,
+            "pico_rastreado_mb": pico / 2 ** 20,
+            "agentes_vivos": len(sim.todos_carros) + len(sim.todos_pedestres),
+            "indices_agentes": sim.agentes.n,
+            "metricas_kb": registrador.arquivo.tell() / 1024.0 if registrador is not None else 0.0,
+        }
+        amostras.append(amostra)
+        foto = tracemalloc.take_snapshot().filter_traces(filtros)
+        if base is None:
+            base = foto
+            crescimento = []
+        else:
+            crescimento = [e for e in foto.compare_to(base, "lineno") if e.size_diff > 0][:top]
+        print(f"  [{segundos_para_hora(int(sim.tempo_sim))} sim] RSS={amostra['rss_mb']:.1f}MB rastreada={amostra['rastreada_mb']:.2f}MB "
+              f"(pico {amostra['pico_rastreado_mb']:.2f}MB) | agentes vivos={amostra['agentes_vivos']} índices={amostra['indices_agentes']} | "
+              f"métricas={amostra['metricas_kb']:.0f}KB", flush=True)
+        for e in crescimento[:3]:
+            quadro = e.traceback[0]
+            print(f"      +{e.size_diff / 1024:.1f}KB ({e.count_diff:+d} blocos) {quadro.filename}:{quadro.lineno}")
+
+    inicio = time.perf_counter()
+    proxima_amostra = intervalo_s
+    proxima_troca = troca_ambiente_s
+    try:
+        while sim.tempo_sim < duracao_s:
+            if sim.passo(dt):
+                painel.alertar(sim)
+            if relogio is None and troca_ambiente_s and sim.tempo_sim >= proxima_troca:
+                sim.alterar_ambiente(sim.sortear_ambiente())
+                painel.alertar(sim)
+                proxima_troca += troca_ambiente_s
+            if desenhar:
+                desenho_ambiente()
+                sim.todos_carros.draw(tela)
+                sim.todos_pedestres.draw(tela)
+                sim.luz_vertical.draw()
+                sim.luz_horizontal.draw()
+                painel.desenhar(sim)
+            if registrador is not None:
+                registrador.registrar(sim)
+            if sim.tempo_sim >= proxima_amostra:
+                amostrar()
+                proxima_amostra += intervalo_s
+    finally:
+        if registrador is not None:
+            registrador.fechar()
+        if not ja_rastreava:
+            tracemalloc.stop()
+
+    resumo = {"duracao_s": sim.tempo_sim, "decorrido_s": time.perf_counter() - inicio, "limite_mb": limite_mb, "ok": True,
+              "crescimento_rss_mb": 0.0, "crescimento_rastreado_mb": 0.0, "inclinacao_rss_mb_h": 0.0, "maiores_crescimentos": crescimento}
+    if len(amostras) >= 2:
+        primeira, ultima = amostras[0], amostras[-1]
+        resumo["crescimento_rss_mb"] = ultima["rss_mb"] - primeira["rss_mb"]
+        resumo["crescimento_rastreado_mb"] = ultima["rastreada_mb"] - primeira["rastreada_mb"]
+        horas = np.array([a["tempo_sim"] for a in amostras]) / 3600.0
+        resumo["inclinacao_rss_mb_h"] = float(np.polyfit(horas, [a["rss_mb"] for a in amostras], 1)[0])
+        resumo["ok"] = max(resumo["crescimento_rss_mb"], resumo["crescimento_rastreado_mb"]) <= limite_mb
+    return amostras, resumo
+
+
+# --- CONFERÊNCIA DO SENSOR DE FILAS ---
+def conferir_sensor_filas(duracao_s=200.0, semente=None, ambiente=None, dt=1.0 / FPS, exemplos=5):
+    """
+    Roda uma execução headless e, no início de cada frame (onde o controlador lê as filas), compara as
+    contagens do SensorFilas com a varredura de referência carros_esperando() sobre todos os carros.
+    Sem ambiente, usa fluxo de carros 'Alto' (filas longas, onde os bloqueios por carro aparecem).
+    Retorna um resumo com o número de frames divergentes e os primeiros `exemplos` deles.
+    """
+    if ambiente is None:
+        ambiente = {"clima": "Ensolarado", "fluxo_de_carros": "Alto", "fluxo_de_pedestres": "Médio", "hora": "08:00:00"}
+    sim = Simulacao(ambiente=ambiente, semente=semente)
+    sim.controlador.imprimir_ativacoes = False
+    frames, divergentes, primeiros = 0, 0, []
+    while sim.tempo_sim < duracao_s:
+        referencia = {'v': 0, 'h': 0}
+        for car in sim.todos_carros:
+            if carros_esperando(car, sim.todos_carros, sim.controlador):
+                referencia[car.eixo] += 1
+        sensor = {'v': sim.sensor_filas.carros_esperando_vertical, 'h': sim.sensor_filas.carros_esperando_horizontal}
+        if sensor != referencia:
+            divergentes += 1
+            if len(primeiros) < exemplos:
+                primeiros.append((sim.frame, sensor, referencia))
+        frames += 1
+        sim.passo(dt)
+    return {"semente": sim.rng.semente, "frames": frames, "divergentes": divergentes, "exemplos": primeiros,
+            "ok": divergentes == 0}
+
+
+# --- VARREDURA DE CENÁRIOS (RESULTADOS POR CONTEÚDO E FILA EM ARQUIVOS) ---
+VERSAO_VARREDURA = 1  # mude quando a dinâmica da simulação mudar: invalida os resultados guardados
+_IMPRESSAO_FUZZY = None  # impressão digital da base fuzzy deste processo (calculada uma vez)
+
+
+def impressao_fuzzy():
+    global _IMPRESSAO_FUZZY
+    if _IMPRESSAO_FUZZY is None:
+        _IMPRESSAO_FUZZY = FuzzyControlador().impressao_digital()
+    return _IMPRESSAO_FUZZY
+
+
+def configuracao_controlador():
+    """Opções globais que mudam as decisões do controlador (plano, travessias, preditivo, fluxo medido, prazo)."""
+    return {"plano": PLANO_FASES or PLANO_DUAS_FASES, "travessias": AGENDA_TRAVESSIAS, "preditivo": PREDITIVO,
+            "fluxo_medido": FLUXO_MEDIDO, "orcamento_decisao_s": ORCAMENTO_DECISAO_S, "modo_degradado": MODO_DEGRADADO}
+
+
+def _aplicar_configuracao(configuracao):
+    global PLANO_FASES, AGENDA_TRAVESSIAS, PREDITIVO, FLUXO_MEDIDO, ORCAMENTO_DECISAO_S, MODO_DEGRADADO
+    PLANO_FASES = configuracao["plano"]
+    AGENDA_TRAVESSIAS = configuracao["travessias"]
+    PREDITIVO = configuracao["preditivo"]
+    FLUXO_MEDIDO = configuracao["fluxo_medido"]
+    ORCAMENTO_DECISAO_S = configuracao["orcamento_decisao_s"]
+    MODO_DEGRADADO = configuracao["modo_degradado"]
+
+
+def cenario(ambiente, semente, duracao_s, dt=1.0 / FPS):
+    """Descrição completa (tipos JSON) de uma execução headless: tudo o que decide o resultado."""
+    return {"versao": VERSAO_VARREDURA, "ambiente": dict(ambiente), "semente": int(semente), "duracao_s": float(duracao_s),
+            "dt": float(dt), "fuzzy": impressao_fuzzy(), "controlador": configuracao_controlador()}
+
+
+def chave_cenario(cenario):
+    """SHA-256 do cenário em JSON canônico (chaves ordenadas): mesmo cenário, mesma chave em qualquer máquina."""
+    texto = json.dumps(cenario, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def grade_cenarios(sementes, duracao_s, hora="08:00:00", dt=1.0 / FPS):
+    """Todos os climas x fluxos de carros x fluxos de pedestres, uma execução por semente."""
+    return [cenario({"clima": clima, "fluxo_de_carros": carros, "fluxo_de_pedestres": pedestres, "hora": hora}, semente, duracao_s, dt)
+            for clima in CLIMAS for carros in NIVEIS_DE_FLUXO for pedestres in NIVEIS_DE_FLUXO for semente in sementes]
+
+
+def executar_cenario(cenario, renovar=None, intervalo_renovar_s=30.0):
+    """
+    Roda um cenário do zero, sem desenhar, com a configuração do controlador gravada nele, e devolve
+    o resumo (tipos JSON). `renovar` é chamado a cada intervalo_renovar_s (tempo real) enquanto roda.
+    """
+    if cenario["fuzzy"] != impressao_fuzzy():
+        raise ValueError("a base fuzzy deste nó difere da do cenário")
+    _aplicar_configuracao(cenario["controlador"])
+    sim = Simulacao(ambiente=dict(cenario["ambiente"]), semente=cenario["semente"])
+    sim.controlador.imprimir_ativacoes = False
+    if FLUXO_MEDIDO is not None:
+        sim.ativar_medidor(**FLUXO_MEDIDO)
+    if PREDITIVO is not None:
+        sim.ativar_preditivo(**PREDITIVO)
+    dt, duracao_s = cenario["dt"], cenario["duracao_s"]
+    inicio = time.perf_counter()
+    proxima_renovacao = inicio + intervalo_renovar_s
+    soma_fila, passos = 0, 0
+    while sim.tempo_sim < duracao_s:
+        sim.passo(dt)
+        soma_fila += sim.carros_esperando_vertical + sim.carros_esperando_horizontal
+        passos += 1
+        if renovar is not None and passos % FPS == 0 and time.perf_counter() >= proxima_renovacao:
+            renovar()
+            proxima_renovacao = time.perf_counter() + intervalo_renovar_s
+    agentes = sim.agentes
+    return {"gerados": sim.total_gerado, "saíram": sim.carros_saíram, "fila_media": soma_fila / max(passos, 1),
+            "atraso_medio_carros_s": agentes.media(GRUPOS_CARROS), "atraso_p95_carros_s": agentes.percentil(GRUPOS_CARROS, 95),
+            "espera_media_pedestres_s": agentes.media(GRUPOS_PEDESTRES), "cortes_de_verde": sim.controlador.agendador.cortes,
+            "assinatura": sim.assinatura_estado(), "segundos_execucao": time.perf_counter() - inicio}
+
+
+class ArmazemVarredura:
+    """
+    Resultados dos cenários endereçados pela chave_cenario e fila de trabalho, tudo em arquivos num
+    diretório que várias máquinas podem compartilhar:
+      fila/<chave>.json              cenário pendente
+      executando/<chave>.json        cenário com dono; o mtime é a posse, renovada enquanto roda
+      resultados/<ch>/<chave>.json   cenário + resumo (ch = 2 primeiros caracteres da chave)
+      erros/<chave>.json             última falha (volta para a fila na próxima varredura)
+    Pegar um cenário é um os.rename de fila/ para executando/: só um nó consegue. Escritas vão para um
+    temporário e entram com os.replace, então nenhum arquivo aparece pela metade. Posse não renovada
+    há prazo_s (nó que caiu) volta para a fila; o prazo deve ser bem maior que a diferença entre os
+    relógios das máquinas. Se dois nós chegarem a rodar o mesmo cenário, o resultado é o mesmo
+    (execução determinística) e o segundo apenas o regrava.
+    """
+    def __init__(self, diretorio, no=None):
+        self.diretorio = Path(diretorio)
+        self.fila = self.diretorio / "fila"
+        self.executando = self.diretorio / "executando"
+        self.resultados = self.diretorio / "resultados"
+        self.erros = self.diretorio / "erros"
+        for d in (self.fila, self.executando, self.resultados, self.erros):
+            d.mkdir(parents=True, exist_ok=True)
+        self.no = no or f"{socket.gethostname()}-{os.getpid()}"
+
+    def _gravar(self, caminho, dados):
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        temporario = caminho.with_name(f".{caminho.name}.{self.no}.tmp")
+        temporario.write_text(json.dumps(dados, ensure_ascii=False, sort_keys=True), encoding="utf-8")
+        os.replace(temporario, caminho)
+
+    @staticmethod
+    def _remover(caminho):
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+    def _caminho_resultado(self, chave):
+        return self.resultados / chave[:2] / f"{chave}.json"
+
+    def resultado(self, chave):
+        """Resumo guardado do cenário, ou None se ainda não foi concluído."""
+        try:
+            return json.loads(self._caminho_resultado(chave).read_text(encoding="utf-8"))["resultado"]
+        except FileNotFoundError:
+            return None
+
+    def enfileirar(self, cenarios):
+        """Põe na fila os cenários sem resultado que não estão na fila nem executando. Retorna (chaves, nº enfileirados)."""
+        chaves, novos = [], 0
+        for c in cenarios:
+            chave = chave_cenario(c)
+            chaves.append(chave)
+            nome = f"{chave}.json"
+            if self._caminho_resultado(chave).exists() or (self.fila / nome).exists() or (self.executando / nome).exists():
+                continue
+            self._gravar(self.fila / nome, c)
+            novos += 1
+        return chaves, novos
+
+    def pegar(self, prazo_s=600.0):
+        """Tira um cenário da fila: (chave, cenário), ou None com a fila vazia. Posses vencidas voltam para a fila antes."""
+        while True:
+            for nome in sorted(os.listdir(self.fila)):
+                if not nome.endswith(".json"):
+                    continue
+                destino = self.executando / nome
+                try:
+                    os.rename(self.fila / nome, destino)
+                except OSError:
+                    continue  # outro nó pegou antes
+                os.utime(destino)
+                return nome[:-len(".json")], json.loads(destino.read_text(encoding="utf-8"))
+            if not self.recuperar_vencidos(prazo_s):
+                return None
+
+    def renovar(self, chave):
+        try:
+            os.utime(self.executando / f"{chave}.json")
+        except FileNotFoundError:
+            pass
+
+    def devolver(self, chave):
+        """Devolve à fila um cenário pego por este nó (interrompido no meio)."""
+        try:
+            os.rename(self.executando / f"{chave}.json", self.fila / f"{chave}.json")
+        except OSError:
+            pass
+
+    def concluir(self, chave, cenario, resultado):
+        self._gravar(self._caminho_resultado(chave), {"chave": chave, "cenario": cenario, "resultado": resultado,
+                                                      "no": self.no, "concluido_em": time.time()})
+        self._remover(self.executando / f"{chave}.json")
+        self._remover(self.erros / f"{chave}.json")
+
+    def falhar(self, chave, cenario, erro):
+        self._gravar(self.erros / f"{chave}.json", {"chave": chave, "cenario": cenario, "erro": erro, "no": self.no, "em": time.time()})
+        self._remover(self.executando / f"{chave}.json")
+
+    def recuperar_vencidos(self, prazo_s):
+        """Devolve à fila os cenários cuja posse não é renovada há prazo_s. Retorna quantos."""
+        limite = time.time() - prazo_s
+        recuperados = 0
+        for nome in os.listdir(self.executando):
+            caminho = self.executando / nome
+            try:
+                if nome.endswith(".json") and caminho.stat().st_mtime < limite:
+                    os.rename(caminho, self.fila / nome)
+                    recuperados += 1
+            except OSError:
+                continue
+        return recuperados
+
+    def situacao(self):
+        def contar(d):
+            return sum(1 for nome in os.listdir(d) if nome.endswith(".json"))
+        return {"fila": contar(self.fila), "executando": contar(self.executando),
+                "resultados": sum(contar(d) for d in self.resultados.iterdir() if d.is_dir()), "erros": contar(self.erros)}
+
+
+def _trabalhar_varredura(diretorio, prazo_s):
+    """Laço de um trabalhador: pega, executa e guarda cenários até a fila esvaziar. Retorna quantos executou."""
+    armazem = ArmazemVarredura(diretorio)
+    feitos = 0
+    while True:
+        pego = armazem.pegar(prazo_s)
+        if pego is None:
+            return feitos
+        chave, c = pego
+        try:
+            resultado = executar_cenario(c, renovar=lambda: armazem.renovar(chave), intervalo_renovar_s=prazo_s / 4)
+        except KeyboardInterrupt:
+            armazem.devolver(chave)
+            raise
+        except Exception as e:
+            armazem.falhar(chave, c, f"{type(e).__name__}: {e}")
+            continue
+        armazem.concluir(chave, c, resultado)
+        feitos += 1
+
+
+def trabalhar_varredura(diretorio, processos=None, prazo_s=600.0):
+    """
+    Executa cenários da fila de `diretorio` com `processos` trabalhadores neste nó (None -> um por CPU;
+    1 -> no próprio processo) até ela esvaziar. Outras máquinas podem fazer o mesmo no diretório compartilhado.
+    """
+    if processos == 1:
+        return _trabalhar_varredura(diretorio, prazo_s)
+    processos = processos or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(_trabalhar_varredura, str(diretorio), prazo_s) for _ in range(processos)]
+        return sum(f.result() for f in futuros)
+
+
 # --- FUNÇÃO MAIN() - MODIFICADA ---
-def main():
-    global total_gerado, BLOQUEIO_PEDESTRES_VERT, BLOQUEIO_PEDESTRES_HORI
-    luz_vertical = Semaforo(300, 150, 'vertical')
-    luz_horizontal = Semaforo(150, 300, 'horizontal')
-    controlador = ControladorSemaforo(luz_vertical, luz_horizontal)
-    todos_carros = pygame.sprite.Group()
-    todos_pedestres = pygame.sprite.Group()
-
-    # Variáveis para alternar o lado do spawn manual
-    lado_de_spawn_horizontal = 'esquerda'  # O próximo carro 'h' virá da esquerda
-    vertical_spawn_side = 'top'    # O próximo carro 'v' virá de cima
-
-    # logging CSV: cria arquivo e escreve header se necessário
-    metricas_cabecalho = not ARQUIVOS_METRICAS.exists()
-    metricas_f = open(ARQUIVOS_METRICAS, "a", newline="", encoding="utf-8")
-    metricas_escrever = csv.writer(metricas_f)
-    if metricas_cabecalho:
-        metricas_escrever.writerow(["timestamp", "sim_time_s", "carros_via", "total_gerado", "carros_saíram", "esperando_vertical", "esperando_horizontal", "pedestres_esperando", "prioridade"])
-        metricas_f.flush()
-
-    tempo_sim = 0.0
-    INTERVALO_REGISTROS = 1.0
-    ultimo_registro = 0.0
+def main(relogio=None, semente=None):
+    # na janela a inferência fuzzy roda em thread separada para não derrubar o FPS
+    sim = Simulacao(relogio=relogio, inferencia_assincrona=True, semente=semente)
+    if FLUXO_MEDIDO is not None:
+        sim.ativar_medidor(**FLUXO_MEDIDO)
+    if PREDITIVO is not None:
+        # rollouts fora do frame: a consulta se espalha por vários frames, no máximo uma fatia em cada
+        sim.ativar_preditivo(**PREDITIVO, fatia_ms=FATIA_PREDITIVO_JANELA_MS)
+    luz_vertical, luz_horizontal = sim.luz_vertical, sim.luz_horizontal
+    controlador = sim.controlador
+
+    registrador = RegistradorMetricas(ARQUIVOS_METRICAS, armazem=ArmazemMetricas(ARMAZEM_METRICAS) if ARMAZEM_METRICAS else None)
+    publicador = PublicadorEstado(EXPORTACAO_ESTADO) if EXPORTACAO_ESTADO else None
 
     # ambiente inicial e controle de refresh
-    ambiente = gerar_ambiente_aleatorio()
-    # NÃO usar auto-refresh: mudança será por botão/tecla
+    # NÃO usar auto-refresh: mudança será por botão/tecla (ou pelo relógio no modo dia)
     INTERVALO_ATUALIZACAO_AMBIENTE = None
     ultima_atualizacao_ambiente = None
 
-    # botão para alterar ambiente (canto superior direito)
-    botao_ambiente_rect = pygame.Rect(LARGURA_TELA - 180, 50, 170, 34)
-    botao_ambiente_cor = (50, 50, 60)
-    botao_ambiente_texto = fonte.render("Alterar Ambiente (E)", True, COR_BRANCA)
-
-    # alerta visual quando o ambiente muda
-    alerta_comeco_ambiente = None
-    ALERTA_ALTERACAO_AMBIENTE = 3.0  # segundos que o alerta permanece visível
-    alerta_texto_ambiente = ""
+    # textos, botão "Alterar Ambiente" (desativado no modo dia) e alerta de mudança de ambiente
+    painel = PainelInterface(botao_ativo=sim.relogio is None)
 
     try:
         while True:
             # controla dt e tempo simulado (usado para logging)
             dt_ms = tempo.tick(FPS)
             dt = dt_ms / 1000.0
-            tempo_sim += dt
 
             # atualiza ambiente aleatório periodicamente (apenas se INTERVALO_ATUALIZACAO_AMBIENTE for numérico)
-            if INTERVALO_ATUALIZACAO_AMBIENTE is not None:
+            if INTERVALO_ATUALIZACAO_AMBIENTE is not None and painel.botao_ativo:
                 # inicializa timestamp de referência na primeira passada
                 if ultima_atualizacao_ambiente is None:
-                    ultima_atualizacao_ambiente = tempo_sim
-                if tempo_sim - ultima_atualizacao_ambiente >= INTERVALO_ATUALIZACAO_AMBIENTE:
-                    novo_ambiente = gerar_ambiente_aleatorio()
-                    ambiente = novo_ambiente
-                    ultima_atualizacao_ambiente = tempo_sim
-
+                    ultima_atualizacao_ambiente = sim.tempo_sim
+                if sim.tempo_sim - ultima_atualizacao_ambiente >= INTERVALO_ATUALIZACAO_AMBIENTE:
                     # --- RESET ao mudar ambiente: remove todos os carros e pedestres ---
-                    todos_carros.empty()
-                    todos_pedestres.empty()
-                    # zera flags de bloqueio de pedestres (caso algum estivesse atravessando)
-                    BLOQUEIO_PEDESTRES_VERT = 0
-                    BLOQUEIO_PEDESTRES_HORI = 0
+                    sim.alterar_ambiente(sim.sortear_ambiente())
+                    ultima_atualizacao_ambiente = sim.tempo_sim
 
                     # registra alerta para exibição na tela
-                    alerta_texto_ambiente = f"Ambiente alterado: {ambiente['clima']} | Carros: {ambiente['fluxo_de_carros']} | Pedestres: {ambiente['fluxo_de_pedestres']} | Hora: {ambiente['hora']}"
-                    alerta_comeco_ambiente = tempo_sim
+                    painel.alertar(sim)
 
             # Loop de eventos (apenas QUIT / ESC)
             for event in pygame.event.get():
@@ -913,309 +4451,234 @@ def main():
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                     raise KeyboardInterrupt
                 # tecla rápida para alterar ambiente
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_e:
+                if painel.botao_ativo and event.type == pygame.KEYDOWN and event.key == pygame.K_e:
                     # gerar novo ambiente e resetar sprites
-                    ambiente = gerar_ambiente_aleatorio()
-                    todos_carros.empty()
-                    todos_pedestres.empty()
-                    BLOQUEIO_PEDESTRES_VERT = 0
-                    BLOQUEIO_PEDESTRES_HORI = 0
-                    alerta_texto_ambiente = f"Ambiente alterado: {ambiente['clima']} | Carros: {ambiente['fluxo_de_carros']} | Pedestres: {ambiente['fluxo_de_pedestres']} | Hora: {ambiente['hora']}"
-                    alerta_comeco_ambiente = tempo_sim
+                    sim.alterar_ambiente(sim.sortear_ambiente())
+                    painel.alertar(sim)
                 # clique no botão do mouse para alterar ambiente
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    if botao_ambiente_rect.collidepoint(event.pos):
-                        ambiente = gerar_ambiente_aleatorio()
-                        todos_carros.empty()
-                        todos_pedestres.empty()
-                        BLOQUEIO_PEDESTRES_VERT = 0
-                        BLOQUEIO_PEDESTRES_HORI = 0
-                        alerta_texto_ambiente = f"Ambiente alterado: {ambiente['clima']} | Carros: {ambiente['fluxo_de_carros']} | Pedestres: {ambiente['fluxo_de_pedestres']} | Hora: {ambiente['hora']}"
-                        alerta_comeco_ambiente = tempo_sim
-
-            # --- SPAWN AUTOMÁTICO ALEATÓRIO ---
-            # taxas base (por segundo)
-            base_spam_carros_horizontal = 0.6   # base carros por segundo na via horizontal
-            base_spam_carros_vertical = 0.6   # base carros por segundo na via vertical
-            base_spam_pedestres_cada = 0.06  # base probabilidade por segundo por faixa (cada uma das 4)
-
-            # aplica multiplicadores gerados pelo "fluxo" do ambiente
-            carros_multiplicadores = FLUXO_CARROS_MULTIPLOS.get(ambiente["fluxo_de_carros"], 1.0)
-            pedestres_multiplicadores = FLUXO_PEDESTRES_MULTIPLOS.get(ambiente["fluxo_de_pedestres"], 1.0)
-
-            taxa_geracao_carros_horizontal = base_spam_carros_horizontal * carros_multiplicadores
-            taxa_geracao_carros_vertical = base_spam_carros_vertical * carros_multiplicadores
-            taxa_geracao_pedestres_cada = base_spam_pedestres_cada * pedestres_multiplicadores
-
-            # carros horizontais (alterna lado de spawn)
-            if random.random() < taxa_geracao_carros_horizontal * dt:
-                if lado_de_spawn_horizontal == 'esquerda':
-                    c = Carro(-40, 370, 'direita')  # vem da esquerda
-                    lado_de_spawn_horizontal = 'direita'
-                else:
-                    c = Carro(LARGURA_TELA, 410, 'esquerda')  # vem da direita
-                    lado_de_spawn_horizontal = 'esquerda'
-                todos_carros.add(c)
-                total_gerado += 1
-
-            # carros verticais (alterna topo/baixo)
-            if random.random() < taxa_geracao_carros_vertical * dt:
-                if vertical_spawn_side == 'top':
-                    c = Carro(370, -40, 'pra_baixo')  # vem de cima
-                    vertical_spawn_side = 'bottom'
-                else:
-                    c = Carro(410, ALTURA_TELA, 'pra_cima')  # vem de baixo
-                    vertical_spawn_side = 'top'
-                todos_carros.add(c)
-                total_gerado += 1
-
-            # pedestres — cada faixa tem sua chance
-            if random.random() < taxa_geracao_pedestres_cada * dt:
-                todos_pedestres.add(Pedestre('h_n'))
-                controlador.requisicao_travessia_pedestre('h')
-            if random.random() < taxa_geracao_pedestres_cada * dt:
-                todos_pedestres.add(Pedestre('h_s'))
-                controlador.requisicao_travessia_pedestre('h')
-            if random.random() < taxa_geracao_pedestres_cada * dt:
-                todos_pedestres.add(Pedestre('v_r'))
-                controlador.requisicao_travessia_pedestre('v')
-            if random.random() < taxa_geracao_pedestres_cada * dt:
-                todos_pedestres.add(Pedestre('v_l'))
-                controlador.requisicao_travessia_pedestre('v')
-
-            # --- PERCEPÇÃO DO AGENTE (SENSORES) ---
-            # conta carros em fila por eixo
-            carros_esperando_vertical = 0
-            carros_esperando_horizontal = 0
-            for car in todos_carros:
-                if carros_esperando(car, todos_carros, controlador):
-                    if car.direcao in ('pra_baixo', 'pra_cima'):
-                        carros_esperando_vertical += 1
-                    else:
-                        carros_esperando_horizontal += 1
-
-            # atualiza pedestres (decidem iniciar travessia) e conta esperando / atravessando
-            pedestres_esperando_total = 0
-            pedestres_atravessando_vertical = 0  # pedestres atravessando sobre a via vertical (impactam tráfego vertical)
-            pedestres_atravessando_horizontal = 0  # pedestres atravessando sobre a via horizontal (impactam tráfego horizontal)
-
-            # atualiza estado dos pedestres (move quem já está atravessando)
-            for ped in list(todos_pedestres):
-                ped.update(luz_vertical, luz_horizontal)
-
-            # computa contagens após update
-            for ped in todos_pedestres:
-                if ped.esperando:
-                    pedestres_esperando_total += 1
-                if ped.atravessando:
-                    if ped.orientacao in ('h_n', 'h_s'):
-                        pedestres_atravessando_vertical += 1
-                    else:
-                        pedestres_atravessando_horizontal += 1
-
-            # atualiza flags globais que bloqueiam carros nas áreas de fila
-            BLOQUEIO_PEDESTRES_VERT = pedestres_atravessando_vertical
-            BLOQUEIO_PEDESTRES_HORI = pedestres_atravessando_horizontal
-
-            # atualiza controlador com as contagens de carros esperando
-            controlador.update(carros_esperando_vertical, carros_esperando_horizontal, ambiente=ambiente, pedestres_esperando_total=pedestres_esperando_total)
-
-            # --- Atualiza movimento dos carros (depois de avaliar bloqueios por pedestres) ---
-            todos_carros.update(todos_carros, luz_vertical, luz_horizontal)
+                if painel.botao_ativo and event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    if painel.botao_rect.collidepoint(event.pos):
+                        sim.alterar_ambiente(sim.sortear_ambiente())
+                        painel.alertar(sim)
+
+            # --- SPAWN, SENSORES, CONTROLADOR E MOVIMENTO ---
+            inicio_passo = time.perf_counter()
+            if sim.passo(dt):
+                # modo dia: o relógio cruzou uma fronteira de agenda (sem reset dos sprites)
+                painel.alertar(sim)
+            duracao_passo = time.perf_counter() - inicio_passo
 
             # --- DESENHO ---
             desenho_ambiente()
-            todos_carros.draw(tela)
-            todos_pedestres.draw(tela)
+            sim.todos_carros.draw(tela)
+            sim.todos_pedestres.draw(tela)
             luz_vertical.draw()
             luz_horizontal.draw()
-
-            # textos informativos
-            info_v = fonte.render(f"Carros esperando na Vertical: {carros_esperando_vertical}", True, COR_PRETA)
-            info_h = fonte.render(f"Carros esperando na Horizontal: {carros_esperando_horizontal}", True, COR_PRETA)
-            ped_info = fonte.render(f"Pedestres esperando: {pedestres_esperando_total} | atravessando V:{pedestres_atravessando_vertical} H:{pedestres_atravessando_horizontal}", True, COR_PRETA)
-            priority_text = fonte.render(f"Prioridade (Fuzzy): {controlador.last_priority_score:.2f}", True, COR_PRETA)
-
-            # mostra tempo recomendado (se disponível no controlador) logo abaixo de pedestres esperando
-            if hasattr(controlador, 'last_tempo_recomendado'):
-                tempo_recomendado_text = fonte.render(f"Tempo recomendado: {controlador.last_tempo_recomendado:.2f}s", True, COR_PRETA)
-            else:
-                tempo_recomendado_text = fonte.render("Tempo recomendado: -", True, COR_PRETA)
-
-            # posições de desenho dos textos (mantém espaçamento)
-            tela.blit(info_v, (10, 10))
-            tela.blit(info_h, (10, 35))
-            tela.blit(ped_info, (10, 60))
-            tela.blit(tempo_recomendado_text, (10, 60 + ped_info.get_height() + 6))  # abaixo de ped_info
-            tela.blit(priority_text, (LARGURA_TELA // 2 - priority_text.get_width() // 2, 10))
-
-            # exibe variáveis aleatórias do ambiente
-            ambiente_clima = fonte.render(f"Clima: {ambiente['clima']}", True, COR_PRETA)
-            ambiente_fluxo_carros = fonte.render(f"Fluxo Carros: {ambiente['fluxo_de_carros']}", True, COR_PRETA)
-            ambiente_fluxo_pedestres = fonte.render(f"Fluxo Pedestres: {ambiente['fluxo_de_pedestres']}", True, COR_PRETA)
-            ambiente_hora = fonte.render(f"Horário: {ambiente['hora']}", True, COR_PRETA)
-
-            tela.blit(info_v, (10, 10))
-            tela.blit(info_h, (10, 35))
-            tela.blit(ped_info, (10, 60))
-            tela.blit(tempo_recomendado_text, (10, 60 + ped_info.get_height() + 6))  # abaixo de ped_info
-            tela.blit(priority_text, (LARGURA_TELA // 2 - priority_text.get_width() // 2, 10))
-
-            # posição de exibição das variáveis ambientais (canto superior direito),
-            # e posiciona o botão logo abaixo do "Horário"
-            x_off = LARGURA_TELA - 10
-            y0 = 10
-            y_clima = y0
-            y_fluxo_carros = y_clima + ambiente_clima.get_height() + 4
-            y_fluxo_pedestres = y_fluxo_carros + ambiente_fluxo_carros.get_height() + 4
-            y_hora = y_fluxo_pedestres + ambiente_fluxo_pedestres.get_height() + 4
-
-            tela.blit(ambiente_clima, (x_off - ambiente_clima.get_width(), y_clima))
-            tela.blit(ambiente_fluxo_carros, (x_off - ambiente_fluxo_carros.get_width(), y_fluxo_carros))
-            tela.blit(ambiente_fluxo_pedestres, (x_off - ambiente_fluxo_pedestres.get_width(), y_fluxo_pedestres))
-            tela.blit(ambiente_hora, (x_off - ambiente_hora.get_width(), y_hora))
-
-            # posiciona o botão imediatamente abaixo do "Horário"
-            padding_botao = 6
-            botao_x = x_off - botao_ambiente_rect.width
-            botao_y = y_hora + ambiente_hora.get_height() + padding_botao
-            botao_ambiente_rect.topleft = (botao_x, botao_y)
-
-            # desenha botão de alterar ambiente (agora posicionado dinamicamente)
-            pygame.draw.rect(tela, botao_ambiente_cor, botao_ambiente_rect, border_radius=6)
-            pygame.draw.rect(tela, (90,90,100), botao_ambiente_rect, 2, border_radius=6)
-            tela.blit(botao_ambiente_texto, (botao_ambiente_rect.x + 10, botao_ambiente_rect.y + (botao_ambiente_rect.height - botao_ambiente_texto.get_height())//2))
-
-            # --- Desenha alerta de alteração de ambiente (se ativo) ---
-            if alerta_comeco_ambiente is not None:
-                decorrido = tempo_sim - alerta_comeco_ambiente
-                if decorrido <= ALERTA_ALTERACAO_AMBIENTE:
-                    # quebra o texto em linhas para evitar overflow
-                    wrap_width = 56
-                    lines = textwrap.wrap(alerta_texto_ambiente, wrap_width)
-                    # calcula dimensões do overlay conforme o maior texto
-                    overlay_w = max((fonte.size(line)[0] for line in lines), default=200) + 40
-                    overlay_h = len(lines) * fonte.get_linesize() + 24
-                    overlay_s = pygame.Surface((overlay_w, overlay_h), pygame.SRCALPHA)
-                    overlay_s.fill((20, 20, 20, 220))  # fundo escuro translúcido
-                    ox = LARGURA_TELA // 2 - overlay_w // 2
-                    oy = 80
-                    tela.blit(overlay_s, (ox, oy))
-                    # desenha linhas centradas
-                    for i, line in enumerate(lines):
-                        line_surf = fonte.render(line, True, (255, 255, 255))
-                        tela.blit(line_surf, (LARGURA_TELA // 2 - line_surf.get_width() // 2, oy + 12 + i * fonte.get_linesize()))
-                else:
-                    alerta_comeco_ambiente = None
-
-            # --- Botão para alterar ambiente (não usa refresh automático) ---
-            pygame.draw.rect(tela, botao_ambiente_cor, botao_ambiente_rect, border_radius=6)
-            # borda ligeiramente mais clara
-            pygame.draw.rect(tela, (90,90,100), botao_ambiente_rect, 2, border_radius=6)
-            tela.blit(botao_ambiente_texto, (botao_ambiente_rect.x + 10, botao_ambiente_rect.y + (botao_ambiente_rect.height - botao_ambiente_texto.get_height())//2))
+            painel.desenhar(sim)
 
             pygame.display.flip()
 
             # grava métricas a cada INTERVALO_REGISTROS segundos
-            if tempo_sim - ultimo_registro >= INTERVALO_REGISTROS:
-                timestamp = time.time()
-                carros_via = len(todos_carros)
-                metricas_escrever.writerow([timestamp, f"{tempo_sim:.2f}", carros_via, total_gerado, carros_saíram, carros_esperando_vertical, carros_esperando_horizontal, pedestres_esperando_total, f"{controlador.last_priority_score:.2f}"])
-                metricas_f.flush()
-                ultimo_registro = tempo_sim
+            registrador.registrar(sim)
+            # estado ao vivo para processos externos
+            if publicador is not None:
+                publicador.publicar(sim, dt, duracao_passo)
 
     except KeyboardInterrupt:
         # encerra limpo
-        metricas_f.close()
+        registrador.gravar_latencias(controlador)
+        registrador.gravar_atrasos(sim.agentes)
+        registrador.gravar_travessias(controlador.agendador)
+        registrador.fechar()
+        if publicador is not None:
+            publicador.fechar()
+        if controlador.inferencia is not None:
+            controlador.inferencia.parar()
         pygame.quit()
         sys.exit()
 
-if __name__ == '__main__':
-    main()
-
-# --- PEDRESTES ---
-class Pedestre(pygame.sprite.Sprite):
-    """
-    Pedestre atravessa sobre as faixas; orientações:
-     - 'h_n' = faixa superior vertical (vem de cima)
-     - 'h_s' = faixa inferior vertical (vem de baixo)
-     - 'v_r' = faixa direita horizontal (vem da direita)
-     - 'v_l' = faixa esquerda horizontal (vem da esquerda)
-    """
-    def __init__(self, orientacao):
-        super().__init__()
-        self.orientacao = orientacao
-        self.velocidade = 1.6
-        self.esperando = True
-        self.atravessando = False
-
-        # limites das vias (para garantir faixas só sobre as vias)
-        estrada_x0, estrada_x1 = 340, 460
-        estrada_y0, estrada_y1 = 340, 460
-
-        # calcula posições de faixa consistentes com desenho_ambiente
-        # norte: alinhar com PARADA_EMBAIXO_MAX
-        norte_y = PARADA_EMBAIXO_MAX - CW_GAP - CW_THICKNESS + CW_THICKNESS // 2
-        # sul: alinhar com PARADA_CIMA_MIN + CW_GAP
-        sul_y = PARADA_CIMA_MIN + CW_GAP + CW_THICKNESS // 2
-        # oeste: alinhar com PARADA_DIREITA_MAX
-        oeste_x = PARADA_DIREITA_MAX - CW_GAP - CW_THICKNESS + CW_THICKNESS // 2
-        # leste: alinhar com PARADA_ESQUERDA_MIN + CW_GAP
-        leste_x = PARADA_ESQUERDA_MIN + CW_GAP + CW_THICKNESS // 2
-
-        if orientacao == 'h_n':
-            y = norte_y
-            self.pos = pygame.Vector2(estrada_x0 - 30, y)
-            self.alvo = pygame.Vector2(estrada_x1 + 30, y)
-            tamanho = (10, 16)
-        elif orientacao == 'h_s':
-            y = sul_y
-            self.pos = pygame.Vector2(estrada_x0 - 30, y)
-            self.alvo = pygame.Vector2(estrada_x1 + 30, y)
-            tamanho = (10, 16)
-        elif orientacao == 'v_r':
-            x = leste_x
-            self.pos = pygame.Vector2(x, estrada_y0 - 30)
-            self.alvo = pygame.Vector2(x, estrada_y1 + 30)
-            tamanho = (16, 10)
-        else:  # v_l
-            x = oeste_x
-            self.pos = pygame.Vector2(x, estrada_y0 - 30)
-            self.alvo = pygame.Vector2(x, estrada_y1 + 30)
-            tamanho = (16, 10)
-
-        surf = pygame.Surface(tamanho, pygame.SRCALPHA)
-        COLOR_PEDESTRIAN = (240, 128, 128)
-        pygame.draw.ellipse(surf, COLOR_PEDESTRIAN, surf.get_rect())
-        self.image = surf
-       
-        self.rect = self.image.get_rect(center=(int(self.pos.x), int(self.pos.y)))
-
-    def update(self, luz_vertical, luz_horizontal):
-        # decide se pode iniciar travessia: somente quando o tráfego PERPENDICULAR estiver RED
-        if self.esperando:
-            if self.orientacao in ('h_n', 'h_s'):
-                # esses atravessam a via vertical -> precisam que luz_vertical seja RED
-                if luz_vertical.estado == 'vermelho':
-                    self.esperando = False
-                    self.atravessando = True
-            else:
-                # atravessam a via horizontal -> precisam que luz_horizontal seja RED
-                if luz_horizontal.estado == 'vermelho':
-                    self.esperando = False
-                    self.atravessando = True
+def _argumentos():
+    import argparse
+    parser = argparse.ArgumentParser(description="Simulador de Semáforo com Lógica Fuzzy")
+    # qualquer opção deste grupo roda sem abrir janela (args.sem_janela); sem nenhuma, abre a janela interativa
+    modos = parser.add_argument_group("modos sem janela")
+    modos.add_argument("--headless", action="store_true", help="roda sem janela, o mais rápido possível")
+    parser.add_argument("--duracao", type=float, default=None, help="tempo simulado em segundos (headless; padrão: 1 dia no modo dia, 600s fora dele)")
+    parser.add_argument("--dia", action="store_true", help="modo dia: relógio avança e ambiente segue as agendas")
+    parser.add_argument("--hora-inicial", default="00:00:00", help="hora inicial do relógio no modo dia (HH:MM:SS)")
+    parser.add_argument("--escala-relogio", type=float, default=1.0, help="segundos do dia por segundo simulado (modo dia)")
+    parser.add_argument("--metricas", default=str(ARQUIVOS_METRICAS), help="arquivo CSV de métricas")
+    parser.add_argument("--armazem-metricas", default=None, help="diretório do armazém de rollups (1 s / 1 min / 1 h) com índice de tempo")
+    modos.add_argument("--consultar-armazem", nargs=2, metavar=("INICIO", "FIM"), type=float, default=None,
+                        help="imprime em CSV os rollups de --armazem-metricas entre dois instantes (epoch s) e sai")
+    parser.add_argument("--resolucao", choices=list(RESOLUCOES_ARMAZEM), default=None, help="resolução da consulta (padrão: automática)")
+    parser.add_argument("--exportar-estado", default=None, help="publica o estado de cada frame neste arquivo mapeado em memória (anel sem locks)")
+    modos.add_argument("--monitorar-estado", default=None, help="lê e imprime o estado publicado por outra execução (--exportar-estado) e sai com Ctrl+C")
+    parser.add_argument("--orcamento-ms", type=float, default=ORCAMENTO_DECISAO_S * 1000.0, help="prazo de cada decisão do controlador (ms)")
+    parser.add_argument("--modo-degradado", choices=["ultimo_bom", "tabela", "fixo"], default=MODO_DEGRADADO, help="tempo usado quando a decisão perde o prazo")
+    parser.add_argument("--semente", type=int, default=None, help="semente dos fluxos aleatórios (mesma semente = mesma execução headless)")
+    parser.add_argument("--gravar-trace", default=None, help="grava o trace binário da execução headless neste arquivo")
+    modos.add_argument("--reproduzir-trace", default=None, help="reexecuta um trace gravado e confere o resultado")
+    parser.add_argument("--salvar-instantaneo", default=None, help="salva o estado final da execução headless (aquecimento reutilizável)")
+    parser.add_argument("--carregar-instantaneo", default=None, help="começa a execução headless deste instantâneo")
+    parser.add_argument("--precisao", type=float, default=None, help="headless: para quando o IC 95%% de fila, vazão e pedestres esperando tiver esta precisão relativa (ex.: 0.05); --duracao vira o máximo")
+    parser.add_argument("--ramos", type=int, default=0, help="com --carregar-instantaneo: roda N ramos (sementes --semente, +1, ...) em paralelo")
+    modos.add_argument("--relatorio-regras", action="store_true", help="compila a base de regras, imprime o relatório (mortas/duplicadas/subsumidas) e sai")
+    modos.add_argument("--estresse", action="store_true", help="sobe a demanda além de 'Alto' até o frame passar de 16,7 ms e informa a capacidade do loop")
+    parser.add_argument("--duracao-nivel", type=float, default=60.0, help="tempo simulado por nível no --estresse (s)")
+    modos.add_argument("--teste-memoria", action="store_true", help="soak: roda o loop da janela sem janela por --duracao e falha se a memória crescer além de --limite-memoria-mb")
+    parser.add_argument("--intervalo-memoria", type=float, default=300.0, help="tempo simulado entre amostras de memória no --teste-memoria (s)")
+    parser.add_argument("--limite-memoria-mb", type=float, default=32.0, help="crescimento máximo (RSS ou tracemalloc) desde a primeira amostra no --teste-memoria")
+    modos.add_argument("--conferir-sensor", action="store_true", help="compara o sensor de filas com carros_esperando() a cada frame por --duracao (padrão 200s, fluxo Alto) e falha se divergir")
+    parser.add_argument("--fluxo-medido", choices=["ewma", "janela"], default=None,
+                        help="alimenta o fuzzy com as taxas de chegada medidas (EWMA ou janela deslizante) em vez dos rótulos do ambiente (repita no --reproduzir-trace)")
+    parser.add_argument("--tau-fluxo", type=float, default=8.0, help="constante de tempo do EWMA do --fluxo-medido (s)")
+    parser.add_argument("--janela-fluxo", type=float, default=30.0, help="largura da janela deslizante do --fluxo-medido (s)")
+    parser.add_argument("--preditivo", action="store_true", help="escolhe as trocas por rollouts curtos (agora / em 5 s / em 10 s), com o fuzzy como prior (repita no --reproduzir-trace)")
+    parser.add_argument("--horizonte-preditivo", type=float, default=20.0, help="segundos simulados em cada rollout do --preditivo")
+    parser.add_argument("--orcamento-preditivo-ms", type=float, default=None, help="tempo máximo por decisão do --preditivo (ms; padrão: sem limite, reprodutível)")
+    parser.add_argument("--fatia-preditivo-ms", type=float, default=FATIA_PREDITIVO_JANELA_MS,
+                        help="na janela: tempo máximo por frame dos rollouts do --preditivo (ms); a decisão se espalha por vários frames")
+    parser.add_argument("--verde-minimo", type=float, default=AGENDA_TRAVESSIAS["verde_minimo_s"], help="verde mínimo (s) antes que pedidos de travessia possam encurtá-lo")
+    parser.add_argument("--lote-travessia", type=int, default=AGENDA_TRAVESSIAS["lote"], help="pedidos pendentes que encerram o verde atual (1 = cada pedestre corta o verde)")
+    parser.add_argument("--espera-maxima-travessia", type=float, default=AGENDA_TRAVESSIAS["espera_maxima_s"], help="espera máxima (s) de um pedido antes de encerrar o verde atual")
+    parser.add_argument("--plano", default=None, help=f"plano de fases: {', '.join(PLANOS)} (padrão: 2fases) ou arquivo JSON no mesmo formato (repita no --reproduzir-trace)")
+    modos.add_argument("--varredura", default=None,
+                        help="diretório (pode ser compartilhado) da varredura: enfileira climas x fluxos x --sementes-varredura sementes de --duracao s, "
+                             "executa os pendentes e imprime os resultados em CSV; cenários já concluídos são pulados")
+    parser.add_argument("--trabalhador-varredura", action="store_true", help="com --varredura: só executa cenários da fila (outras máquinas no mesmo diretório)")
+    parser.add_argument("--sementes-varredura", type=int, default=3, help="sementes por ambiente na --varredura (a partir de --semente, padrão 0)")
+    parser.add_argument("--processos-varredura", type=int, default=None, help="trabalhadores da --varredura neste nó (padrão: nº de CPUs)")
+    parser.add_argument("--prazo-varredura", type=float, default=600.0, help="posse (s) de um cenário sem renovação antes de voltar para a fila (nó que caiu)")
+    parser.add_argument("--renderizar", default=None, help="headless/--reproduzir-trace: grava quadros offscreen (diretório para png, arquivo para raw)")
+    parser.add_argument("--formato-quadros", choices=FORMATOS_QUADRO, default="png", help="png (um arquivo por quadro) ou raw (vídeo rgb24 cru)")
+    parser.add_argument("--passo-quadros", type=int, default=1, help="grava 1 a cada N frames")
+    parser.add_argument("--processos-codificacao", type=int, default=None, help="processos do pool que codifica os PNG (padrão: nº de CPUs)")
+    args = parser.parse_args()
+    args.sem_janela = any(getattr(args, acao.dest) != acao.default for acao in modos._group_actions)
+    return args
 
-        if self.atravessando:
-            # move em direção ao alvo
-            dir_vec = (self.alvo - self.pos)
-            if dir_vec.length() != 0:
-                move = dir_vec.normalize() * self.velocidade
-                if move.length() > dir_vec.length():
-                    self.pos = self.alvo
-                else:
-                    self.pos += move
-                self.rect.center = (int(self.pos.x), int(self.pos.y))
-
-            # remove ao terminar travessia
-            if (self.pos - self.alvo).length() < 2:
-                self.kill()
\ No newline at end of file
+if __name__ == '__main__':
+    args = _argumentos()
+    iniciar_pygame(MODO_HEADLESS or args.sem_janela)
+    ARQUIVOS_METRICAS = Path(args.metricas)
+    ARMAZEM_METRICAS = Path(args.armazem_metricas) if args.armazem_metricas else None
+    EXPORTACAO_ESTADO = args.exportar_estado
+    if args.fluxo_medido:
+        FLUXO_MEDIDO = {"estimador": args.fluxo_medido, "janela_s": args.janela_fluxo, "tau_s": args.tau_fluxo}
+    AGENDA_TRAVESSIAS = {"verde_minimo_s": args.verde_minimo, "espera_maxima_s": args.espera_maxima_travessia, "lote": args.lote_travessia}
+    if args.plano:
+        PLANO_FASES = carregar_plano(args.plano)
+    if args.preditivo:
+        PREDITIVO = {"horizonte_s": args.horizonte_preditivo, "orcamento_ms": args.orcamento_preditivo_ms}
+    FATIA_PREDITIVO_JANELA_MS = args.fatia_preditivo_ms
+    ORCAMENTO_DECISAO_S = args.orcamento_ms / 1000.0
+    MODO_DEGRADADO = args.modo_degradado
+    relogio = RelogioDia(args.hora_inicial, args.escala_relogio) if args.dia else None
+    renderizador = None
+    if args.renderizar and (args.headless or args.reproduzir_trace):
+        renderizador = RenderizadorOffscreen(args.renderizar, args.formato_quadros, args.passo_quadros, args.processos_codificacao)
+    if args.relatorio_regras:
+        print(FuzzyControlador().compiladas.relatorio())
+    elif args.estresse:
+        print(f"Estresse: {args.duracao_nivel:.0f}s simulados por nível, orçamento {1000.0 / FPS:.1f}ms por frame")
+        _, resumo = encontrar_capacidade(duracao_nivel_s=args.duracao_nivel, semente=args.semente)
+        if resumo["saturacao_fisica"] is not None:
+            print(f"Um cruzamento satura fisicamente em {resumo['saturacao_fisica']}x a taxa base (fila ocupa a via até a borda)")
+        if resumo["nivel_sustentavel"] is not None:
+            nivel, instancias = resumo["nivel_sustentavel"]
+            print(f"População sustentável em {resumo['orcamento_ms']:.1f}ms: {resumo['populacao_sustentavel']:.0f} agentes ({instancias} cruzamento(s) a {nivel}x)")
+        if resumo["etapa_saturada"] is not None:
+            nivel, instancias = resumo["nivel_estouro"]
+            print(f"Estouro com {instancias} cruzamento(s) a {nivel}x; etapa que satura primeiro: {resumo['etapa_saturada']} ("
+                  + " ".join(f"{etapa}=+{ms:.2f}ms" for etapa, ms in resumo["crescimento_etapas_ms"].items()) + ")")
+        else:
+            print("Nenhum nível estourou o orçamento")
+    elif args.teste_memoria:
+        duracao = args.duracao if args.duracao is not None else 6 * 3600.0
+        print(f"Teste de memória: {duracao:.0f}s simulados, amostras a cada {args.intervalo_memoria:.0f}s, limite +{args.limite_memoria_mb:.0f}MB")
+        _, resumo = teste_memoria(duracao, args.intervalo_memoria, args.limite_memoria_mb, semente=args.semente, relogio=relogio,
+                                  arquivo_metricas=ARQUIVOS_METRICAS)
+        print(f"{resumo['duracao_s']:.0f}s simulados em {resumo['decorrido_s']:.1f}s | crescimento desde a base: RSS {resumo['crescimento_rss_mb']:+.2f}MB, "
+              f"tracemalloc {resumo['crescimento_rastreado_mb']:+.2f}MB | tendência do RSS {resumo['inclinacao_rss_mb_h']:+.2f}MB/h simulada")
+        for e in resumo["maiores_crescimentos"]:
+            quadro = e.traceback[0]
+            print(f"  +{e.size_diff / 1024:.1f}KB ({e.count_diff:+d} blocos) {quadro.filename}:{quadro.lineno}")
+        print("OK" if resumo["ok"] else f"FALHOU: memória cresceu mais de {resumo['limite_mb']:.0f}MB")
+        sys.exit(0 if resumo["ok"] else 1)
+    elif args.conferir_sensor:
+        duracao = args.duracao if args.duracao is not None else 200.0
+        resumo = conferir_sensor_filas(duracao, semente=args.semente)
+        print(f"Sensor de filas: {resumo['divergentes']} de {resumo['frames']} frames divergem de carros_esperando() | semente={resumo['semente']}")
+        for frame, sensor, referencia in resumo["exemplos"]:
+            print(f"  frame {frame}: sensor v={sensor['v']} h={sensor['h']} | referência v={referencia['v']} h={referencia['h']}")
+        print("OK" if resumo["ok"] else "FALHOU: sensor de filas diverge da referência")
+        sys.exit(0 if resumo["ok"] else 1)
+    elif args.monitorar_estado:
+        monitorar_estado(args.monitorar_estado)
+    elif args.consultar_armazem:
+        if ARMAZEM_METRICAS is None:
+            sys.exit("--consultar-armazem requer --armazem-metricas")
+        consulta = ArmazemMetricas(ARMAZEM_METRICAS).consultar(*args.consultar_armazem, resolucao=args.resolucao)
+        print(f"# resolução {consulta.pop('resolucao')}")
+        escritor = csv.writer(sys.stdout)
+        escritor.writerow(list(consulta))
+        escritor.writerows(zip(*consulta.values()))
+    elif args.varredura:
+        armazem = ArmazemVarredura(args.varredura)
+        if not args.trabalhador_varredura:
+            duracao = args.duracao if args.duracao is not None else 600.0
+            base = args.semente if args.semente is not None else 0
+            cenarios = grade_cenarios([base + i for i in range(args.sementes_varredura)], duracao, args.hora_inicial)
+            chaves, novos = armazem.enfileirar(cenarios)
+            print(f"Varredura: {len(cenarios)} cenários de {duracao:.0f}s | {sum(armazem.resultado(c) is not None for c in chaves)} já concluídos | {novos} enfileirados")
+        inicio = time.perf_counter()
+        feitos = trabalhar_varredura(args.varredura, args.processos_varredura, args.prazo_varredura)
+        situacao = armazem.situacao()
+        print(f"{feitos} cenário(s) executado(s) neste nó em {time.perf_counter() - inicio:.1f}s | fila={situacao['fila']} "
+              f"executando={situacao['executando']} resultados={situacao['resultados']} erros={situacao['erros']}")
+        if not args.trabalhador_varredura:
+            colunas = ["gerados", "saíram", "fila_media", "atraso_medio_carros_s", "atraso_p95_carros_s", "espera_media_pedestres_s", "cortes_de_verde"]
+            escritor = csv.writer(sys.stdout)
+            escritor.writerow(["clima", "fluxo_de_carros", "fluxo_de_pedestres", "hora", "semente"] + colunas + ["chave"])
+            faltando = 0
+            for c, chave in zip(cenarios, chaves):
+                r = armazem.resultado(chave)
+                if r is None:
+                    faltando += 1
+                    continue
+                ambiente = c["ambiente"]
+                escritor.writerow([ambiente["clima"], ambiente["fluxo_de_carros"], ambiente["fluxo_de_pedestres"], ambiente["hora"], c["semente"]]
+                                  + [f"{r[k]:.3f}" if isinstance(r[k], float) else r[k] for k in colunas] + [chave[:16]])
+            if faltando:
+                print(f"# {faltando} cenário(s) sem resultado (executando em outro nó ou com erro em {armazem.erros})")
+    elif args.reproduzir_trace:
+        try:
+            ok = reproduzir_trace(args.reproduzir_trace, renderizador)
+        finally:
+            if renderizador is not None:
+                renderizador.fechar()
+        sys.exit(0 if ok else 1)
+    elif args.headless:
+        duracao = args.duracao
+        if duracao is None:
+            duracao = SEGUNDOS_DIA / args.escala_relogio if args.dia else 600.0
+        estado = carregar_instantaneo(args.carregar_instantaneo) if args.carregar_instantaneo else None
+        if estado is not None and args.ramos > 0:
+            base = args.semente if args.semente is not None else estado["semente"]
+            inicio = time.perf_counter()
+            for r in executar_ramos(estado, [base + i for i in range(args.ramos)], duracao):
+                print(f"ramo semente={r['semente']}: gerados={r['gerados']} saíram={r['saíram']} fila média={r['fila_media']:.2f} assinatura={r['assinatura']:08x}")
+            print(f"{args.ramos} ramos de {duracao:.0f}s em {time.perf_counter() - inicio:.1f}s")
+        else:
+            monitor = MonitorEstacionario(precisao=args.precisao) if args.precisao is not None else None
+            try:
+                sim = executar_headless(duracao, relogio=relogio, arquivo_metricas=ARQUIVOS_METRICAS, semente=args.semente,
+                                        caminho_trace=args.gravar_trace, estado_inicial=estado, monitor=monitor, renderizador=renderizador)
+            finally:
+                if renderizador is not None:
+                    renderizador.fechar()
+            if args.salvar_instantaneo:
+                salvar_instantaneo(sim.instantaneo(), args.salvar_instantaneo)
+    else:
+        main(relogio, args.semente)
@@ -0,0 +1,275 @@
+"""
+Serviço local do controlador fuzzy (asyncio)
+--------------------------------------------
+Um único FuzzyControlador "quente" atende vários processos de cruzamento por socket local
+(TCP em 127.0.0.1 ou Unix socket), com protocolo de linhas JSON:
+
+   pedido:   {"id": 1, "metodo": "tempo", "params": {"fluxo_de_carros": "Alto", "fluxo_de_pedestres": "Médio", "hora": "07:30:00", "clima": "Chuvoso"}}
+   resposta: {"id": 1, "resultado": 25.8}
+
+Métodos:
+ - "tempo":      params do ambiente -> calcular_tempo_a_partir_do_ambiente (float)
+ - "regras":     params do ambiente -> avaliar_regras (lista [descricao, grau])
+ - "prioridade": {"num_carros_vermelha", "tempo_verde", "num_pedestres_esperando"} -> prioridade_de_computacao
+                 ([prioridade, ativacoes])
+
+Pedidos que chegam juntos (de qualquer conexão) são agrupados em micro-lotes e avaliados numa única
+passada vetorizada (FuzzyControlador.graus_regras_vetorizado / calcular_tempos_vetorizado).
+
+Rodar:
+   python servico_controlador.py servidor --porta 8765
+   python servico_controlador.py servidor --unix /tmp/controlador.sock
+Teste de carga (cliente):
+   python servico_controlador.py carga --porta 8765 --conexoes 16 --pedidos 2000
+"""
+
+import os
+# o serviço não abre janela: importa o simulador em modo headless
+os.environ.setdefault("SIMULADOR_HEADLESS", "1")
+# o SDL não instala handlers de SIGINT/SIGTERM (viravam um evento QUIT que ninguém lê): SIGTERM encerra o processo
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+from interface_grafica import FuzzyControlador, CLIMAS, NIVEIS_DE_FLUXO
+
+METODOS = ("tempo", "regras", "prioridade")
+
+
+class AgrupadorPedidos:
+    """
+    Junta pedidos concorrentes num micro-lote: o primeiro pedido abre uma janela de `janela_s`
+    (ou até `tamanho_maximo` pedidos) e o lote inteiro é avaliado de uma vez.
+    """
+    def __init__(self, controlador, janela_s=0.002, tamanho_maximo=512):
+        self.controlador = controlador
+        self.janela_s = janela_s
+        self.tamanho_maximo = tamanho_maximo
+        self._pendentes = []
+        self._cheio = asyncio.Event()
+        self._tarefa = None
+        # estatísticas
+        self.lotes = 0
+        self.pedidos = 0
+        self.maior_lote = 0
+
+    def submeter(self, metodo, params):
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendentes.append((metodo, params, futuro))
+        if len(self._pendentes) >= self.tamanho_maximo:
+            self._cheio.set()
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self._esvaziar())
+        return futuro
+
+    async def _esvaziar(self):
+        try:
+            await asyncio.wait_for(self._cheio.wait(), self.janela_s)
+        except asyncio.TimeoutError:
+            pass
+        while self._pendentes:
+            lote, self._pendentes = self._pendentes[:self.tamanho_maximo], self._pendentes[self.tamanho_maximo:]
+            self._cheio.clear()
+            self._avaliar(lote)
+
+    def _avaliar(self, lote):
+        self.lotes += 1
+        self.pedidos += len(lote)
+        self.maior_lote = max(self.maior_lote, len(lote))
+
+        ambiente = [(p, f) for m, p, f in lote if m in ("tempo", "regras")]
+        if ambiente:
+            c = self.controlador
+            try:
+                cf = np.array([c.mapear_rotulo_de_fluxo_para_valor(p["fluxo_de_carros"]) for p, _ in ambiente])
+                pf = np.array([c.mapear_rotulo_de_fluxo_para_valor(p["fluxo_de_pedestres"]) for p, _ in ambiente])
+                hr = np.array([c.mapear_rotulo_hora_para_valor(p["hora"]) for p, _ in ambiente])
+                cl = np.array([c.mapear_rotulo_climatico_para_valor(p["clima"]) for p, _ in ambiente])
+                graus = c.graus_regras_vetorizado(cf, pf, hr, cl)
+                tempos = c.calcular_tempos_vetorizado(cf, pf, hr, cl, graus=graus)
+            except (KeyError, TypeError, AttributeError):
+                # lote com pedido inválido: avalia um a um para devolver o erro só a quem o causou
+                for m, p, futuro in lote:
+                    if m in ("tempo", "regras"):
+                        self._avaliar_um(m, p, futuro)
+            else:
+                i = 0
+                for m, p, futuro in lote:
+                    if m not in ("tempo", "regras"):
+                        continue
+                    if m == "tempo":
+                        futuro.set_result(float(tempos[i]))
+                    else:
+                        futuro.set_result([[d, float(g)] for d, g in zip(c.descricoes_regra, graus[i])])
+                    i += 1
+
+        for m, p, futuro in lote:
+            if m == "prioridade":
+                self._avaliar_um(m, p, futuro)
+
+    def _avaliar_um(self, metodo, params, futuro):
+        c = self.controlador
+        try:
+            if metodo == "prioridade":
+                prioridade, ativacoes = c.prioridade_de_computacao(params["num_carros_vermelha"], params["tempo_verde"], params.get("num_pedestres_esperando", 0))
+                futuro.set_result([prioridade, [list(a) for a in ativacoes]])
+            elif metodo == "tempo":
+                futuro.set_result(float(c.calcular_tempos_vetorizado(
+                    c.mapear_rotulo_de_fluxo_para_valor(params["fluxo_de_carros"]), c.mapear_rotulo_de_fluxo_para_valor(params["fluxo_de_pedestres"]),
+                    c.mapear_rotulo_hora_para_valor(params["hora"]), c.mapear_rotulo_climatico_para_valor(params["clima"]))[0]))
+            else:
+                futuro.set_result([list(a) for a in c.avaliar_regras(params["fluxo_de_carros"], params["fluxo_de_pedestres"], params["hora"], params["clima"])])
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            futuro.set_exception(ValueError(f"parâmetros inválidos para '{metodo}': {e}"))
+
+
+class ServicoControlador:
+    """Servidor asyncio de linhas JSON sobre TCP (localhost) ou Unix socket."""
+    def __init__(self, janela_s=0.002, tamanho_maximo=512):
+        # constrói o ctrl.ControlSystem uma única vez para todos os clientes
+        self.controlador = FuzzyControlador()
+        self.janela_s = janela_s
+        self.tamanho_maximo = tamanho_maximo
+        self.agrupador = None
+
+    async def _responder(self, escritor, trava, pedido_id, metodo, params):
+        try:
+            resposta = {"id": pedido_id, "resultado": await self.agrupador.submeter(metodo, params)}
+        except ValueError as e:
+            resposta = {"id": pedido_id, "erro": str(e)}
+        async with trava:
+            escritor.write((json.dumps(resposta, ensure_ascii=False) + "\n").encode("utf-8"))
+            await escritor.drain()
+
+    async def atender(self, leitor, escritor):
+        trava = asyncio.Lock()
+        tarefas = set()
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha:
+                    break
+                pedido = None
+                try:
+                    pedido = json.loads(linha)
+                    metodo = pedido["metodo"]
+                    if metodo not in METODOS:
+                        raise ValueError(f"método desconhecido: {metodo}")
+                except (ValueError, KeyError, TypeError) as e:
+                    pedido_id = pedido.get("id") if isinstance(pedido, dict) else None
+                    async with trava:
+                        escritor.write((json.dumps({"id": pedido_id, "erro": f"pedido inválido: {e}"}, ensure_ascii=False) + "\n").encode("utf-8"))
+                    continue
+                # respostas podem sair fora de ordem: o cliente casa pelo "id"
+                tarefa = asyncio.create_task(self._responder(escritor, trava, pedido.get("id"), metodo, pedido.get("params", {})))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+            if tarefas:
+                await asyncio.gather(*tarefas, return_exceptions=True)
+        finally:
+            escritor.close()
+
+    async def servir(self, host="127.0.0.1", porta=8765, unix=None):
+        self.agrupador = AgrupadorPedidos(self.controlador, self.janela_s, self.tamanho_maximo)
+        if unix:
+            servidor = await asyncio.start_unix_server(self.atender, path=unix)
+            print(f"Serviço do controlador em unix:{unix}")
+        else:
+            servidor = await asyncio.start_server(self.atender, host, porta)
+            print(f"Serviço do controlador em {host}:{porta}")
+        async with servidor:
+            try:
+                await servidor.serve_forever()
+            finally:
+                a = self.agrupador
+                print(f"pedidos={a.pedidos} lotes={a.lotes} maior_lote={a.maior_lote}")
+
+
+# --- cliente de teste de carga ---
+def _pedido_aleatorio(rng, i):
+    metodo = rng.choices(METODOS, weights=[6, 2, 2], k=1)[0]
+    if metodo == "prioridade":
+        params = {"num_carros_vermelha": rng.randint(0, 12), "tempo_verde": rng.uniform(0, 30), "num_pedestres_esperando": rng.randint(0, 6)}
+    else:
+        params = {"fluxo_de_carros": rng.choice(NIVEIS_DE_FLUXO), "fluxo_de_pedestres": rng.choice(NIVEIS_DE_FLUXO),
+                  "hora": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00", "clima": rng.choice(CLIMAS)}
+    return {"id": i, "metodo": metodo, "params": params}
+
+
+async def _conexao_carga(host, porta, unix, n_pedidos, em_voo, semente, latencias):
+    if unix:
+        leitor, escritor = await asyncio.open_unix_connection(unix)
+    else:
+        leitor, escritor = await asyncio.open_connection(host, porta)
+    rng = random.Random(semente)
+    enviados_em = {}
+    erros = 0
+
+    async def ler():
+        nonlocal erros
+        for _ in range(n_pedidos):
+            resposta = json.loads(await leitor.readline())
+            if "erro" in resposta:
+                erros += 1
+            latencias.append(time.perf_counter() - enviados_em.pop(resposta["id"]))
+            janela.release()
+
+    janela = asyncio.Semaphore(em_voo)
+    leitura = asyncio.create_task(ler())
+    for i in range(n_pedidos):
+        await janela.acquire()
+        enviados_em[i] = time.perf_counter()
+        escritor.write((json.dumps(_pedido_aleatorio(rng, i), ensure_ascii=False) + "\n").encode("utf-8"))
+        await escritor.drain()
+    await leitura
+    escritor.close()
+    return erros
+
+
+async def executar_carga(host="127.0.0.1", porta=8765, unix=None, conexoes=8, pedidos=1000, em_voo=4, semente=0):
+    """Abre `conexoes` clientes simultâneos, cada um com até `em_voo` pedidos pendentes, e mede vazão/latência."""
+    latencias = []
+    inicio = time.perf_counter()
+    erros = await asyncio.gather(*(_conexao_carga(host, porta, unix, pedidos, em_voo, semente + k, latencias) for k in range(conexoes)))
+    decorrido = time.perf_counter() - inicio
+    ms = np.array(latencias) * 1000.0
+    total = len(latencias)
+    print(f"{total} pedidos em {decorrido:.2f}s -> {total / decorrido:.0f} pedidos/s | erros={sum(erros)}")
+    print(f"latência: p50={np.percentile(ms, 50):.2f}ms p95={np.percentile(ms, 95):.2f}ms p99={np.percentile(ms, 99):.2f}ms máx={ms.max():.2f}ms")
+    return total / decorrido
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Serviço local do controlador fuzzy")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    for nome in ("servidor", "carga"):
+        p = sub.add_parser(nome)
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--porta", type=int, default=8765)
+        p.add_argument("--unix", default=None, help="caminho de Unix socket (no lugar de TCP)")
+    servidor = sub.choices["servidor"]
+    servidor.add_argument("--janela-ms", type=float, default=2.0, help="tempo máximo de espera para formar um lote")
+    servidor.add_argument("--lote-maximo", type=int, default=512)
+    carga = sub.choices["carga"]
+    carga.add_argument("--conexoes", type=int, default=8)
+    carga.add_argument("--pedidos", type=int, default=1000, help="pedidos por conexão")
+    carga.add_argument("--em-voo", type=int, default=4, help="pedidos pendentes por conexão")
+    carga.add_argument("--semente", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _argumentos()
+    try:
+        if args.comando == "servidor":
+            asyncio.run(ServicoControlador(args.janela_ms / 1000.0, args.lote_maximo).servir(args.host, args.porta, args.unix))
+        else:
+            asyncio.run(executar_carga(args.host, args.porta, args.unix, args.conexoes, args.pedidos, args.em_voo, args.semente))
+    except KeyboardInterrupt:
+        pass